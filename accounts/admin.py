@@ -1,16 +1,26 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from university_sis.admin_tools import EstimatedCountPaginator
 from .models import User
+from .pagination import search_users
 
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
     list_display = ['username', 'email', 'name', 'surname', 'role', 'is_active', 'created_at']
     list_filter = ['role', 'is_active', 'created_at']
-    search_fields = ['username', 'email', 'name', 'surname']
+    # Searched through search_users (see get_search_results), which the Lower() indexes on these fields answer
+    search_fields = ['^username', '^email', '^name', '^surname']
+    autocomplete_fields = ['created_by']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = BaseUserAdmin.fieldsets + (
         ('Additional Info', {'fields': ('name', 'surname', 'role', 'created_by')}),
     )
     add_fieldsets = BaseUserAdmin.add_fieldsets + (
         ('Additional Info', {'fields': ('name', 'surname', 'role')}),
     )
+    
+    def get_search_results(self, request, queryset, search_term):
+        # Django's own search would use __istartswith, which no index can answer on SQLite
+        return search_users(queryset, search_term), False
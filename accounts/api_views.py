@@ -1,7 +1,7 @@
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import action
-from rest_framework.response import Response
 from .models import User
+from .pagination import USER_ORDERING
 from .serializers import UserSerializer, UserCreateSerializer
 from .decorators import department_head_required
 
@@ -14,6 +14,19 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = USER_ORDERING
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        role = self.request.query_params.get('role')
+        if role:
+            # With a role, the keyset ordering follows the accounts_user_role_name_idx index
+            queryset = queryset.filter(role=role)
+        return queryset
+    
+    def _role_list(self, role):
+        page = self.paginate_queryset(self.filter_queryset(User.objects.filter(role=role)))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
     
     def get_serializer_class(self):
         if self.action == 'create':
@@ -34,16 +47,12 @@ class UserViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def students(self, request):
-        """Get all students."""
-        students = User.objects.filter(role='student')
-        serializer = self.get_serializer(students, many=True)
-        return Response(serializer.data)
+        """Get all students, a page at a time."""
+        return self._role_list('student')
     
     @action(detail=False, methods=['get'])
     def teachers(self, request):
-        """Get all teachers."""
-        teachers = User.objects.filter(role='teacher')
-        serializer = self.get_serializer(teachers, many=True)
-        return Response(serializer.data)
+        """Get all teachers, a page at a time."""
+        return self._role_list('teacher')
 
 
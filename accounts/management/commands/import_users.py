@@ -0,0 +1,55 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.importer import read_rows, import_users, IMPORTABLE_ROLES
+from accounts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Bulk import students or teachers from a CSV or JSON Lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row, or .jsonl file with one user per line')
+        parser.add_argument('--role', choices=IMPORTABLE_ROLES, default='student',
+                            help='Role for rows without a "role" value (default: student)')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='File format (default: guessed from the file extension)')
+        parser.add_argument('--workers', type=int, help='Processes used for password hashing (default: all cores)')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users inserted per query (default: 500)')
+        parser.add_argument('--created-by', help='Email of the Department Head recorded as creator')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'File not found: {path}')
+
+        file_format = options['format'] or ('jsonl' if path.suffix.lower() in ('.jsonl', '.ndjson') else 'csv')
+
+        created_by = None
+        if options['created_by']:
+            try:
+                created_by = User.objects.get(email=options['created_by'], role='department_head')
+            except User.DoesNotExist:
+                raise CommandError(f'No Department Head with email {options["created_by"]}')
+
+        rows = read_rows(path.read_bytes(), file_format)
+        self.stdout.write(f'Read {len(rows)} rows from {path}')
+
+        def progress(done, total):
+            self.stdout.write(f'Inserted {done}/{total}')
+
+        report = import_users(
+            rows,
+            role=options['role'],
+            created_by=created_by,
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            progress=progress
+        )
+
+        for line_number, message in report['errors']:
+            self.stderr.write(f'Line {line_number}: {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {report["created"]} users, {len(report["errors"])} rows rejected.'
+        ))
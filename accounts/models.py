@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
+from django.db.models.functions import Lower
 
 
 class UserManager(BaseUserManager):
@@ -62,6 +63,16 @@ class User(AbstractUser):
         verbose_name = 'User'
         verbose_name_plural = 'Users'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the user management pages (see accounts.pagination)
+            models.Index(fields=['role', 'surname', 'name', 'id'], name='accounts_user_role_name_idx'),
+            # Case-insensitive prefix search (see accounts.pagination.prefix_search); the
+            # unique constraints on email and username are on the values as typed
+            models.Index(Lower('name'), name='accounts_user_lname_idx'),
+            models.Index(Lower('surname'), name='accounts_user_lsurname_idx'),
+            models.Index(Lower('email'), name='accounts_user_lemail_idx'),
+            models.Index(Lower('username'), name='accounts_user_lusername_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} {self.surname} ({self.get_role_display()})"
@@ -0,0 +1,217 @@
+"""
+Keyset (seek) pagination and prefix search for the management pages.
+
+A keyset page is fetched with "WHERE (ordering columns) > (values of the last
+row) ORDER BY ... LIMIT n", so it costs the same on the first page and on the
+thousandth one, unlike OFFSET. The position is passed around as an opaque
+cursor string holding the ordering values of the boundary row.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import CharField, Q, Value
+from django.db.models.functions import Concat, Lower
+from django.db.models.lookups import GreaterThanOrEqual, LessThan, StartsWith
+from django.utils.http import urlencode
+
+# Fields matched by user search; each search term must be a prefix of one of them
+USER_SEARCH_FIELDS = ['name', 'surname', 'email', 'username']
+
+# Keyset ordering of user lists; matches the accounts_user_role_name_idx index
+USER_ORDERING = ['surname', 'name', 'id']
+
+DEFAULT_PAGE_SIZE = 50
+
+# Largest value of a 64-bit signed integer, the widest integer column of the supported databases
+MAX_INTEGER = 2 ** 63 - 1
+
+
+# Sorts after every other character, so "term + LAST_CHAR" bounds the strings starting with term
+LAST_CHAR = '\U0010ffff'
+
+
+def prefix_condition(field, term):
+    """
+    Q for rows where term is a case-insensitive prefix of field, answered by
+    an index on Lower(field).
+
+    Lower(field) is compared with the range [lower(term), lower(term) + LAST_CHAR),
+    which the database can seek in the index, and then with LIKE 'term%' to
+    recheck the rows in that range. Both sides are lowered by the database,
+    so the match is the same as LOWER(field) LIKE LOWER(term) || '%'.
+    """
+    lowered = Lower(field)
+    start = Lower(Value(term))
+    end = Concat(start, Value(LAST_CHAR), output_field=CharField())
+    return Q(GreaterThanOrEqual(lowered, start), LessThan(lowered, end), StartsWith(lowered, start))
+
+
+def prefix_search(queryset, query, fields):
+    """
+    Filter queryset to rows where every whitespace-separated term of query is a
+    case-insensitive prefix of at least one of fields. Each field should have an
+    index on Lower(field) (see prefix_condition).
+    """
+    for term in (query or '').split():
+        condition = Q()
+        for field in fields:
+            condition |= prefix_condition(field, term)
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def search_users(queryset, query):
+    """Prefix search on name, surname, email and username."""
+    return prefix_search(queryset, query, USER_SEARCH_FIELDS)
+
+
+def _encode_cursor(values):
+    data = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def _ordering_field(queryset, name):
+    """The model field, or the output field of an annotation, that an ordering name refers to."""
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    model = queryset.model
+    parts = name.split('__')
+    for part in parts[:-1]:
+        model = model._meta.get_field(part).related_model
+    field = model._meta.get_field(parts[-1])
+    return field.target_field if field.is_relation else field
+
+
+def _decode_cursor(cursor, fields):
+    """
+    Return the ordering values in a cursor, converted with the given fields'
+    to_python(), or None if the cursor is malformed: not our encoding, the
+    wrong number of values, or values that are not valid for their field.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+    if not isinstance(values, list) or len(values) != len(fields):
+        return None
+    # _encode_cursor only writes scalars
+    if any(isinstance(value, (dict, list)) for value in values):
+        return None
+    try:
+        values = [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValidationError, ValueError, TypeError, OverflowError):
+        return None
+    # Larger numbers do not fit any integer column and fail in the database driver
+    if any(isinstance(value, int) and not -MAX_INTEGER - 1 <= value <= MAX_INTEGER for value in values):
+        return None
+    return values
+
+
+class InvalidCursor(ValueError):
+    """A cursor that keyset_paginate() did not produce for this ordering."""
+
+
+def _seek_condition(ordering, values, forward):
+    """(a, b, c) > (x, y, z) spelled out as a OR-chain the ORM can express."""
+    condition = Q()
+    for index, field in enumerate(ordering):
+        name = field.lstrip('-')
+        # A descending field seeks the other way
+        lookup = 'gt' if forward != field.startswith('-') else 'lt'
+        step = Q(**{f'{name}__{lookup}': values[index]})
+        for previous_field, previous_value in zip(ordering[:index], values[:index]):
+            step &= Q(**{previous_field.lstrip('-'): previous_value})
+        condition |= step
+    return condition
+
+
+def _reverse(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+class KeysetPage:
+    """
+    One page of a keyset-paginated queryset.
+
+    object_list: the rows of the page, in ordering order
+    next_cursor / previous_cursor: cursors for the neighbouring pages, or None
+    """
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_other_pages(self):
+        return bool(self.next_cursor or self.previous_cursor)
+
+
+def keyset_paginate(queryset, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE, strict=False):
+    """
+    Return the KeysetPage of queryset that the cursor points at.
+
+    ordering: field names ending with a unique field (usually 'id'), with
+              '-' for descending; related fields may be used with '__'.
+    cursor: 'a<token>' for the page after a row, 'b<token>' for the page
+            before it, or None for the first page. A malformed cursor also
+            gives the first page, or raises InvalidCursor if strict is set.
+    """
+    direction, values = 'a', None
+    if cursor:
+        if cursor[0] in 'ab':
+            fields = [_ordering_field(queryset, field.lstrip('-')) for field in ordering]
+            values = _decode_cursor(cursor[1:], fields)
+        if values is not None:
+            direction = cursor[0]
+        elif strict:
+            raise InvalidCursor(cursor)
+
+    forward = direction == 'a'
+    if values is not None:
+        queryset = queryset.filter(_seek_condition(ordering, values, forward))
+    queryset = queryset.order_by(*(ordering if forward else [_reverse(field) for field in ordering]))
+
+    # One extra row tells whether there is another page in this direction
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not forward:
+        rows.reverse()
+
+    def token(row):
+        return _encode_cursor([_resolve(row, field.lstrip('-')) for field in ordering])
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if (forward and has_more) or (not forward and values is not None):
+            next_cursor = 'a' + token(rows[-1])
+        if (forward and values is not None) or (not forward and has_more):
+            previous_cursor = 'b' + token(rows[0])
+    return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+def _resolve(obj, field):
+    for part in field.split('__'):
+        obj = getattr(obj, part)
+    return obj
+
+
+def page_url(request, **params):
+    """Current query string with params replaced; None values remove the parameter."""
+    query = request.GET.copy()
+    for key, value in params.items():
+        query.pop(key, None)
+        if value is not None:
+            query[key] = value
+    return '?' + urlencode(sorted(query.items())) if query else '?'
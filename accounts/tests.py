@@ -1,3 +1,167 @@
+from django.contrib.auth.hashers import check_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase
+from unittest import skipUnless
 
-# Create your tests here.
+from university_sis.admin_tools import _estimated_table_rows
+
+from .importer import read_rows, import_users, hash_passwords
+from .models import User
+from .pagination import search_users, keyset_paginate, _encode_cursor, USER_ORDERING
+
+HEADER = 'username,email,password,name,surname\n'
+
+
+class ImportUsersTests(TestCase):
+
+    def setUp(self):
+        self.head = User.objects.create_user(
+            'head', 'Head@Example.com', 'pw', name='Hale', surname='Head', role='department_head'
+        )
+
+    def run_import(self, lines, **kwargs):
+        return import_users(read_rows((HEADER + lines).encode(), 'csv'), workers=1, **kwargs)
+
+    def test_creates_users_and_reports_rejected_lines(self):
+        report = self.run_import(
+            'ann,ann@example.com,secret1,Ann,Archer\n'
+            'bob,bob@example.com,secret2,Bob,Baker\n'
+            'bob,bob2@example.com,secret3,Bob,Other\n'
+            'cat,not-an-email,secret4,Cat,Carter\n'
+            'dan,,secret5,Dan,Dale\n',
+            chunk_size=1
+        )
+        self.assertEqual(report['created'], 2)
+        self.assertEqual([line for line, _ in report['errors']], [4, 5, 6])
+        ann = User.objects.get(username='ann')
+        self.assertEqual(ann.role, 'student')
+        self.assertTrue(ann.check_password('secret1'))
+
+    def test_existing_email_in_another_case_is_taken(self):
+        report = self.run_import('newhead,head@example.COM,secret,New,Head\n')
+        self.assertEqual(report, {
+            'created': 0,
+            'errors': [(2, 'A user with email head@example.com already exists.')],
+        })
+
+    def test_repeated_email_in_the_file_is_rejected(self):
+        report = self.run_import('ann,ann@example.com,secret,Ann,Archer\nann2,ANN@example.com,secret,Ann,Again\n')
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(report['errors'], [(3, 'Duplicate email ANN@example.com in file.')])
+
+    def test_hashes_in_spawned_workers(self):
+        hashes = hash_passwords(['first', 'second', 'third'], workers=2)
+        self.assertEqual(len(hashes), 3)
+        self.assertTrue(check_password('second', hashes[1]))
+
+    def test_import_page(self):
+        self.client.force_login(self.head)
+        upload = SimpleUploadedFile(
+            'teachers.jsonl',
+            b'{"username": "tom", "email": "tom@example.com", "password": "p", "name": "Tom", "surname": "Tutor"}\n'
+            b'not json\n'
+        )
+        response = self.client.post('/department-head/teachers/', {'action': 'import', 'users_file': upload})
+        self.assertContains(response, 'Invalid JSON')
+        self.assertEqual(User.objects.get(username='tom').role, 'teacher')
+
+
+class SearchUsersTests(TestCase):
+
+    def setUp(self):
+        for username, email, name, surname in [
+            ('asmith', 'Anna.Smith@example.com', 'Anna', 'Smith'),
+            ('bsmithers', 'ben@example.com', 'Ben', 'Smithers'),
+            ('cjones', 'carl@example.com', 'Carl', 'Jones'),
+            ('under_score', 'd%d@example.com', 'Dora', 'Dunn'),
+        ]:
+            User.objects.create(username=username, email=email, name=name, surname=surname, role='student')
+
+    def found(self, query):
+        return set(search_users(User.objects.all(), query).values_list('username', flat=True))
+
+    def test_every_term_is_a_prefix_of_some_field_ignoring_case(self):
+        self.assertEqual(self.found('SMITH'), {'asmith', 'bsmithers'})
+        self.assertEqual(self.found('smith an'), {'asmith'})
+        self.assertEqual(self.found('anna.s'), {'asmith'})
+        self.assertEqual(self.found('cj'), {'cjones'})
+        self.assertEqual(self.found('mith'), set())
+        self.assertEqual(self.found(''), {'asmith', 'bsmithers', 'cjones', 'under_score'})
+
+    def test_wildcards_are_literal(self):
+        self.assertEqual(self.found('under_'), {'under_score'})
+        self.assertEqual(self.found('under%'), set())
+        self.assertEqual(self.found('d%d'), {'under_score'})
+        self.assertEqual(self.found('_'), set())
+
+    @skipUnless(connection.vendor == 'sqlite', 'query plan output is SQLite specific')
+    def test_uses_the_lowered_indexes(self):
+        plan = search_users(User.objects.all(), 'smi').explain()
+        for index in ('accounts_user_lname_idx', 'accounts_user_lsurname_idx',
+                      'accounts_user_lemail_idx', 'accounts_user_lusername_idx'):
+            self.assertIn(index, plan)
+
+
+class AdminTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'pw', name='Ada', surname='Admin', role='department_head'
+        )
+        User.objects.create(username='asmith', email='anna@example.com', name='Anna', surname='Smith', role='student')
+        self.client.force_login(self.admin)
+
+    def test_user_search_matches_prefixes_ignoring_case(self):
+        response = self.client.get('/admin/accounts/user/', {'q': 'SMI'})
+        self.assertEqual([user.username for user in response.context['cl'].result_list], ['asmith'])
+
+    def test_table_estimate_comes_from_statistics(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('statistics setup is SQLite specific')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(_estimated_table_rows(User.objects.all()), 2)
+
+
+class UserApiTests(TestCase):
+
+    def setUp(self):
+        self.head = User.objects.create_user(
+            'head', 'head@example.com', 'pw', name='Hale', surname='Head', role='department_head'
+        )
+        for i in range(3):
+            User.objects.create(username=f'student{i}', email=f'student{i}@example.com',
+                                name='Sam', surname=f'Student{i}', role='student')
+        User.objects.create(username='teacher', email='teacher@example.com', name='Tina', surname='Teacher', role='teacher')
+        self.client.force_login(self.head)
+
+    def usernames(self, url, **params):
+        names = []
+        while url:
+            body = self.client.get(url, params).json()
+            names += [user['username'] for user in body['results']]
+            url, params = body['next'], {}
+        return names
+
+    def test_role_filter_and_role_lists_are_paginated(self):
+        students = ['student0', 'student1', 'student2']
+        self.assertEqual(self.usernames('/api/users/', role='student', page_size=2), students)
+        self.assertEqual(self.usernames('/api/users/students/', page_size=2), students)
+        self.assertEqual(self.usernames('/api/users/teachers/'), ['teacher'])
+
+    def test_malformed_cursors(self):
+        for values in (['x', 'y', 'z'], [{}, [], 1], ['a', 'b', 10 ** 30]):
+            cursor = 'a' + _encode_cursor(values)
+            self.assertEqual(self.client.get('/api/users/', {'cursor': cursor}).status_code, 404, values)
+            # The management pages and the admin show the first page instead
+            page = keyset_paginate(User.objects.all(), USER_ORDERING, cursor)
+            self.assertEqual(len(page), 5)
+            response = self.client.get('/users/autocomplete/', {'cursor': cursor})
+            self.assertEqual(len(response.json()['results']), 5)
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'pw', name='Ada', surname='Admin', role='department_head'
+        )
+        self.client.force_login(admin)
+        response = self.client.get('/admin/assessments/assessmentscore/', {'p': 'a' + _encode_cursor(['x'])})
+        self.assertEqual(response.status_code, 200)
@@ -2,8 +2,10 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 from .models import User
-from .decorators import role_required
+from .decorators import role_required, department_head_required
+from .pagination import search_users, keyset_paginate, USER_ORDERING
 
 
 def login_view(request):
@@ -74,3 +76,32 @@ def profile_view(request):
     return render(request, 'accounts/profile.html', {
         'user': request.user
     })
+
+
+@department_head_required
+def user_autocomplete(request):
+    """
+    JSON user search for pickers.
+    
+    GET parameters: q (prefix of name, surname, email or username),
+    role (student or teacher, optional), exclude_course (skip students enrolled
+    in that course, optional), cursor (from a previous response).
+    Returns: {"results": [{"id", "name", "email", "username"}, ...], "next": cursor or null}
+    """
+    users = User.objects.filter(is_active=True)
+    role = request.GET.get('role')
+    if role in ('student', 'teacher', 'department_head'):
+        users = users.filter(role=role)
+    exclude_course = request.GET.get('exclude_course', '')
+    if exclude_course.isdigit():
+        users = users.exclude(enrollments__course_id=exclude_course)
+    users = search_users(users, request.GET.get('q', ''))
+    
+    page = keyset_paginate(users, USER_ORDERING, request.GET.get('cursor'), page_size=20)
+    return JsonResponse({
+        'results': [
+            {'id': user.id, 'name': user.get_full_name(), 'email': user.email, 'username': user.username}
+            for user in page
+        ],
+        'next': page.next_cursor,
+    })
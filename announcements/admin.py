@@ -6,4 +6,6 @@ from .models import Announcement
 class AnnouncementAdmin(admin.ModelAdmin):
     list_display = ['title', 'created_by', 'is_active', 'created_at']
     list_filter = ['is_active', 'created_at']
+    list_select_related = ['created_by']
+    autocomplete_fields = ['created_by']
     search_fields = ['title', 'content']
@@ -1,13 +1,21 @@
 from rest_framework import viewsets, permissions
+from courses.conditional import ConditionalGetMixin
+from university_sis.api import QueryPlanMixin
 from .models import Announcement
 from .serializers import AnnouncementSerializer
 
 
-class AnnouncementViewSet(viewsets.ModelViewSet):
+class AnnouncementViewSet(ConditionalGetMixin, QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet for Announcement management."""
     queryset = Announcement.objects.filter(is_active=True)
     serializer_class = AnnouncementSerializer
     permission_classes = [permissions.IsAuthenticated]
+    select_related_plan = {'created_by_name': ['created_by']}
+    # Users have no timestamp, so the name itself is part of the ETag
+    conditional_related_plan = {'created_by_name': ['created_by__name', 'created_by__surname']}
+    # Newest first
+    keyset_ordering = ['-id']
+    updated_since_field = 'updated_at'
     
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -1,8 +1,9 @@
 from rest_framework import serializers
+from university_sis.api import DynamicFieldsMixin
 from .models import Announcement
 
 
-class AnnouncementSerializer(serializers.ModelSerializer):
+class AnnouncementSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for Announcement."""
     created_by_name = serializers.CharField(source='created_by.get_full_name', read_only=True)
     
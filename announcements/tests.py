@@ -1,3 +1,38 @@
 from django.test import TestCase
 
-# Create your tests here.
+from accounts.models import User
+from .models import Announcement
+
+
+class AnnouncementApiTests(TestCase):
+    url = '/api/announcements/'
+
+    def setUp(self):
+        self.head = User.objects.create_user(
+            'head', 'head@example.com', 'pw', name='Hale', surname='Head', role='department_head'
+        )
+        self.announcement = Announcement.objects.create(title='Exams', content='Exam week', created_by=self.head)
+        # The ETag also covers the requesting user's name, so another user reads the list
+        self.student = User.objects.create_user(
+            'student', 'student@example.com', 'pw', name='Sam', surname='Student', role='student'
+        )
+        self.client.force_login(self.student)
+
+    def revalidate(self, etag, **params):
+        return self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_list_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['results'][0]['created_by_name'], 'Hale Head')
+        self.assertEqual(self.revalidate(response['ETag']).status_code, 304)
+
+    def test_renaming_the_author_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        fields_etag = self.client.get(self.url, {'fields': 'title'})['ETag']
+        self.head.surname = 'Hall'
+        self.head.save()
+        response = self.revalidate(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['created_by_name'], 'Hale Hall')
+        # Not in the response, so not in the ETag
+        self.assertEqual(self.revalidate(fields_etag, fields='title').status_code, 304)
@@ -1,23 +1,32 @@
 from django.contrib import admin
+from university_sis.admin_tools import EstimatedCountPaginator, KeysetPaginationMixin
 from .models import Assessment, AssessmentScore, AssessmentLOContribution
 
 
 @admin.register(Assessment)
 class AssessmentAdmin(admin.ModelAdmin):
     list_display = ['name', 'course', 'assessment_type', 'weight_percentage', 'created_at']
-    list_filter = ['assessment_type', 'course']
-    search_fields = ['name', 'course__code']
+    list_filter = ['assessment_type']
+    list_select_related = ['course']
+    search_fields = ['name', '=course__code']
+    autocomplete_fields = ['course']
 
 
 @admin.register(AssessmentScore)
-class AssessmentScoreAdmin(admin.ModelAdmin):
+class AssessmentScoreAdmin(KeysetPaginationMixin, admin.ModelAdmin):
     list_display = ['student', 'assessment', 'score', 'letter_grade', 'entered_at']
     list_filter = ['letter_grade', 'entered_at']
-    search_fields = ['student__name', 'student__surname', 'assessment__name']
+    list_select_related = ['student', 'assessment__course']
+    search_fields = ['^student__email', '^student__surname', '=assessment__course__code']
+    autocomplete_fields = ['student', 'assessment']
 
 
 @admin.register(AssessmentLOContribution)
 class AssessmentLOContributionAdmin(admin.ModelAdmin):
     list_display = ['assessment', 'learning_outcome', 'contribution_percentage', 'created_at']
-    list_filter = ['assessment__course', 'created_at']
-    search_fields = ['assessment__name', 'learning_outcome__code']
+    list_filter = ['created_at']
+    list_select_related = ['assessment', 'learning_outcome__course']
+    search_fields = ['=assessment__course__code', 'assessment__name', '^learning_outcome__code']
+    autocomplete_fields = ['assessment', 'learning_outcome']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -1,26 +1,96 @@
-from rest_framework import viewsets, permissions
+from django.db import transaction
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from courses.caching import course_version
+from courses.conditional import ConditionalGetMixin, user_paths
+from courses.models import Enrollment
+from courses.reports import publish_course_reports_later
+from courses.results_week import rebuild_student_snapshots
+from university_sis.api import QueryPlanMixin
 from .models import Assessment, AssessmentScore
-from .serializers import AssessmentSerializer, AssessmentScoreSerializer
+from .publishing import publish_in_background
+from .serializers import AssessmentSerializer, AssessmentScoreSerializer, ScoreEntrySerializer, BulkScoreSerializer
+from .score_writer import write_scores, ScoreWritePending
+from .utils import calculate_letter_grade
 
 
-class AssessmentViewSet(viewsets.ModelViewSet):
+class AssessmentViewSet(ConditionalGetMixin, QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet for Assessment management."""
     queryset = Assessment.objects.all()
     serializer_class = AssessmentSerializer
     permission_classes = [permissions.IsAuthenticated]
+    select_related_plan = {'course_code': ['course'], 'course_name': ['course'], 'course_detail': ['course__teacher']}
+    prefetch_plan = {
+        'covered_LOs': ['covered_LOs'],
+        'covered_LOs_data': ['covered_LOs'],
+        'course_detail': ['course__learning_outcomes', 'course__program_outcomes'],
+    }
+    # The course itself is covered by course_version; its teacher's name is not
+    conditional_related_plan = {'course_detail': ['course__teacher__name', 'course__teacher__surname']}
+    keyset_ordering = ['course_id', 'id']
+    filter_fields = {'course': 'course_id'}
+    updated_since_field = 'updated_at'
+    
+    def conditional_versions(self, objects):
+        # Covered LOs and the course code and name come from the course
+        return [course_version(course_id) for course_id in {assessment.course_id for assessment in objects}]
     
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             # Only Teachers can modify assessments for their courses
             return [permissions.IsAuthenticated()]
         return [permissions.IsAuthenticated()]
+    
+    @action(detail=True, methods=['post'])
+    def publish(self, request, pk=None):
+        """
+        Release the scores of this assessment to students. Their pages are
+        prepared in the background first; published_at is set once that is done.
+        """
+        assessment = self.get_object()
+        if not (request.user.is_department_head() or assessment.course.teacher_id == request.user.id):
+            return Response({'detail': 'You do not have permission to publish this assessment.'}, status=status.HTTP_403_FORBIDDEN)
+        started = publish_in_background([assessment])
+        return Response({
+            'id': assessment.id,
+            'published_at': assessment.published_at,
+            'publishing': bool(started),
+        }, status=status.HTTP_202_ACCEPTED if started else status.HTTP_200_OK)
 
 
-class AssessmentScoreViewSet(viewsets.ModelViewSet):
+class AssessmentScoreViewSet(ConditionalGetMixin, QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet for Assessment Score management."""
     queryset = AssessmentScore.objects.all()
     serializer_class = AssessmentScoreSerializer
     permission_classes = [permissions.IsAuthenticated]
+    select_related_plan = {
+        'student_name': ['student'],
+        'student_detail': ['student'],
+        'assessment_name': ['assessment'],
+        'course_code': ['assessment__course'],
+    }
+    # Users have no timestamp, so the name itself is part of the ETag
+    conditional_related_plan = {
+        'student_name': ['student__name', 'student__surname'],
+        'student_detail': user_paths('student'),
+        'assessment_name': ['assessment__updated_at'],
+        'course_code': ['assessment__course__updated_at'],
+    }
+    # Backed by the (assessment, student) unique index, the (student, assessment) index and the course's assessments
+    filter_fields = {
+        'assessment': 'assessment_id',
+        'student': 'student_id',
+        'course': 'assessment__course_id',
+    }
+    updated_since_field = 'updated_at'
+    
+    def get_keyset_ordering(self):
+        # Incremental sync walks the (updated_at, id) index; otherwise the (assessment, student) one
+        if self.request.query_params.get('updated_since'):
+            return ['updated_at', 'id']
+        return ['assessment_id', 'student_id']
     
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -28,20 +98,159 @@ class AssessmentScoreViewSet(viewsets.ModelViewSet):
             return [permissions.IsAuthenticated()]
         return [permissions.IsAuthenticated()]
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.user.is_student():
+            # Students only see their own scores, and only once the assessment is published
+            queryset = queryset.filter(student=self.request.user, assessment__published_at__isnull=False)
+        return queryset
+    
+    def create(self, request, *args, **kwargs):
+        try:
+            return super().create(request, *args, **kwargs)
+        except ScoreWritePending as e:
+            return Response({'status': 'pending', 'detail': str(e)}, status=status.HTTP_202_ACCEPTED)
+    
     def perform_create(self, serializer):
-        """Automatically calculate letter grade when creating a score."""
-        instance = serializer.save()
-        if instance.score is not None:
-            from assessments.utils import calculate_letter_grade
-            instance.letter_grade = calculate_letter_grade(instance.score)
-            instance.save()
+        """Write the score through the score writer, which also sets the letter grade."""
+        data = serializer.validated_data
+        [(instance, created)] = write_scores([{
+            'assessment_id': data['assessment'].id,
+            'student_id': data['student'].id,
+            'score': data['score'],
+        }])
+        serializer.instance = instance
+    
+    def update(self, request, *args, **kwargs):
+        try:
+            return super().update(request, *args, **kwargs)
+        except ScoreWritePending as e:
+            return Response({'status': 'pending', 'detail': str(e)}, status=status.HTTP_202_ACCEPTED)
     
     def perform_update(self, serializer):
-        """Automatically calculate letter grade when updating a score."""
-        instance = serializer.save()
-        if instance.score is not None:
-            from assessments.utils import calculate_letter_grade
-            instance.letter_grade = calculate_letter_grade(instance.score)
-            instance.save()
-
-
+        """
+        A new score for the same assessment and student goes through the score
+        writer like every other score write. Moving the row to another
+        assessment or student is saved directly, with the letter grade
+        calculated first; the reports and results week snapshots of both the
+        old and the new pair are refreshed on commit, as the writer does.
+        """
+        instance = serializer.instance
+        data = serializer.validated_data
+        assessment = data.get('assessment', instance.assessment)
+        student = data.get('student', instance.student)
+        score = data.get('score', instance.score)
+        if (assessment.id, student.id) == (instance.assessment_id, instance.student_id):
+            [(serializer.instance, created)] = write_scores([{
+                'assessment_id': assessment.id,
+                'student_id': student.id,
+                'score': score,
+            }])
+            return
+        
+        course_ids = {instance.assessment.course_id, assessment.course_id}
+        student_ids = {instance.student_id, student.id}
+        serializer.save(letter_grade=calculate_letter_grade(score))
+        transaction.on_commit(lambda: publish_course_reports_later(course_ids))
+        transaction.on_commit(lambda: rebuild_student_snapshots(student_ids))
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Create or update many scores for one course or assessment in one transaction.
+        
+        Body: {"course": id} or {"assessment": id}, plus
+              "scores": [{"assessment": id, "student": id, "score": 0-100}, ...]
+        
+        Invalid items are reported and skipped; valid items are saved together.
+        The same (assessment, student) pair given twice is a 400.
+        Returns per-item results in the order of the request. If the writer does
+        not acknowledge the write in time, the valid items are reported as
+        "pending": they are queued and will be saved.
+        """
+        request_serializer = BulkScoreSerializer(data=request.data)
+        request_serializer.is_valid(raise_exception=True)
+        course_id = request_serializer.validated_data.get('course')
+        default_assessment_id = request_serializer.validated_data.get('assessment')
+        items = request_serializer.validated_data['scores']
+        
+        # Validate every item on its own first
+        results = []
+        parsed = []
+        for index, item in enumerate(items):
+            item_serializer = ScoreEntrySerializer(data=item)
+            if not item_serializer.is_valid():
+                results.append({'index': index, 'status': 'error', 'errors': item_serializer.errors})
+                continue
+            data = item_serializer.validated_data
+            data.setdefault('assessment', default_assessment_id)
+            if data['assessment'] is None:
+                results.append({'index': index, 'status': 'error', 'errors': {'assessment': ['This field is required.']}})
+                continue
+            results.append({'index': index, 'status': None})
+            parsed.append((index, data))
+        
+        # A pair given twice would be written once but counted twice; the caller has to pick one
+        first_index = {}
+        duplicates = []
+        for index, data in parsed:
+            key = (data['assessment'], data['student'])
+            if key in first_index:
+                duplicates.append(f'Item {index} repeats the assessment and student of item {first_index[key]}.')
+            else:
+                first_index[key] = index
+        if duplicates:
+            raise ValidationError({'scores': duplicates})
+        
+        # Then check all items together: one query for assessments, one for enrollments
+        assessment_ids = {data['assessment'] for _, data in parsed}
+        assessments = Assessment.objects.filter(id__in=assessment_ids).select_related('course')
+        if course_id:
+            assessments = assessments.filter(course_id=course_id)
+        elif default_assessment_id:
+            assessments = assessments.filter(id=default_assessment_id)
+        assessments = {assessment.id: assessment for assessment in assessments}
+        
+        course_ids = {assessment.course_id for assessment in assessments.values()}
+        enrolled = set(Enrollment.objects.filter(
+            course_id__in=course_ids,
+            student_id__in={data['student'] for _, data in parsed}
+        ).values_list('course_id', 'student_id'))
+        
+        entries = []
+        for index, data in parsed:
+            assessment = assessments.get(data['assessment'])
+            if assessment is None:
+                results[index].update(status='error', errors={'assessment': ['Assessment not found in this course.']})
+            elif not (request.user.is_department_head() or assessment.course.teacher_id == request.user.id):
+                results[index].update(status='error', errors={'assessment': ['You do not have permission to grade this course.']})
+            elif (assessment.course_id, data['student']) not in enrolled:
+                results[index].update(status='error', errors={'student': ['Student is not enrolled in this course.']})
+            else:
+                entries.append((index, {
+                    'assessment_id': assessment.id,
+                    'student_id': data['student'],
+                    'score': data['score'],
+                }))
+        
+        try:
+            saved = write_scores([entry for _, entry in entries])
+        except ScoreWritePending:
+            for index, _ in entries:
+                results[index].update(status='pending')
+        else:
+            for (index, _), (score_obj, created) in zip(entries, saved):
+                results[index].update(
+                    status='created' if created else 'updated',
+                    id=score_obj.id,
+                    letter_grade=score_obj.letter_grade
+                )
+        
+        pending = sum(1 for r in results if r['status'] == 'pending')
+        return Response({
+            'created': sum(1 for r in results if r['status'] == 'created'),
+            'updated': sum(1 for r in results if r['status'] == 'updated'),
+            'pending': pending,
+            'failed': sum(1 for r in results if r['status'] == 'error'),
+            'results': results,
+        }, status=status.HTTP_202_ACCEPTED if pending else status.HTTP_200_OK)
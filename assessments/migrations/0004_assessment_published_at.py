@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:52
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def publish_existing_assessments(apps, schema_editor):
+    """Scores of existing assessments were already visible to students; keep them visible."""
+    Assessment = apps.get_model('assessments', 'Assessment')
+    Assessment.objects.filter(published_at__isnull=True).update(published_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assessments', '0003_alter_assessmentscore_letter_grade'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assessment',
+            name='published_at',
+            field=models.DateTimeField(blank=True, help_text='When the scores were released to students; unpublished scores are only visible to staff', null=True),
+        ),
+        migrations.RunPython(publish_existing_assessments, migrations.RunPython.noop),
+    ]
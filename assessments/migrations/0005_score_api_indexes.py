@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assessments', '0004_assessment_published_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='assessmentscore',
+            index=models.Index(fields=['student', 'assessment'], name='assessments_score_student_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assessmentscore',
+            index=models.Index(fields=['updated_at', 'id'], name='assessments_score_updated_idx'),
+        ),
+    ]
@@ -58,12 +58,21 @@ class Assessment(models.Model):
         blank=True,
         help_text="Learning Outcomes covered by this assessment with contribution percentages"
     )
+    published_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the scores were released to students; unpublished scores are only visible to staff"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['course', 'created_at']
     
+    @property
+    def is_published(self):
+        return self.published_at is not None
+    
     def __str__(self):
         return f"{self.course.code} - {self.name} ({self.weight_percentage}%)"
 
@@ -108,6 +117,12 @@ class AssessmentScore(models.Model):
     class Meta:
         unique_together = [['assessment', 'student']]
         ordering = ['assessment', 'student']
+        indexes = [
+            # API filters and keyset pagination (see AssessmentScoreViewSet); the unique
+            # constraint already covers assessment first
+            models.Index(fields=['student', 'assessment'], name='assessments_score_student_idx'),
+            models.Index(fields=['updated_at', 'id'], name='assessments_score_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.student.get_full_name()} - {self.assessment.name}: {self.score}"
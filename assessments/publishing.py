@@ -0,0 +1,134 @@
+"""
+Grade publication.
+
+Scores are visible to students only once their assessment is published.
+Publishing a whole course at once sends every student of the roster to their
+pages at the same moment, so publish_assessments() prepares those pages first:
+
+1. A fresh publication version is chosen for each affected course.
+2. The student pages of the roster (course cards, grade tables, PO charts and
+   class averages) are computed as if the assessments were published and
+   stored under those versions. Nobody reads them yet, since the versions
+   are not current.
+3. published_at is set on all the assessments in one transaction and the
+   publication versions switch on commit, so the scores appear together and
+   the first request after the flip already finds warm entries.
+
+The teacher page and the API run this in a background thread.
+"""
+import threading
+import time
+
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from courses.caching import publication_version, set_versions
+from courses.models import Course, Enrollment
+from courses.reports import publish_course_reports_later
+from courses.results_week import rebuild_student_snapshots
+from courses.student_cache import (
+    get_student_courses, get_student_grade_tables, get_student_po_charts, get_course_cohort
+)
+from .models import Assessment
+
+
+class Publication:
+    """
+    Assessments about to be published.
+
+    assessment_ids: ids of the assessments, counted as published while warming
+    course_ids: ids of their courses
+    versions: {publication namespace: version} that becomes current on publishing
+    """
+
+    def __init__(self, assessments):
+        self.assessment_ids = frozenset(assessment.id for assessment in assessments)
+        self.course_ids = {assessment.course_id for assessment in assessments}
+        # A millisecond timestamp has never been used as a version of these namespaces
+        stamp = int(time.time() * 1000)
+        self.versions = {publication_version(course_id): stamp for course_id in self.course_ids}
+
+
+def warm_student_pages(publication, progress=None):
+    """Compute and store the student pages of every affected roster under the publication's versions."""
+    for course in Course.objects.filter(id__in=publication.course_ids):
+        get_course_cohort(course, publication)
+
+    enrollments = list(
+        Enrollment.objects.filter(course_id__in=publication.course_ids)
+        .select_related('student', 'course', 'course__teacher')
+        .order_by('student_id', 'course_id')
+    )
+    warmed_students = set()
+    for done, enrollment in enumerate(enrollments, start=1):
+        if enrollment.student_id not in warmed_students:
+            get_student_courses(enrollment.student, publication)
+            warmed_students.add(enrollment.student_id)
+        get_student_grade_tables(enrollment.student, enrollment.course, publication)
+        get_student_po_charts(enrollment.student, enrollment.course, publication)
+        if progress:
+            progress(done, len(enrollments))
+    return warmed_students
+
+
+def publish_assessments(assessments, progress=None):
+    """
+    Warm the student pages, then make the scores of the given assessments
+    visible to students. Already published assessments are left alone.
+    Returns the number of assessments published.
+    """
+    assessments = [assessment for assessment in assessments if assessment.published_at is None]
+    if not assessments:
+        return 0
+
+    publication = Publication(assessments)
+    student_ids = warm_student_pages(publication, progress=progress)
+
+    with transaction.atomic():
+        published = Assessment.objects.filter(
+            id__in=publication.assessment_ids,
+            published_at__isnull=True
+        ).update(published_at=timezone.now())
+        # update() sends no signals; switching the publication versions is the invalidation
+        set_versions(publication.versions)
+        transaction.on_commit(lambda: rebuild_student_snapshots(student_ids))
+        transaction.on_commit(lambda: publish_course_reports_later(publication.course_ids))
+    return published
+
+
+_publishing = set()
+_publishing_lock = threading.Lock()
+
+
+def is_publishing(assessment_id):
+    """Whether a background publication of the assessment is running in this process."""
+    with _publishing_lock:
+        return assessment_id in _publishing
+
+
+def publish_in_background(assessments):
+    """
+    Start publish_assessments() in a background thread and return the
+    assessments it will publish; those already published or being published
+    are skipped.
+    """
+    with _publishing_lock:
+        assessments = [
+            assessment for assessment in assessments
+            if assessment.published_at is None and assessment.id not in _publishing
+        ]
+        _publishing.update(assessment.id for assessment in assessments)
+    if not assessments:
+        return []
+
+    def run():
+        close_old_connections()
+        try:
+            publish_assessments(assessments)
+        finally:
+            with _publishing_lock:
+                _publishing.difference_update(assessment.id for assessment in assessments)
+            close_old_connections()
+
+    threading.Thread(target=run, name='grade-publication', daemon=True).start()
+    return assessments
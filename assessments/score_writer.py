@@ -0,0 +1,276 @@
+"""
+Write path for AssessmentScore rows.
+
+All score writes (the teacher grid, the REST API) go through write_scores().
+By default the scores are upserted directly in the calling thread. When
+SCORE_WRITE_BATCHING is enabled, the writes are handed to a single in-process
+writer thread instead. The writer groups everything queued during one tick into
+a single transaction, so concurrent grid saves no longer fight over the SQLite
+write lock, and each caller still gets its own acknowledgement. During results
+week (see courses.results_week) writes always go through the writer, which also
+rebuilds the affected student snapshots once the callers are acknowledged.
+"""
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from courses.caching import bump_versions, scores_version, course_scores_version
+from courses.reports import publish_course_reports_later
+from courses.results_week import is_results_week, rebuild_student_snapshots
+from .models import Assessment, AssessmentScore
+
+# Attempts of upsert_scores when a concurrent write inserts one of the same rows first
+UPSERT_ATTEMPTS = 3
+
+# How the databases report a unique constraint violation: the SQLSTATE (PostgreSQL),
+# the error code (MySQL) and the message prefix (SQLite)
+UNIQUE_VIOLATION_SQLSTATE = '23505'
+MYSQL_DUPLICATE_ENTRY = 1062
+SQLITE_UNIQUE_MESSAGE = 'UNIQUE constraint failed'
+
+
+class ScoreWritePending(Exception):
+    """
+    The batching writer did not answer in time. The scores are still queued
+    (or already committed) and will be saved; only the acknowledgement is missing.
+    """
+
+
+def upsert_scores(entries):
+    """
+    Create or update a list of scores in one transaction.
+
+    Each entry is a dict with 'assessment_id', 'student_id' and 'score'.
+    The letter grade is calculated before the write, so every row is written once.
+    If the same (assessment, student) pair appears more than once, the last entry wins.
+
+    A row inserted by another writer between the read and the insert makes the
+    insert fail on the (assessment, student) unique constraint; the transaction
+    (a savepoint inside an outer one) is then rolled back and the whole diff is
+    computed again, so that row is updated instead. Other integrity errors, such
+    as an unknown assessment or student, are raised at once.
+
+    Returns: list of (AssessmentScore, created) tuples in the order of the entries
+    """
+    if not entries:
+        return []
+
+    wanted = {}
+    for entry in entries:
+        key = (int(entry['assessment_id']), int(entry['student_id']))
+        wanted[key] = Decimal(str(entry['score']))
+
+    for attempt in range(1, UPSERT_ATTEMPTS + 1):
+        try:
+            results = _upsert(wanted)
+        except IntegrityError as e:
+            if attempt == UPSERT_ATTEMPTS or not _is_unique_violation(e):
+                raise
+        else:
+            break
+
+    return [
+        results[(int(entry['assessment_id']), int(entry['student_id']))]
+        for entry in entries
+    ]
+
+
+def _is_unique_violation(error):
+    """Whether an IntegrityError comes from a unique constraint rather than e.g. a foreign key."""
+    # Django keeps the driver's arguments and chains the driver's exception
+    code = getattr(error.__cause__, 'sqlstate', None) or getattr(error.__cause__, 'pgcode', None)
+    if code is not None:
+        return code == UNIQUE_VIOLATION_SQLSTATE
+    if error.args and error.args[0] == MYSQL_DUPLICATE_ENTRY:
+        return True
+    return str(error).startswith(SQLITE_UNIQUE_MESSAGE)
+
+
+def _upsert(wanted):
+    """One attempt of upsert_scores; returns {(assessment_id, student_id): (score, created)}."""
+    from assessments.utils import calculate_letter_grade
+
+    assessment_ids = {assessment_id for assessment_id, _ in wanted}
+    student_ids = {student_id for _, student_id in wanted}
+    now = timezone.now()
+
+    with transaction.atomic():
+        existing = {
+            (score.assessment_id, score.student_id): score
+            for score in AssessmentScore.objects.select_for_update().filter(
+                assessment_id__in=assessment_ids,
+                student_id__in=student_ids
+            )
+        }
+
+        to_create = []
+        to_update = []
+        results = {}
+        for key, score in wanted.items():
+            letter_grade = calculate_letter_grade(score)
+            score_obj = existing.get(key)
+            if score_obj is None:
+                score_obj = AssessmentScore(
+                    assessment_id=key[0],
+                    student_id=key[1],
+                    score=score,
+                    letter_grade=letter_grade
+                )
+                to_create.append(score_obj)
+                results[key] = (score_obj, True)
+            else:
+                score_obj.score = score
+                score_obj.letter_grade = letter_grade
+                score_obj.updated_at = now
+                to_update.append(score_obj)
+                results[key] = (score_obj, False)
+
+        if to_create:
+            AssessmentScore.objects.bulk_create(to_create)
+        if to_update:
+            AssessmentScore.objects.bulk_update(to_update, ['score', 'letter_grade', 'updated_at'])
+
+        # Bulk writes send no signals; invalidate the cached student pages on commit
+        course_ids = dict(Assessment.objects.filter(id__in=assessment_ids).values_list('id', 'course_id'))
+        pairs = {
+            (course_ids[assessment_id], student_id)
+            for assessment_id, student_id in wanted if assessment_id in course_ids
+        }
+        bump_versions(
+            *{scores_version(course_id, student_id) for course_id, student_id in pairs},
+            *{course_scores_version(course_id) for course_id, _ in pairs}
+        )
+        # Class averages changed too, so every report of these courses is republished
+        changed_course_ids = {course_id for course_id, _ in pairs}
+        transaction.on_commit(lambda: publish_course_reports_later(changed_course_ids))
+
+    return results
+
+
+class ScoreWriter:
+    """
+    Single writer thread that coalesces queued score writes.
+
+    Callers submit a list of entries and get a Future back. The writer waits
+    for the first request, collects whatever else arrives within the tick, and
+    commits all of it in one transaction. If the combined transaction fails,
+    the requests are retried one by one so that a bad request only fails its
+    own caller.
+    """
+
+    def __init__(self, tick=0.05, max_batch=1000):
+        self.tick = tick
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, entries):
+        """Queue entries for writing and return a Future with the upsert results."""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((list(entries), future))
+        return future
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='score-writer',
+                    daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            try:
+                while size < self.max_batch:
+                    item = self._queue.get(timeout=self.tick)
+                    batch.append(item)
+                    size += len(item[0])
+            except queue.Empty:
+                pass
+
+            close_old_connections()
+            try:
+                self._flush(batch)
+            finally:
+                close_old_connections()
+
+    def _flush(self, batch):
+        requests = [(entries, future) for entries, future in batch if future.set_running_or_notify_cancel()]
+        if not requests:
+            return
+
+        combined = [entry for entries, _ in requests for entry in entries]
+        try:
+            results = upsert_scores(combined)
+        except Exception:
+            # Fall back to one transaction per request so errors stay per caller
+            written = []
+            for entries, future in requests:
+                try:
+                    future.set_result(upsert_scores(entries))
+                    written += entries
+                except Exception as e:
+                    future.set_exception(e)
+        else:
+            written = combined
+            offset = 0
+            for entries, future in requests:
+                future.set_result(results[offset:offset + len(entries)])
+                offset += len(entries)
+
+        # The callers already have their acknowledgements; refresh what students see
+        rebuild_student_snapshots({int(entry['student_id']) for entry in written})
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_score_writer():
+    """Return the process-wide ScoreWriter, creating it on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ScoreWriter(
+                tick=getattr(settings, 'SCORE_WRITE_BATCH_TICK', 0.05),
+                max_batch=getattr(settings, 'SCORE_WRITE_BATCH_MAX', 1000)
+            )
+        return _writer
+
+
+def write_scores(entries):
+    """
+    Write scores, through the batching writer if SCORE_WRITE_BATCHING is enabled
+    or results week mode is on.
+
+    Blocks until the scores are committed and returns the upsert results.
+    Raises whatever error the write raised, or ScoreWritePending if the writer
+    did not answer within SCORE_WRITE_BATCH_TIMEOUT seconds.
+    """
+    if not (getattr(settings, 'SCORE_WRITE_BATCHING', False) or is_results_week()):
+        return upsert_scores(entries)
+
+    if transaction.get_connection().in_atomic_block:
+        # The writer thread cannot see rows from an open transaction, write inline instead
+        results = upsert_scores(entries)
+        student_ids = {int(entry['student_id']) for entry in entries}
+        transaction.on_commit(lambda: rebuild_student_snapshots(student_ids))
+        return results
+
+    future = get_score_writer().submit(entries)
+    try:
+        return future.result(timeout=getattr(settings, 'SCORE_WRITE_BATCH_TIMEOUT', 30))
+    except FutureTimeoutError:
+        # The writer still owns the request and may even have committed it already
+        raise ScoreWritePending('The scores are queued and will be saved shortly.')
@@ -1,33 +1,59 @@
 from rest_framework import serializers
 from .models import Assessment, AssessmentScore
-from courses.serializers import LearningOutcomeSerializer
+from accounts.serializers import UserSerializer
+from courses.serializers import CourseSerializer, LearningOutcomeSerializer
+from university_sis.api import DynamicFieldsMixin
 
 
-class AssessmentSerializer(serializers.ModelSerializer):
-    """Serializer for Assessment."""
+class AssessmentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Serializer for Assessment. The whole course, with its outcomes, is sent with ?expand=course_detail."""
     covered_LOs_data = LearningOutcomeSerializer(source='covered_LOs', many=True, read_only=True)
     course_code = serializers.CharField(source='course.code', read_only=True)
     course_name = serializers.CharField(source='course.name', read_only=True)
+    course_detail = CourseSerializer(source='course', read_only=True)
     
     class Meta:
         model = Assessment
-        fields = ['id', 'course', 'course_code', 'course_name', 'name', 
+        fields = ['id', 'course', 'course_code', 'course_name', 'course_detail', 'name', 
                   'assessment_type', 'weight_percentage', 'covered_LOs', 
-                  'covered_LOs_data', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+                  'covered_LOs_data', 'published_at', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'published_at', 'created_at', 'updated_at']
+        expandable_fields = ['course_detail']
 
 
-class AssessmentScoreSerializer(serializers.ModelSerializer):
-    """Serializer for Assessment Score."""
+class AssessmentScoreSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Serializer for Assessment Score. The student's user record is sent with ?expand=student_detail."""
     student_name = serializers.CharField(source='student.get_full_name', read_only=True)
+    student_detail = UserSerializer(source='student', read_only=True)
     assessment_name = serializers.CharField(source='assessment.name', read_only=True)
     course_code = serializers.CharField(source='assessment.course.code', read_only=True)
     
     class Meta:
         model = AssessmentScore
         fields = ['id', 'assessment', 'assessment_name', 'course_code', 
-                  'student', 'student_name', 'score', 'letter_grade', 
+                  'student', 'student_name', 'student_detail', 'score', 'letter_grade', 
                   'entered_at', 'updated_at']
         read_only_fields = ['id', 'entered_at', 'updated_at']
+        expandable_fields = ['student_detail']
 
 
+class ScoreEntrySerializer(serializers.Serializer):
+    """One score in a bulk score request."""
+    assessment = serializers.IntegerField(required=False)
+    student = serializers.IntegerField()
+    score = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, max_value=100)
+
+
+class BulkScoreSerializer(serializers.Serializer):
+    """
+    Bulk score request for one course or one assessment.
+    Items may leave out 'assessment' when it is given at the top level.
+    """
+    course = serializers.IntegerField(required=False)
+    assessment = serializers.IntegerField(required=False)
+    scores = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+    
+    def validate(self, attrs):
+        if not attrs.get('course') and not attrs.get('assessment'):
+            raise serializers.ValidationError('Either course or assessment is required.')
+        return attrs
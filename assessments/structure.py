@@ -0,0 +1,57 @@
+"""
+In-memory view of a course's assessment structure.
+
+CourseStructure.load() reads the assessments, learning outcomes and
+assessment-LO contributions of a course with one query each. The teacher
+pages then take every list, lookup and validity total from memory, so they
+run the same number of queries whatever the size of the course.
+"""
+from decimal import Decimal
+
+from courses.models import LearningOutcome
+from .models import Assessment, AssessmentLOContribution
+
+
+class CourseStructure:
+    """
+    Assessments, LOs and contributions of one course.
+
+    assessments: assessments ordered by creation
+    learning_outcomes: LOs in their model ordering
+    contributions_by_assessment: assessment id -> [AssessmentLOContribution, ...]
+    lo_totals: LO id -> {'count': number of assessments, 'total_percentage': Decimal}
+    matrix: assessment id -> {LO id -> contribution percentage}
+    total_weight: sum of the assessment weights
+    """
+
+    def __init__(self, course, assessments, learning_outcomes, contributions):
+        self.course = course
+        self.assessments = assessments
+        self.learning_outcomes = learning_outcomes
+
+        self.contributions_by_assessment = {assessment.id: [] for assessment in assessments}
+        self.lo_totals = {lo.id: {'count': 0, 'total_percentage': Decimal('0.00')} for lo in learning_outcomes}
+        self.matrix = {assessment.id: {} for assessment in assessments}
+
+        for contrib in contributions:
+            if contrib.assessment_id in self.contributions_by_assessment:
+                self.contributions_by_assessment[contrib.assessment_id].append(contrib)
+                self.matrix[contrib.assessment_id][contrib.learning_outcome_id] = contrib.contribution_percentage
+            if contrib.learning_outcome_id in self.lo_totals:
+                totals = self.lo_totals[contrib.learning_outcome_id]
+                totals['count'] += 1
+                totals['total_percentage'] += contrib.contribution_percentage
+
+        self.total_weight = sum((assessment.weight_percentage for assessment in assessments), Decimal('0.00'))
+
+    @classmethod
+    def load(cls, course):
+        """Load the structure of a course with three queries."""
+        assessments = list(Assessment.objects.filter(course=course).order_by('created_at', 'id'))
+        learning_outcomes = list(LearningOutcome.objects.filter(course=course))
+        contributions = list(
+            AssessmentLOContribution.objects.filter(assessment__course=course)
+            .select_related('learning_outcome')
+            .order_by('learning_outcome__order', 'learning_outcome__code')
+        )
+        return cls(course, assessments, learning_outcomes, contributions)
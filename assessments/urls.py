@@ -5,6 +5,7 @@ urlpatterns = [
     path('teacher/courses/<int:course_id>/assessments/', views.manage_assessments, name='manage_assessments'),
     path('teacher/courses/<int:course_id>/scores/', views.enter_scores, name='enter_scores'),
     path('teacher/courses/<int:course_id>/los/<int:lo_id>/assessments/', views.manage_lo_assessments, name='manage_lo_assessments'),
+    path('teacher/courses/<int:course_id>/contributions/', views.manage_course_contributions, name='manage_course_contributions'),
 ]
 
 
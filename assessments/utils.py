@@ -4,7 +4,22 @@ from courses.models import Course, LearningOutcome, LOPOMapping, DepartmentProgr
 from assessments.models import Assessment, AssessmentScore, AssessmentLOContribution
 
 
-def calculate_final_lo(student, course, learning_outcome):
+def score_counts(assessment, published_only):
+    """
+    Whether a student's score for the assessment is taken into account.
+    
+    published_only:
+    - False: every score counts (teacher and department head views)
+    - True: only scores of published assessments count (student views)
+    - a set of assessment ids: as True, with these assessments counted as
+      published already (used to warm caches just before publishing them)
+    """
+    if not published_only or assessment.published_at is not None:
+        return True
+    return published_only is not True and assessment.id in published_only
+
+
+def calculate_final_lo(student, course, learning_outcome, published_only=False):
     """
     Calculate final LO value for a student, only if total contribution equals 100%.
     
@@ -21,6 +36,8 @@ def calculate_final_lo(student, course, learning_outcome):
     - student_grade = student's score for that assessment (0-100)
     - LO_contribution_percentage = contribution percentage of assessment to this LO (0-100)
     
+    Scores not counted under published_only (see score_counts) contribute 0.
+    
     Example:
     - Vize1: student got 80, LO contribution is 40% → 80 × 0.40 = 32
     - Vize2: student got 70, LO contribution is 40% → 70 × 0.40 = 28
@@ -52,6 +69,8 @@ def calculate_final_lo(student, course, learning_outcome):
     
     for contribution in contributions:
         assessment = contribution.assessment
+        if not score_counts(assessment, published_only):
+            continue
         try:
             score_obj = AssessmentScore.objects.get(
                 assessment=assessment,
@@ -83,13 +102,15 @@ def calculate_lo_score(student, course, learning_outcome):
     return calculate_final_lo(student, course, learning_outcome)
 
 
-def calculate_course_total_grade(student, course):
+def calculate_course_total_grade(student, course, published_only=False):
     """
     Calculate total course grade using weighted average.
     
     Formula:
     Total = SUM( score_assessment * weight_percentage / 100 )
     
+    Scores not counted under published_only (see score_counts) are skipped like missing ones.
+    
     Returns: Decimal between 0 and 100
     """
     assessments = Assessment.objects.filter(course=course)
@@ -101,6 +122,8 @@ def calculate_course_total_grade(student, course):
     total_weight = Decimal('0.00')
     
     for assessment in assessments:
+        if not score_counts(assessment, published_only):
+            continue
         try:
             score_obj = AssessmentScore.objects.get(
                 assessment=assessment,
@@ -167,7 +190,7 @@ def calculate_letter_grade(numeric_grade):
         return 'FF'
 
 
-def calculate_po_achievement(student, course, program_outcome):
+def calculate_po_achievement(student, course, program_outcome, published_only=False):
     """
     Calculate PO achievement value based on LO-PO mappings.
     
@@ -192,7 +215,7 @@ def calculate_po_achievement(student, course, program_outcome):
     
     for mapping in mappings:
         lo = mapping.learning_outcome
-        lo_score = calculate_final_lo(student, course, lo)
+        lo_score = calculate_final_lo(student, course, lo, published_only)
         # Only include LOs where total_contribution == 100% (lo_score is not None)
         if lo_score is not None:
             contribution_weight = Decimal(str(mapping.contribution_weight))
@@ -212,7 +235,7 @@ def calculate_po_achievement(student, course, program_outcome):
     return po_value.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
 
-def calculate_department_po(student, department_program_outcome):
+def calculate_department_po(student, department_program_outcome, published_only=False):
     """
     Calculate department-level PO value for a student based on LO contributions.
     
@@ -256,7 +279,7 @@ def calculate_department_po(student, department_program_outcome):
             continue
         
         # Get LO score for this student in this course
-        lo_score = calculate_final_lo(student, course, lo)
+        lo_score = calculate_final_lo(student, course, lo, published_only)
         
         # Only include LOs where total_contribution == 100% (lo_score is not None)
         if lo_score is not None:
@@ -275,7 +298,7 @@ def calculate_department_po(student, department_program_outcome):
     return po_value.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
 
-def get_student_department_pos(student):
+def get_student_department_pos(student, published_only=False):
     """
     Get all department PO values for a student.
     
@@ -285,14 +308,14 @@ def get_student_department_pos(student):
     po_values = {}
     
     for po in department_pos:
-        po_value = calculate_department_po(student, po)
+        po_value = calculate_department_po(student, po, published_only)
         if po_value is not None:
             po_values[po.code] = float(po_value)
     
     return po_values
 
 
-def get_student_course_data(student, course):
+def get_student_course_data(student, course, published_only=False):
     """
     Get comprehensive course data for a student including:
     - Assessment scores
@@ -301,6 +324,8 @@ def get_student_course_data(student, course):
     - LO achievement percentages
     - PO achievement values
     
+    published_only: see score_counts; True for pages shown to the student
+    
     Returns: dict with all calculated data
     """
     data = {
@@ -316,6 +341,8 @@ def get_student_course_data(student, course):
     assessments = Assessment.objects.filter(course=course).prefetch_related('scores', 'covered_LOs')
     
     for assessment in assessments:
+        if not score_counts(assessment, published_only):
+            continue
         try:
             score_obj = AssessmentScore.objects.get(assessment=assessment, student=student)
             data['assessments'].append({
@@ -327,7 +354,7 @@ def get_student_course_data(student, course):
             continue
     
     # Calculate total grade and letter grade
-    total_grade = calculate_course_total_grade(student, course)
+    total_grade = calculate_course_total_grade(student, course, published_only)
     if total_grade is not None:
         data['total_grade'] = float(total_grade)
         data['letter_grade'] = calculate_letter_grade(total_grade)
@@ -336,7 +363,7 @@ def get_student_course_data(student, course):
     # Only include LOs where total_contribution == 100%
     learning_outcomes = LearningOutcome.objects.filter(course=course)
     for lo in learning_outcomes:
-        lo_score = calculate_final_lo(student, course, lo)
+        lo_score = calculate_final_lo(student, course, lo, published_only)
         # Only add if lo_score is not None (i.e., total_contribution == 100%)
         if lo_score is not None:
             data['lo_achievements'][lo.code] = float(lo_score)
@@ -344,7 +371,7 @@ def get_student_course_data(student, course):
     # Calculate PO achievements
     program_outcomes = course.program_outcomes.all()
     for po in program_outcomes:
-        po_value = calculate_po_achievement(student, course, po)
+        po_value = calculate_po_achievement(student, course, po, published_only)
         data['po_achievements'][po.code] = float(po_value)
     
     return data
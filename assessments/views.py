@@ -1,13 +1,38 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db import transaction
 from decimal import Decimal
-from courses.models import Course, Enrollment
+from courses.models import Course, Enrollment, LearningOutcome
+from courses.bulk import sync_percentage_rows
+from courses.caching import bump_versions, course_version
+from courses.deletion import delete_assessments
 from .models import Assessment, AssessmentScore, AssessmentLOContribution
+from .publishing import publish_in_background, is_publishing
+from .score_writer import write_scores, ScoreWritePending
+from .structure import CourseStructure
 from accounts.decorators import teacher_required
 
 
+def _save_contribution_matrix(learning_outcomes, matrix):
+    """
+    Save assessment contributions for the given LOs from a matrix of
+    (assessment_id, lo_id) -> percentage, writing only the cells that changed.
+    """
+    counts = sync_percentage_rows(
+        AssessmentLOContribution.objects.filter(learning_outcome__in=learning_outcomes),
+        matrix,
+        key=lambda contrib: (contrib.assessment_id, contrib.learning_outcome_id),
+        build=lambda key, percentage: AssessmentLOContribution(
+            assessment_id=key[0],
+            learning_outcome_id=key[1],
+            contribution_percentage=percentage
+        )
+    )
+    # The bulk writes send no signals, so the cached student pages are invalidated here
+    bump_versions(*{course_version(lo.course_id) for lo in learning_outcomes})
+    return counts
+
+
 @teacher_required
 def manage_assessments(request, course_id):
     """Teacher can create/edit assessments for their courses."""
@@ -18,7 +43,7 @@ def manage_assessments(request, course_id):
         messages.error(request, 'You do not have permission to manage this course.')
         return redirect('teacher_courses')
     
-    assessments = Assessment.objects.filter(course=course).prefetch_related('lo_contributions__learning_outcome')
+    structure = CourseStructure.load(course)
     
     if request.method == 'POST':
         action = request.POST.get('action')
@@ -35,8 +60,7 @@ def manage_assessments(request, course_id):
                     return redirect('manage_assessments', course_id=course_id)
                 
                 # Check total weight doesn't exceed 100%
-                existing_assessments = Assessment.objects.filter(course=course)
-                total_weight = sum(float(a.weight_percentage) for a in existing_assessments)
+                total_weight = float(structure.total_weight)
                 if total_weight + weight > 100:
                     messages.error(request, f'Total weight would exceed 100%. Current total: {total_weight}%, Adding: {weight}%')
                     return redirect('manage_assessments', course_id=course_id)
@@ -58,23 +82,32 @@ def manage_assessments(request, course_id):
             assessment_id = request.POST.get('assessment_id')
             try:
                 assessment = Assessment.objects.get(id=assessment_id, course=course)
-                assessment.delete()
+                delete_assessments([assessment.id])
                 messages.success(request, 'Assessment deleted successfully.')
             except Assessment.DoesNotExist:
                 messages.error(request, 'Assessment not found.')
         
+        elif action in ('publish', 'publish_all'):
+            assessments = structure.assessments
+            if action == 'publish':
+                assessments = [a for a in assessments if str(a.id) == request.POST.get('assessment_id')]
+            started = publish_in_background(assessments)
+            if started:
+                names = ', '.join(assessment.name for assessment in started)
+                messages.success(request, f'Publishing {names}. Students will see the scores as soon as their results are prepared.')
+            else:
+                messages.info(request, 'There is nothing left to publish.')
+        
         return redirect('manage_assessments', course_id=course_id)
     
-    # Get LO contributions for each assessment (for display only - read-only)
-    assessment_contributions = {}
-    for assessment in assessments:
-        contributions = AssessmentLOContribution.objects.filter(assessment=assessment).select_related('learning_outcome')
-        assessment_contributions[assessment.id] = contributions
-    
+    # LO contributions for each assessment (for display only - read-only)
     return render(request, 'teacher/manage_assessments.html', {
         'course': course,
-        'assessments': assessments,
-        'assessment_contributions': assessment_contributions,
+        'assessments': structure.assessments,
+        'assessment_contributions': structure.contributions_by_assessment,
+        'total_weight': structure.total_weight,
+        'publishing_ids': {assessment.id for assessment in structure.assessments if is_publishing(assessment.id)},
+        'has_unpublished': any(not assessment.is_published for assessment in structure.assessments),
     })
 
 
@@ -92,7 +125,8 @@ def enter_scores(request, course_id):
     enrollments = Enrollment.objects.filter(course=course).select_related('student')
     
     if request.method == 'POST':
-        # Process all scores from the form
+        # Collect all scores from the form and write them in one go
+        entries = []
         for enrollment in enrollments:
             for assessment in assessments:
                 score_key = f'score_{assessment.id}_{enrollment.student.id}'
@@ -109,21 +143,23 @@ def enter_scores(request, course_id):
                         # Ensure score doesn't exceed 100
                         score = min(100.0, max(0.0, score))
                         
-                        # Automatically calculate letter grade from numeric score
-                        from assessments.utils import calculate_letter_grade
-                        calculated_letter_grade = calculate_letter_grade(score)
-                        
-                        # Create or update score
-                        score_obj, created = AssessmentScore.objects.update_or_create(
-                            assessment=assessment,
-                            student=enrollment.student,
-                            defaults={
-                                'score': score,
-                                'letter_grade': calculated_letter_grade
-                            }
-                        )
-                    except Exception as e:
-                        messages.error(request, f'Error saving score: {str(e)}')
+                        entries.append({
+                            'assessment_id': assessment.id,
+                            'student_id': enrollment.student.id,
+                            'score': score,
+                        })
+                    except ValueError:
+                        messages.error(request, f'Invalid score for {enrollment.student.get_full_name()} in {assessment.name}.')
+        
+        # Letter grades are calculated by the writer before the scores are saved
+        try:
+            write_scores(entries)
+        except ScoreWritePending:
+            messages.info(request, 'Scores are queued and will be saved shortly.')
+            return redirect('enter_scores', course_id=course_id)
+        except Exception as e:
+            messages.error(request, f'Error saving scores: {str(e)}')
+            return redirect('enter_scores', course_id=course_id)
         
         messages.success(request, 'Scores saved successfully.')
         return redirect('enter_scores', course_id=course_id)
@@ -158,8 +194,6 @@ def manage_lo_assessments(request, course_id, lo_id):
     LO-centric view: Teacher manages which assessments contribute to a specific LO.
     This is the new primary interface for setting LO-Assessment contributions.
     """
-    from courses.models import LearningOutcome
-    
     course = get_object_or_404(Course, id=course_id)
     learning_outcome = get_object_or_404(LearningOutcome, id=lo_id, course=course)
     
@@ -205,20 +239,11 @@ def manage_lo_assessments(request, course_id, lo_id):
                 messages.error(request, f'Sum of contribution percentages must equal 100%. Current sum: {total_percentage}%')
                 return redirect('manage_lo_assessments', course_id=course_id, lo_id=lo_id)
             
-            # Save contributions
-            with transaction.atomic():
-                # Delete existing contributions for this LO
-                AssessmentLOContribution.objects.filter(learning_outcome=learning_outcome).delete()
-                
-                # Create new contributions
-                for assessment_id, percentage in assessment_contributions.items():
-                    if percentage > 0:  # Only create if percentage > 0
-                        assessment = Assessment.objects.get(id=assessment_id)
-                        AssessmentLOContribution.objects.create(
-                            assessment=assessment,
-                            learning_outcome=learning_outcome,
-                            contribution_percentage=percentage
-                        )
+            # Save only what changed against the existing rows
+            _save_contribution_matrix([learning_outcome], {
+                (assessment_id, learning_outcome.id): percentage
+                for assessment_id, percentage in assessment_contributions.items()
+            })
             
             messages.success(request, f'Assessment contributions for {learning_outcome.code} saved successfully.')
             return redirect('manage_lo_assessments', course_id=course_id, lo_id=lo_id)
@@ -229,3 +254,64 @@ def manage_lo_assessments(request, course_id, lo_id):
         'assessments': assessments,
         'contribution_dict': contribution_dict,
     })
+
+
+@teacher_required
+def manage_course_contributions(request, course_id):
+    """
+    Course-wide matrix editor: teacher sets the contribution of every assessment
+    to every Learning Outcome of the course and saves the whole table at once.
+    """
+    course = get_object_or_404(Course, id=course_id)
+    
+    # Verify teacher owns this course
+    if course.teacher != request.user:
+        messages.error(request, 'You do not have permission to manage this course.')
+        return redirect('teacher_courses')
+    
+    structure = CourseStructure.load(course)
+    assessments = structure.assessments
+    learning_outcomes = structure.learning_outcomes
+    
+    if request.method == 'POST':
+        matrix = {}
+        lo_totals = {lo.id: Decimal('0.00') for lo in learning_outcomes}
+        
+        for assessment in assessments:
+            for lo in learning_outcomes:
+                contribution_value = request.POST.get(f'contribution_{assessment.id}_{lo.id}') or '0'
+                try:
+                    percentage = Decimal(str(contribution_value))
+                    # NaN cannot be compared with the bounds below
+                    if not percentage.is_finite():
+                        raise ValueError(contribution_value)
+                except (ValueError, TypeError, ArithmeticError):
+                    messages.error(request, f'Invalid contribution for {assessment.name} to {lo.code}.')
+                    return redirect('manage_course_contributions', course_id=course_id)
+                if percentage < 0 or percentage > 100:
+                    messages.error(request, f'Contribution of {assessment.name} to {lo.code} must be between 0 and 100.')
+                    return redirect('manage_course_contributions', course_id=course_id)
+                matrix[(assessment.id, lo.id)] = percentage
+                lo_totals[lo.id] += percentage
+        
+        # Each LO must either be fully covered (100%) or left empty
+        for lo in learning_outcomes:
+            total = lo_totals[lo.id]
+            if total > 0 and abs(total - Decimal('100.00')) > Decimal('0.01'):
+                messages.error(request, f'Sum of contribution percentages for {lo.code} must equal 100%. Current sum: {total}%')
+                return redirect('manage_course_contributions', course_id=course_id)
+        
+        result = _save_contribution_matrix(learning_outcomes, matrix)
+        messages.success(
+            request,
+            f"Contributions saved: {result['created']} added, {result['updated']} updated, {result['deleted']} removed."
+        )
+        return redirect('manage_course_contributions', course_id=course_id)
+    
+    # Nested lookup for the template: assessment_id -> lo_id -> percentage
+    return render(request, 'teacher/manage_course_contributions.html', {
+        'course': course,
+        'assessments': assessments,
+        'learning_outcomes': learning_outcomes,
+        'contribution_matrix': structure.matrix,
+    })
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from university_sis.admin_tools import EstimatedCountPaginator, KeysetPaginationMixin
 from .models import Course, LearningOutcome, ProgramOutcome, LOPOMapping, Enrollment, AcademicCalendar
 
 
@@ -6,33 +7,48 @@ from .models import Course, LearningOutcome, ProgramOutcome, LOPOMapping, Enroll
 class CourseAdmin(admin.ModelAdmin):
     list_display = ['code', 'name', 'teacher', 'created_at']
     list_filter = ['created_at']
-    search_fields = ['code', 'name']
+    list_select_related = ['teacher']
+    search_fields = ['^code', 'name']
+    autocomplete_fields = ['teacher']
 
 
 @admin.register(LearningOutcome)
 class LearningOutcomeAdmin(admin.ModelAdmin):
     list_display = ['code', 'course', 'description', 'order']
-    list_filter = ['course']
-    search_fields = ['code', 'description']
+    list_select_related = ['course']
+    # Filter by course through search instead of a sidebar listing every course
+    search_fields = ['^code', '=course__code', 'description']
+    autocomplete_fields = ['course']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(ProgramOutcome)
 class ProgramOutcomeAdmin(admin.ModelAdmin):
     list_display = ['code', 'course', 'description', 'order']
-    list_filter = ['course']
-    search_fields = ['code', 'description']
+    list_select_related = ['course']
+    search_fields = ['^code', '=course__code', 'description']
+    autocomplete_fields = ['course']
 
 
 @admin.register(LOPOMapping)
 class LOPOMappingAdmin(admin.ModelAdmin):
     list_display = ['learning_outcome', 'program_outcome', 'contribution_weight']
     list_filter = ['contribution_weight']
+    list_select_related = ['learning_outcome__course', 'program_outcome__course']
+    search_fields = ['=learning_outcome__course__code']
+    autocomplete_fields = ['learning_outcome', 'program_outcome']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Enrollment)
-class EnrollmentAdmin(admin.ModelAdmin):
+class EnrollmentAdmin(KeysetPaginationMixin, admin.ModelAdmin):
     list_display = ['student', 'course', 'enrolled_at']
-    list_filter = ['course', 'enrolled_at']
+    list_filter = ['enrolled_at']
+    list_select_related = ['student', 'course']
+    search_fields = ['=course__code', '^student__email', '^student__surname']
+    autocomplete_fields = ['student', 'course']
 
 
 @admin.register(AcademicCalendar)
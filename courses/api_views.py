@@ -1,19 +1,98 @@
-from rest_framework import viewsets, permissions
+from django.shortcuts import get_object_or_404
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from accounts.models import User
+from assessments.publishing import publish_in_background
+from .caching import course_version
+from .conditional import ConditionalGetMixin, conditional_response, versions_etag, user_paths
 from .models import Course, LearningOutcome, ProgramOutcome, LOPOMapping
+from .roster import get_teacher_rosters, teacher_roster_versions
+from university_sis.api import QueryPlanMixin
 from .serializers import CourseSerializer, LearningOutcomeSerializer, ProgramOutcomeSerializer, LOPOMappingSerializer
 
 
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(ConditionalGetMixin, QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet for Course management."""
     queryset = Course.objects.all()
     serializer_class = CourseSerializer
     permission_classes = [permissions.IsAuthenticated]
+    select_related_plan = {'teacher_name': ['teacher'], 'teacher_detail': ['teacher']}
+    prefetch_plan = {'learning_outcomes': ['learning_outcomes'], 'program_outcomes': ['program_outcomes']}
+    # Users have no timestamp, so the name itself is part of the ETag
+    conditional_related_plan = {
+        'teacher_name': ['teacher__name', 'teacher__surname'],
+        'teacher_detail': user_paths('teacher'),
+    }
+    keyset_ordering = ['code']
+    filter_fields = {'teacher': 'teacher_id'}
+    updated_since_field = 'updated_at'
+    
+    def conditional_versions(self, objects):
+        # Nested learning and program outcomes bump the course version, not updated_at
+        return [course_version(course.id) for course in objects]
     
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             # Only Department Head can modify courses
             return [permissions.IsAuthenticated()]
         return [permissions.IsAuthenticated()]
+    
+    @action(detail=True, methods=['post'], url_path='publish-grades')
+    def publish_grades(self, request, pk=None):
+        """Release the scores of every unpublished assessment of the course (see AssessmentViewSet.publish)."""
+        course = self.get_object()
+        if not (request.user.is_department_head() or course.teacher_id == request.user.id):
+            return Response({'detail': 'You do not have permission to publish grades of this course.'}, status=status.HTTP_403_FORBIDDEN)
+        started = publish_in_background(course.assessments.filter(published_at__isnull=True))
+        return Response({
+            'course': course.id,
+            'publishing': [assessment.id for assessment in started],
+        }, status=status.HTTP_202_ACCEPTED if started else status.HTTP_200_OK)
+    
+    @action(detail=False, methods=['get'])
+    def roster(self, request):
+        """
+        Rosters with grade summaries of the requesting teacher's courses.
+        Department heads pass ?teacher=<id> to read any teacher's rosters.
+        """
+        if request.user.is_department_head():
+            teacher_id = request.query_params.get('teacher', '')
+            if not teacher_id.isdigit():
+                return Response({'teacher': ['A teacher id is required.']}, status=status.HTTP_400_BAD_REQUEST)
+            teacher = get_object_or_404(User, id=teacher_id, role='teacher')
+        elif request.user.is_teacher():
+            teacher = request.user
+        else:
+            return Response({'detail': 'Only teachers can view course rosters.'}, status=status.HTTP_403_FORBIDDEN)
+        
+        course_ids, versions = teacher_roster_versions(teacher)
+        return conditional_response(request, versions_etag(request, versions, course_ids), lambda: self._roster_response(teacher))
+    
+    def _roster_response(self, teacher):
+        return Response([
+            {
+                'course': {'id': item['course'].id, 'code': item['course'].code, 'name': item['course'].name},
+                'student_count': item['student_count'],
+                'assessment_count': item['assessment_count'],
+                'graded_count': item['graded_count'],
+                'average_grade': item['average_grade'],
+                'min_grade': item['min_grade'],
+                'max_grade': item['max_grade'],
+                'students': [
+                    {
+                        'id': row['student'].id,
+                        'name': row['student'].get_full_name(),
+                        'email': row['student'].email,
+                        'enrolled_at': row['enrollment'].enrolled_at,
+                        'total_grade': row['total_grade'],
+                        'letter_grade': row['letter_grade'],
+                    }
+                    for row in item['rows']
+                ],
+            }
+            for item in get_teacher_rosters(teacher)
+        ])
 
 
 class LearningOutcomeViewSet(viewsets.ModelViewSet):
@@ -21,6 +100,8 @@ class LearningOutcomeViewSet(viewsets.ModelViewSet):
     queryset = LearningOutcome.objects.all()
     serializer_class = LearningOutcomeSerializer
     permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = ['course_id', 'code']
+    filter_fields = {'course': 'course_id'}
     
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -34,6 +115,8 @@ class ProgramOutcomeViewSet(viewsets.ModelViewSet):
     queryset = ProgramOutcome.objects.all()
     serializer_class = ProgramOutcomeSerializer
     permission_classes = [permissions.IsAuthenticated]
+    keyset_ordering = ['course_id', 'code']
+    filter_fields = {'course': 'course_id'}
     
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -42,11 +125,21 @@ class ProgramOutcomeViewSet(viewsets.ModelViewSet):
         return [permissions.IsAuthenticated()]
 
 
-class LOPOMappingViewSet(viewsets.ModelViewSet):
+class LOPOMappingViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet for LO-PO Mapping management."""
     queryset = LOPOMapping.objects.all()
     serializer_class = LOPOMappingSerializer
     permission_classes = [permissions.IsAuthenticated]
+    select_related_plan = {
+        'learning_outcome_code': ['learning_outcome'],
+        'program_outcome_code': ['program_outcome'],
+    }
+    keyset_ordering = ['learning_outcome_id', 'program_outcome_id']
+    filter_fields = {
+        'learning_outcome': 'learning_outcome_id',
+        'program_outcome': 'program_outcome_id',
+        'course': 'learning_outcome__course_id',
+    }
     
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -0,0 +1,62 @@
+"""
+Bulk write helpers shared by the course and assessment views.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+
+def sync_percentage_rows(existing, desired, key, build, field='contribution_percentage'):
+    """
+    Make a set of percentage rows match the desired values with as few writes as possible.
+
+    existing: queryset with all current rows in scope (e.g. every contribution for one LO)
+    desired: dict of key -> Decimal percentage; keys with a value of 0 are removed
+    key: function that returns the key of an existing row
+    build: function (key, percentage) -> unsaved model instance for a new row
+
+    Unchanged rows are left alone, so their ids and created_at survive a save.
+    Inserts, updates and deletes are each issued in bulk inside one transaction.
+
+    Returns: dict with 'created', 'updated' and 'deleted' counts
+    """
+    model = existing.model
+    has_updated_at = any(f.name == 'updated_at' for f in model._meta.concrete_fields)
+    now = timezone.now()
+
+    with transaction.atomic():
+        current = {key(row): row for row in existing}
+
+        to_create = []
+        to_update = []
+        for row_key, percentage in desired.items():
+            percentage = Decimal(str(percentage))
+            if percentage <= 0:
+                continue
+            row = current.get(row_key)
+            if row is None:
+                to_create.append(build(row_key, percentage))
+            elif Decimal(str(getattr(row, field))) != percentage:
+                setattr(row, field, percentage)
+                if has_updated_at:
+                    row.updated_at = now
+                to_update.append(row)
+
+        to_delete = [
+            row.pk for row_key, row in current.items()
+            if Decimal(str(desired.get(row_key, 0))) <= 0
+        ]
+
+        if to_delete:
+            model.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            model.objects.bulk_update(to_update, [field, 'updated_at'] if has_updated_at else [field])
+        if to_create:
+            model.objects.bulk_create(to_create)
+
+    return {
+        'created': len(to_create),
+        'updated': len(to_update),
+        'deleted': len(to_delete),
+    }
@@ -0,0 +1,340 @@
+"""
+Versioned caching for per-user pages and fragments.
+
+Every cached value is stored under a key that contains the current numbers of
+the data versions it was built from, for example the scores of one student in
+one course. Changing the data bumps the matching version (see courses.signals
+and the bulk write paths), so the next read builds a new key and the old entry
+simply expires. Nothing is ever deleted by pattern.
+
+The versions live in the CacheVersion table. Every process keeps a copy of it
+and reads the rows changed since its last check at the start of each request
+(see CacheVersionMiddleware), so a bump made by any server process invalidates
+the entries cached in the others, even with a cache local to each process.
+
+Version namespaces:
+    student:<student id>                 enrollments of a student
+    course:<course id>                   course row, structure (LOs, POs, assessments,
+                                         contributions, mappings) and roster
+    course_scores:<course id>            any score in the course
+    scores:<course id>:<student id>      the scores of one student in one course
+    publication:<course id>              which assessments of the course are published
+    department                           department POs and their LO contributions
+    dashboard                            calendar events and announcements
+    results_week                         whether results week mode is on
+
+Recomputation is single-flight (see single_flight): when an entry is missing,
+one request recomputes it while the others serve the previous value of shared
+fragments or wait briefly, and hot entries are refreshed a little before they
+expire instead of all at once when they do.
+
+Hits and misses are counted per fragment name in this process; see cache_stats().
+"""
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .models import CacheVersion
+
+_stats = defaultdict(lambda: {'hits': 0, 'misses': 0, 'stale': 0, 'waits': 0, 'early_refreshes': 0})
+_stats_lock = threading.Lock()
+
+
+def student_version(student_id):
+    return f'student:{student_id}'
+
+
+def course_version(course_id):
+    return f'course:{course_id}'
+
+
+def course_scores_version(course_id):
+    return f'course_scores:{course_id}'
+
+
+def scores_version(course_id, student_id):
+    return f'scores:{course_id}:{student_id}'
+
+
+def publication_version(course_id):
+    return f'publication:{course_id}'
+
+
+DEPARTMENT_VERSION = 'department'
+DASHBOARD_VERSION = 'dashboard'
+RESULTS_WEEK_VERSION = 'results_week'
+
+
+def _timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 60)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# This process's copy of CacheVersion: {namespace: version}
+_versions = {}
+_versions_lock = threading.Lock()
+# time.time() at the start of the last sync, None before the first one
+_synced_at = None
+
+
+def _merge(rows):
+    # Versions only go up; an older read finishing late must not undo a newer one
+    with _versions_lock:
+        for name, version in rows:
+            if version > _versions.get(name, 0):
+                _versions[name] = version
+
+
+def sync_versions(max_age=0):
+    """
+    Read the CacheVersion rows changed since the last sync into this process.
+
+    The first call reads the whole table; later ones read the rows changed
+    since the previous call started, minus CACHE_VERSION_SYNC_OVERLAP seconds
+    for clock differences between servers and bumps committed late. Nothing
+    is read if the last sync started less than max_age seconds ago.
+    """
+    global _synced_at
+    started = time.time()
+    with _versions_lock:
+        since = _synced_at
+    if since is not None and started - since < max_age:
+        return
+
+    rows = CacheVersion.objects.all()
+    if since is not None:
+        overlap = _setting('CACHE_VERSION_SYNC_OVERLAP', 10)
+        rows = rows.filter(changed__gte=int((since - overlap) * 1000))
+    _merge(rows.values_list('namespace', 'version'))
+    with _versions_lock:
+        if _synced_at is None or started > _synced_at:
+            _synced_at = started
+
+
+def get_versions(names):
+    """
+    Return {name: version} for the given namespaces; 0 for one never bumped.
+
+    Reads this process's copy of the versions, synced first if that is older
+    than CACHE_VERSION_MAX_AGE seconds (requests are synced on arrival by
+    CacheVersionMiddleware; this covers threads and worker processes).
+    """
+    sync_versions(max_age=_setting('CACHE_VERSION_MAX_AGE', 1.0))
+    with _versions_lock:
+        return {name: _versions.get(name, 0) for name in names}
+
+
+def _bump(names):
+    changed = int(time.time() * 1000)
+    with transaction.atomic():
+        CacheVersion.objects.bulk_create(
+            [CacheVersion(namespace=name, version=0, changed=changed) for name in names],
+            ignore_conflicts=True
+        )
+        # Never below the current time, so versions keep going up even if the table is restored from a backup
+        CacheVersion.objects.filter(namespace__in=names).update(
+            version=Greatest(F('version') + 1, Value(changed)), changed=changed
+        )
+        bumped = list(CacheVersion.objects.filter(namespace__in=names).values_list('namespace', 'version'))
+    # This process sees its own writes without waiting for the next sync
+    _merge(bumped)
+
+
+def bump_versions(*names):
+    """
+    Invalidate everything cached under the given namespaces, in every process.
+
+    Inside a transaction the bump is deferred until commit, so a concurrent
+    reader cannot cache data from before the commit under the new version.
+    """
+    names = set(names)
+    if names:
+        transaction.on_commit(lambda: _bump(names))
+
+
+def _set(values):
+    changed = int(time.time() * 1000)
+    CacheVersion.objects.bulk_create(
+        [CacheVersion(namespace=name, version=version, changed=changed) for name, version in values.items()],
+        update_conflicts=True, unique_fields=['namespace'], update_fields=['version', 'changed']
+    )
+    _merge(values.items())
+
+
+def set_versions(values):
+    """
+    Set namespaces to the given {name: version} on commit.
+
+    Used when entries were stored ahead of time under versions chosen in
+    advance (see assessments.publishing); the new numbers must be higher than
+    any used before, e.g. a fresh millisecond timestamp.
+    """
+    if values:
+        values = dict(values)
+        transaction.on_commit(lambda: _set(values))
+
+
+def record(name, hit):
+    """Count a cache hit or miss for a fragment name."""
+    _count(name, 'hits' if hit else 'misses')
+
+
+def _count(name, field):
+    if name:
+        with _stats_lock:
+            _stats[name][field] += 1
+
+
+def cache_stats():
+    """
+    Return {fragment name: {'hits', 'misses', 'hit_rate', 'stale', 'waits',
+    'early_refreshes'}} for this process. Stale values served count as hits.
+    """
+    with _stats_lock:
+        stats = {name: dict(counts) for name, counts in _stats.items()}
+    for counts in stats.values():
+        total = counts['hits'] + counts['misses']
+        counts['hit_rate'] = round(counts['hits'] / total, 3) if total else None
+    return stats
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+class _Entry:
+    """A cached value with its computation time and expiry, for early refresh."""
+    __slots__ = ('value', 'cost', 'expires_at')
+
+    def __init__(self, value, cost, expires_at):
+        self.value = value
+        self.cost = cost
+        self.expires_at = expires_at
+
+    def __getstate__(self):
+        return (self.value, self.cost, self.expires_at)
+
+    def __setstate__(self, state):
+        self.value, self.cost, self.expires_at = state
+
+
+def _refresh_early(entry, now):
+    """
+    Probabilistic early refresh ("XFetch"): the closer the entry is to expiry,
+    and the longer it took to compute, the likelier a hit recomputes it now.
+    """
+    if entry.expires_at is None:
+        return False
+    beta = _setting('CACHE_EARLY_REFRESH_BETA', 1.0)
+    return now - entry.cost * beta * math.log(1.0 - random.random()) >= entry.expires_at
+
+
+def single_flight(key, compute, timeout, stale_key=None, refresh=False, name=None):
+    """
+    Read-through cache entry that only one request at a time recomputes.
+
+    On a miss, the request that adds the lock entry lock:<key> computes the
+    value; the others return the last value kept under stale_key if given,
+    or wait up to SINGLE_FLIGHT_WAIT seconds for the new one (and compute it
+    themselves if it does not arrive, e.g. because the holder died).
+
+    refresh: compute and store without looking at the cache or the lock
+    name: fragment name for the hit/miss counters
+
+    Returns (value, hit).
+    """
+    lock_key = f'lock:{key}'
+    lock_timeout = _setting('SINGLE_FLIGHT_LOCK_TIMEOUT', 30)
+
+    def compute_and_store():
+        started = time.time()
+        value = compute()
+        now = time.time()
+        entry = _Entry(value, now - started, None if timeout is None else now + timeout)
+        cache.set(key, entry, timeout)
+        if stale_key:
+            cache.set(stale_key, entry, _setting('STALE_CACHE_TIMEOUT', 24 * 60 * 60))
+        return value
+
+    def compute_locked():
+        try:
+            return compute_and_store()
+        finally:
+            cache.delete(lock_key)
+
+    if refresh:
+        return compute_and_store(), False
+
+    entry = cache.get(key)
+    if isinstance(entry, _Entry):
+        # One request renews a hot entry before it expires; the rest keep using it
+        if _refresh_early(entry, time.time()) and cache.add(lock_key, 1, lock_timeout):
+            _count(name, 'early_refreshes')
+            return compute_locked(), True
+        return entry.value, True
+
+    if cache.add(lock_key, 1, lock_timeout):
+        return compute_locked(), False
+
+    # Someone else is computing it
+    stale = cache.get(stale_key) if stale_key else None
+    if isinstance(stale, _Entry):
+        _count(name, 'stale')
+        return stale.value, True
+
+    _count(name, 'waits')
+    deadline = time.time() + _setting('SINGLE_FLIGHT_WAIT', 2.0)
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if isinstance(entry, _Entry):
+            return entry.value, True
+    return compute_and_store(), False
+
+
+def cached(name, parts, versions, compute, timeout=None, overrides=None, refresh=False, stale_ok=False):
+    """
+    Return the cached value of a fragment, computing and storing it on a miss.
+
+    name: fragment name, used for the key and the hit/miss counters
+    parts: values that identify the fragment (e.g. student id, course id)
+    versions: namespaces the fragment is built from
+    compute: callable returning the value; it must be picklable
+    overrides: {namespace: version} used instead of the current versions,
+               to store a value under a key that only becomes current later
+    refresh: compute and store the value even if it is cached
+    stale_ok: while the value is being recomputed after a version change,
+              other requests may get the previous value instead of waiting;
+              for fragments shared by many users, like class averages
+    """
+    current = get_versions(versions)
+    if overrides:
+        current.update({version: value for version, value in overrides.items() if version in current})
+    version_part = '.'.join(f'{version}={current[version]}' for version in sorted(current))
+    if len(version_part) > 64:
+        # Fragments of many courses depend on many versions; keep keys short
+        version_part = hashlib.md5(version_part.encode()).hexdigest()
+    identity = f'page:{name}:{":".join(str(part) for part in parts)}'
+
+    # Values stored ahead of time under future versions must not become the stale copy
+    stale_key = f'{identity}:stale' if stale_ok and not overrides else None
+    value, hit = single_flight(
+        f'{identity}:{version_part}', compute,
+        _timeout() if timeout is None else timeout,
+        stale_key=stale_key, refresh=refresh, name=name
+    )
+    record(name, hit)
+    return value
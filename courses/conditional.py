@@ -0,0 +1,174 @@
+"""
+HTTP conditional requests (ETag / Last-Modified) for pages and the API.
+
+Pages: conditional_page(etag_func) wraps a view in django's condition()
+decorator. etag_func returns the data versions the page is built from (see
+courses.caching), which are read from memory, so a browser revalidating an
+unchanged page gets a 304 before the view computes anything.
+
+API: ConditionalGetMixin answers list and retrieve requests of a viewset with
+ETags built from the ids and updated_at of the rows on the page (the page
+query runs anyway) and of the related rows their fields show, plus the
+versions given by conditional_versions(), before anything is serialized.
+
+Every ETag also covers the user, the URL with its query string, the CSRF
+cookie (pages embed the token) and PAGE_ETAG_RELEASE, which is changed on
+deploys that change templates. Responses are marked private, no-cache, so
+clients keep them but revalidate on every use.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+from rest_framework.response import Response
+
+from .caching import get_versions
+
+
+def make_etag(request, *parts):
+    """An ETag (unquoted) for what the requesting user sees at this URL, given the data parts."""
+    user = request.user
+    key = repr((
+        getattr(settings, 'PAGE_ETAG_RELEASE', ''),
+        user.pk,
+        user.get_full_name() if user.is_authenticated else None,
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+        request.get_full_path(),
+        parts,
+    ))
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def versions_etag(request, names, *parts):
+    """An ETag from the current versions of the given namespaces."""
+    versions = get_versions(names)
+    return make_etag(request, sorted(versions.items()), *parts)
+
+
+def conditional_page(etag_func):
+    """
+    Decorator for GET pages: 304 when etag_func(request, *args, **kwargs)
+    matches If-None-Match. etag_func returns an ETag or None to skip the
+    check (e.g. for a redirect). Place it under the role decorator, so only
+    users allowed to see the page are answered.
+    """
+    def page_etag(request, *args, **kwargs):
+        # A page with pending messages renders them once; never replace it with a cached copy
+        if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+            return None
+        return etag_func(request, *args, **kwargs)
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=page_etag)(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.has_header('ETag'):
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return wrapper
+    return decorator
+
+
+def _finish(response, etag, last_modified=None):
+    if response.status_code in (200, 304):
+        response['ETag'] = quote_etag(etag)
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_response(request, etag, build, last_modified=None):
+    """
+    Return a 304 if the request's validators match, otherwise build() (a DRF
+    Response); either way with the ETag and Last-Modified headers.
+    """
+    response = get_conditional_response(request, etag=quote_etag(etag), last_modified=last_modified)
+    if response is None:
+        response = build()
+    return _finish(response, etag, last_modified)
+
+
+# UserSerializer fields that can change; users have no timestamp, so their values go in the ETag
+USER_ETAG_FIELDS = ['username', 'email', 'name', 'surname', 'role', 'is_active']
+
+
+def user_paths(relation):
+    """conditional_related_plan paths for a user serialized (e.g. with ?expand) through the relation."""
+    return [f'{relation}__{field}' for field in USER_ETAG_FIELDS]
+
+
+def _related_value(row, path):
+    value = row
+    for name in path.split('__'):
+        if value is None:
+            break
+        value = getattr(value, name)
+    return value
+
+
+class ConditionalGetMixin:
+    """
+    ETag support for the list and retrieve actions of a ModelViewSet.
+
+    conditional_timestamp_field: field updated on every change of a row
+    conditional_versions(objects): namespaces of related data the serializer
+        includes (e.g. course_version for nested learning outcomes) for the
+        objects of the page, or [instance] for retrieve
+    conditional_related_plan: {serializer field: [paths]} of the related rows'
+        timestamps, or of the values themselves for rows without one, that a
+        field shows (e.g. {'student_name': ['student__name', ...]}); only the
+        fields in the response count, and QueryPlanMixin has loaded those rows
+
+    Last-Modified is only sent by retrieve without versions or related rows,
+    where the row's own timestamp covers every change.
+    """
+    conditional_timestamp_field = 'updated_at'
+    conditional_related_plan = {}
+
+    def conditional_versions(self, objects):
+        return []
+
+    def _conditional_rows(self, rows):
+        fields = set(self.get_serializer().fields)
+        paths = [path for name, paths in self.conditional_related_plan.items() if name in fields for path in paths]
+        return [
+            (row.pk, getattr(row, self.conditional_timestamp_field), *[_related_value(row, path) for path in paths])
+            for row in rows
+        ], bool(paths)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else list(queryset)
+        etag = versions_etag(
+            request,
+            self.conditional_versions(rows),
+            self._conditional_rows(rows)[0],
+            # A row added after the last one of the page only shows in the next link
+            self.paginator.get_next_link() if page is not None else None,
+        )
+
+        def build():
+            serializer = self.get_serializer(rows, many=True)
+            if page is not None:
+                return self.get_paginated_response(serializer.data)
+            return Response(serializer.data)
+        return conditional_response(request, etag, build)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        timestamp = getattr(instance, self.conditional_timestamp_field)
+        names = self.conditional_versions([instance])
+        [row], related = self._conditional_rows([instance])
+        etag = versions_etag(request, names, row)
+        last_modified = int(timestamp.timestamp()) if timestamp is not None and not (names or related) else None
+        return conditional_response(
+            request, etag, lambda: Response(self.get_serializer(instance).data), last_modified=last_modified
+        )
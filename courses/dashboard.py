@@ -0,0 +1,72 @@
+"""
+Shared, cached dashboard content: academic calendar and announcements.
+
+The student, teacher and department head dashboards all show the same ten
+calendar events and ten active announcements. That content changes a few
+times a week, so it is read from the cache together with its rendered HTML
+fragments. All keys carry the dashboard version; saving or deleting an
+AcademicCalendar or Announcement bumps it (see courses.signals and courses.caching),
+which makes every dashboard pick up fresh content on its next hit. The first
+request after a bump rebuilds the content while the others keep showing the
+previous one (see courses.caching.single_flight).
+"""
+from django.conf import settings
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from announcements.models import Announcement
+from .caching import record, single_flight, get_versions, bump_versions, DASHBOARD_VERSION
+from .models import AcademicCalendar
+
+# Fragments shared by the student and teacher dashboards
+FRAGMENTS = {
+    'calendar_events_html': 'dashboard/calendar_events.html',
+    'announcements_html': 'dashboard/announcements.html',
+}
+
+
+def _timeout():
+    return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 60 * 60)
+
+
+def _version():
+    return get_versions([DASHBOARD_VERSION])[DASHBOARD_VERSION]
+
+
+def invalidate_dashboard_context():
+    """Make every dashboard reload the calendar and announcements on its next hit."""
+    bump_versions(DASHBOARD_VERSION)
+
+
+def _build_context(fragments):
+    context = {
+        'calendar_events': list(AcademicCalendar.objects.all()[:10]),
+        'announcements': list(Announcement.objects.filter(is_active=True)[:10]),
+    }
+    if fragments:
+        for name, template_name in FRAGMENTS.items():
+            context[name] = render_to_string(template_name, {
+                'calendar_events': context['calendar_events'],
+                'announcements': context['announcements'],
+            })
+    return context
+
+
+def get_dashboard_context(fragments=True):
+    """
+    Return the shared dashboard context: calendar_events, announcements and,
+    unless fragments=False, their rendered HTML fragments.
+    Runs no queries when the cache is warm.
+    """
+    variant = 'fragments' if fragments else 'data'
+    context, hit = single_flight(
+        f'dashboard:{_version()}:{variant}', lambda: _build_context(fragments), _timeout(),
+        stale_key=f'dashboard:stale:{variant}', name='dashboard'
+    )
+    record('dashboard', hit)
+
+    context = dict(context)
+    for name in FRAGMENTS:
+        if name in context:
+            context[name] = mark_safe(context[name])
+    return context
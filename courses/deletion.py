@@ -0,0 +1,121 @@
+"""
+Fast, set-based deletes for courses, assessments and students.
+
+Django's default delete() collects every dependent row into memory before
+deleting it, which is slow for a large course and holds the SQLite write lock
+for the whole time. The functions here remove the dependents with one DELETE
+statement per table, in dependency order, inside one transaction. The root
+rows are deleted last through the regular delete() so that any relation not
+listed here (SET_NULL references, admin log entries, ...) is still handled.
+
+Note: the set-based steps do not send pre_delete/post_delete signals, so the
+cached page versions of everything affected are bumped, and the pre-rendered
+reports (see courses.reports) of removed enrollments deleted, here explicitly.
+"""
+from django.db import transaction
+from django.db.models import Q
+
+from accounts.models import User
+from .caching import bump_versions, course_version, course_scores_version, student_version, DEPARTMENT_VERSION
+from assessments.models import Assessment, AssessmentScore, AssessmentLOContribution
+from .models import Course, LearningOutcome, ProgramOutcome, LOPOMapping, Enrollment, DepartmentLOPOContribution
+from .reports import delete_reports, delete_course_reports
+
+
+def _course_plan(course_ids):
+    """Dependents of the given courses, leaf tables first."""
+    assessments = Assessment.objects.filter(course_id__in=course_ids).values('id')
+    learning_outcomes = LearningOutcome.objects.filter(course_id__in=course_ids).values('id')
+    program_outcomes = ProgramOutcome.objects.filter(course_id__in=course_ids).values('id')
+    return [
+        ('Assessment scores', AssessmentScore.objects.filter(assessment_id__in=assessments)),
+        ('Assessment LO contributions', AssessmentLOContribution.objects.filter(
+            Q(assessment_id__in=assessments) | Q(learning_outcome_id__in=learning_outcomes)
+        )),
+        ('Department PO contributions', DepartmentLOPOContribution.objects.filter(learning_outcome_id__in=learning_outcomes)),
+        ('LO-PO mappings', LOPOMapping.objects.filter(
+            Q(learning_outcome_id__in=learning_outcomes) | Q(program_outcome_id__in=program_outcomes)
+        )),
+        ('Assessments', Assessment.objects.filter(course_id__in=course_ids)),
+        ('Enrollments', Enrollment.objects.filter(course_id__in=course_ids)),
+        ('Learning outcomes', LearningOutcome.objects.filter(course_id__in=course_ids)),
+        ('Program outcomes', ProgramOutcome.objects.filter(course_id__in=course_ids)),
+    ], ('Courses', Course.objects.filter(id__in=course_ids))
+
+
+def _assessment_plan(assessment_ids):
+    """Dependents of the given assessments, leaf tables first."""
+    return [
+        ('Assessment scores', AssessmentScore.objects.filter(assessment_id__in=assessment_ids)),
+        ('Assessment LO contributions', AssessmentLOContribution.objects.filter(assessment_id__in=assessment_ids)),
+    ], ('Assessments', Assessment.objects.filter(id__in=assessment_ids))
+
+
+def _student_plan(student_ids):
+    """Dependents of the given students, leaf tables first."""
+    return [
+        ('Assessment scores', AssessmentScore.objects.filter(student_id__in=student_ids)),
+        ('Enrollments', Enrollment.objects.filter(student_id__in=student_ids)),
+    ], ('Students', User.objects.filter(id__in=student_ids, role='student'))
+
+
+def _preview(plan):
+    steps, (root_label, root) = plan
+    counts = [(label, queryset.count()) for label, queryset in steps]
+    counts.append((root_label, root.count()))
+    return counts
+
+
+def _execute(plan, versions, on_commit=None):
+    steps, (root_label, root) = plan
+    counts = []
+    with transaction.atomic():
+        bump_versions(*versions)
+        if on_commit is not None:
+            transaction.on_commit(on_commit)
+        for label, queryset in steps:
+            counts.append((label, queryset._raw_delete(queryset.db)))
+        deleted, per_model = root.delete()
+        counts.append((root_label, per_model.get(root.model._meta.label, 0)))
+    return counts
+
+
+def preview_course_delete(course_ids):
+    """Return [(label, row count), ...] that deleting the courses would remove."""
+    return _preview(_course_plan(course_ids))
+
+
+def delete_courses(course_ids):
+    """Delete courses and everything that depends on them. Returns [(label, rows deleted), ...]."""
+    student_ids = Enrollment.objects.filter(course_id__in=course_ids).values_list('student_id', flat=True).distinct()
+    versions = [course_version(course_id) for course_id in course_ids]
+    versions += [student_version(student_id) for student_id in student_ids]
+    versions.append(DEPARTMENT_VERSION)
+    return _execute(_course_plan(course_ids), versions, lambda: delete_course_reports(course_ids))
+
+
+def preview_assessment_delete(assessment_ids):
+    """Return [(label, row count), ...] that deleting the assessments would remove."""
+    return _preview(_assessment_plan(assessment_ids))
+
+
+def delete_assessments(assessment_ids):
+    """Delete assessments with their scores and LO contributions. Returns [(label, rows deleted), ...]."""
+    course_ids = Assessment.objects.filter(id__in=assessment_ids).values_list('course_id', flat=True).distinct()
+    versions = [course_version(course_id) for course_id in course_ids]
+    versions += [course_scores_version(course_id) for course_id in course_ids]
+    return _execute(_assessment_plan(assessment_ids), versions)
+
+
+def preview_student_delete(student_ids):
+    """Return [(label, row count), ...] that deleting the students would remove."""
+    return _preview(_student_plan(student_ids))
+
+
+def delete_students(student_ids):
+    """Delete students with their scores and enrollments. Returns [(label, rows deleted), ...]."""
+    pairs = list(Enrollment.objects.filter(student_id__in=student_ids).values_list('student_id', 'course_id'))
+    course_ids = {course_id for _, course_id in pairs}
+    versions = [course_version(course_id) for course_id in course_ids]
+    versions += [course_scores_version(course_id) for course_id in course_ids]
+    return _execute(_student_plan(student_ids), versions, lambda: delete_reports(pairs))
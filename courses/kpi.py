@@ -0,0 +1,139 @@
+"""
+Department KPI panel for the department head dashboard.
+
+All figures come from a handful of aggregate queries over the whole
+department; none of them loops over courses or students in Python:
+
+    1. user counts by role
+    2. every course with its catalog figures (Course.objects.with_outcome_summary)
+    3. missing grades per course, from one anti-join (see missing_grades)
+
+The result is cached for DEPARTMENT_KPI_CACHE_TIMEOUT seconds and can be
+recomputed on demand with get_department_kpis(refresh=True). When it expires
+one request recomputes it and the others keep showing the previous panel
+(see courses.caching.single_flight).
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from accounts.models import User
+from assessments.models import AssessmentScore
+from .caching import record, single_flight
+from .models import Course, Enrollment, LearningOutcome, LOPOMapping, _subquery_count
+
+KPI_CACHE_KEY = 'department_kpis'
+KPI_STALE_KEY = 'department_kpis:stale'
+
+
+def _timeout():
+    return getattr(settings, 'DEPARTMENT_KPI_CACHE_TIMEOUT', 5 * 60)
+
+
+def missing_grades(courses=None):
+    """
+    Enrollment rows annotated with assessment_id, one row per (student,
+    assessment) pair of the same course that has no AssessmentScore.
+
+    This is a single anti-join: enrollments are joined to the assessments of
+    their course and pairs with a matching score are dropped with NOT EXISTS.
+    """
+    queryset = Enrollment.objects.all()
+    if courses is not None:
+        queryset = queryset.filter(course__in=courses)
+    return queryset.annotate(
+        assessment_id=F('course__assessments__id')
+    ).filter(
+        assessment_id__isnull=False
+    ).filter(
+        ~Exists(AssessmentScore.objects.filter(assessment_id=OuterRef('assessment_id'), student_id=OuterRef('student_id')))
+    )
+
+
+def _course_issues(course):
+    """Human readable problems with the structure of an annotated course."""
+    issues = []
+    if course.assessment_count == 0:
+        issues.append('No assessments')
+    elif course.total_weight != Decimal('100.00'):
+        issues.append(f'Assessment weights add up to {course.total_weight}%')
+    if course.lo_count == 0:
+        issues.append('No learning outcomes')
+    else:
+        if course.complete_lo_count < course.lo_count:
+            issues.append(f'{course.lo_count - course.complete_lo_count} LO(s) without 100% assessment contributions')
+        if course.unmapped_lo_count:
+            issues.append(f'{course.unmapped_lo_count} LO(s) not mapped to a PO')
+    if course.teacher_id is None:
+        issues.append('No teacher assigned')
+    return issues
+
+
+def compute_department_kpis():
+    """Compute the KPI panel from scratch (three queries)."""
+    users = User.objects.aggregate(
+        students=Count('id', filter=Q(role='student')),
+        teachers=Count('id', filter=Q(role='teacher')),
+    )
+
+    unmapped_los = LearningOutcome.objects.filter(course=OuterRef('pk')).filter(
+        ~Exists(LOPOMapping.objects.filter(learning_outcome=OuterRef('pk')))
+    )
+    courses = list(
+        Course.objects.with_outcome_summary()
+        .annotate(unmapped_lo_count=_subquery_count(unmapped_los, 'course'))
+        .select_related('teacher')
+        .order_by('code')
+    )
+
+    missing_by_course = dict(
+        missing_grades().order_by().values('course_id').annotate(missing=Count('id')).values_list('course_id', 'missing')
+    )
+
+    rows = []
+    expected_total = missing_total = 0
+    for course in courses:
+        expected = course.enrollment_count * course.assessment_count
+        missing = missing_by_course.get(course.id, 0)
+        expected_total += expected
+        missing_total += missing
+        rows.append({
+            'id': course.id,
+            'code': course.code,
+            'name': course.name,
+            'teacher': f'{course.teacher.name} {course.teacher.surname}' if course.teacher else None,
+            'enrollment_count': course.enrollment_count,
+            'assessment_count': course.assessment_count,
+            'lo_count': course.lo_count,
+            'po_count': course.po_count,
+            'total_weight': course.total_weight,
+            'expected_grades': expected,
+            'missing_grades': missing,
+            'grading_completion': round(100 * (expected - missing) / expected, 1) if expected else None,
+            'issues': _course_issues(course),
+        })
+
+    return {
+        'computed_at': timezone.now(),
+        'student_count': users['students'],
+        'teacher_count': users['teachers'],
+        'course_count': len(rows),
+        'enrollment_count': sum(row['enrollment_count'] for row in rows),
+        'expected_grades': expected_total,
+        'missing_grades': missing_total,
+        'grading_completion': round(100 * (expected_total - missing_total) / expected_total, 1) if expected_total else None,
+        'incomplete_course_count': sum(1 for row in rows if row['issues']),
+        'courses': rows,
+    }
+
+
+def get_department_kpis(refresh=False):
+    """Return the cached KPI panel, recomputing it when refresh=True or when it has expired."""
+    kpis, hit = single_flight(
+        KPI_CACHE_KEY, compute_department_kpis, _timeout(),
+        stale_key=KPI_STALE_KEY, refresh=refresh, name='department_kpis'
+    )
+    record('department_kpis', hit)
+    return kpis
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.models import Course, Enrollment
+from courses.reports import publish_reports
+
+
+class Command(BaseCommand):
+    help = 'Pre-render student course reports to static files; reports that are still current are skipped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', action='append', dest='courses', metavar='CODE',
+                            help='Only publish this course (may be repeated)')
+        parser.add_argument('--workers', type=int, help='Rendering processes (default: all cores)')
+        parser.add_argument('--chunk-size', type=int, default=50, help='Reports per pool task (default: 50)')
+
+    def handle(self, *args, **options):
+        enrollments = Enrollment.objects.all()
+        if options['courses']:
+            courses = list(Course.objects.filter(code__in=options['courses']))
+            unknown = set(options['courses']) - {course.code for course in courses}
+            if unknown:
+                raise CommandError(f'Unknown course code(s): {", ".join(sorted(unknown))}')
+            enrollments = enrollments.filter(course__in=courses)
+
+        def progress(done, total):
+            self.stdout.write(f'Checked {done}/{total} reports')
+
+        written = publish_reports(
+            enrollments,
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            progress=progress
+        )
+        self.stdout.write(self.style.SUCCESS(f'Published {written} reports.'))
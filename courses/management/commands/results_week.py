@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import User
+from courses.results_week import (
+    enter_results_week, leave_results_week, rebuild_snapshots, stale_snapshot_student_ids, snapshot_freshness
+)
+
+
+class Command(BaseCommand):
+    help = 'Switch results week mode on or off, or rebuild the student snapshots it serves.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['enter', 'leave', 'refresh', 'status'],
+                            help='enter: build all snapshots and switch on; leave: switch off and drop them; '
+                                 'refresh: rebuild stale and missing snapshots; status: print freshness')
+        parser.add_argument('--all', action='store_true', help='With refresh: rebuild every snapshot')
+
+    def handle(self, *args, **options):
+        action = options['action']
+
+        def progress(done, total):
+            self.stdout.write(f'Built {done}/{total} snapshots')
+
+        if action == 'enter':
+            written = enter_results_week(progress=progress)
+            self.stdout.write(self.style.SUCCESS(f'Results week mode is on, {written} snapshots built.'))
+        elif action == 'leave':
+            leave_results_week()
+            self.stdout.write(self.style.SUCCESS('Results week mode is off.'))
+        elif action == 'refresh':
+            students = User.objects.filter(role='student')
+            if not options['all']:
+                students = students.filter(id__in=stale_snapshot_student_ids()) | students.filter(
+                    results_snapshot__isnull=True
+                )
+            written = rebuild_snapshots(students.order_by('id'), progress=progress)
+            self.stdout.write(self.style.SUCCESS(f'{written} snapshots rebuilt.'))
+
+        freshness = snapshot_freshness()
+        self.stdout.write(
+            f'Mode: {"on" if freshness["results_week"] else "off"}; '
+            f'{freshness["snapshot_count"]}/{freshness["student_count"]} students have a snapshot, '
+            f'{freshness["stale_count"]} stale, oldest built at {freshness["oldest_built_at"] or "-"}.'
+        )
@@ -0,0 +1,20 @@
+from .caching import sync_versions
+
+
+class CacheVersionMiddleware:
+    """
+    Reads the cache versions bumped since the last request into this process
+    before the view runs (see courses.caching.sync_versions), so nothing
+    cached here is served after a write made by another process.
+    Comes after AdmissionControlMiddleware so rejected requests skip the query.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        sync_versions()
+        return None
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_departmentprogramoutcome_departmentlopocontribution'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='learningoutcome',
+            index=models.Index(fields=['code'], name='courses_lo_code_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:26
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_cache_version'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='learningoutcome',
+            name='courses_lo_code_idx',
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(django.db.models.functions.text.Lower('code'), name='courses_course_code_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='learningoutcome',
+            index=models.Index(django.db.models.functions.text.Lower('code'), name='courses_lo_code_lower_idx'),
+        ),
+    ]
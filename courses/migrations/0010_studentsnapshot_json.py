@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+def delete_snapshots(apps, schema_editor):
+    # Pickled snapshots cannot be converted; students get the regular pages until they are rebuilt
+    apps.get_model('courses', 'StudentSnapshot').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_course_name_lower_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_snapshots, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='studentsnapshot',
+            name='data',
+        ),
+        migrations.AddField(
+            model_name='studentsnapshot',
+            name='data',
+            field=models.JSONField(default=dict),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='studentsnapshot',
+            name='versions',
+            field=models.JSONField(default=dict),
+        ),
+    ]
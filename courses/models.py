@@ -1,8 +1,67 @@
+from decimal import Decimal
+from django.apps import apps
 from django.db import models
+from django.db.models import Count, Sum, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Lower
 from django.core.validators import MinValueValidator, MaxValueValidator
 from accounts.models import User
 
 
+def _subquery_count(queryset, group_field):
+    """Correlated COUNT(*) of queryset rows, grouped by group_field; 0 when there are none."""
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values(group_field).annotate(count=Count('pk')).values('count')[:1],
+            output_field=models.IntegerField()
+        ),
+        Value(0)
+    )
+
+
+class CourseQuerySet(models.QuerySet):
+    def with_outcome_summary(self):
+        """
+        Annotate every course with catalog figures in a single query:
+
+        lo_count, po_count, enrollment_count, assessment_count,
+        total_weight (sum of assessment weights) and
+        complete_lo_count (LOs whose assessment contributions add up to 100%).
+
+        Each figure is a correlated subquery, so the counts do not multiply
+        each other the way several joined Count() annotations would.
+        """
+        Assessment = apps.get_model('assessments', 'Assessment')
+        AssessmentLOContribution = apps.get_model('assessments', 'AssessmentLOContribution')
+
+        lo_total = Subquery(
+            AssessmentLOContribution.objects.filter(learning_outcome=OuterRef('pk'))
+            .order_by().values('learning_outcome')
+            .annotate(total=Sum('contribution_percentage')).values('total')[:1],
+            output_field=models.DecimalField(max_digits=7, decimal_places=2)
+        )
+        complete_los = LearningOutcome.objects.filter(course=OuterRef('pk')).annotate(
+            contribution_total=lo_total
+        ).filter(contribution_total__gte=Decimal('99.99'), contribution_total__lte=Decimal('100.01'))
+
+        return self.annotate(
+            lo_count=_subquery_count(LearningOutcome.objects.filter(course=OuterRef('pk')), 'course'),
+            po_count=_subquery_count(ProgramOutcome.objects.filter(course=OuterRef('pk')), 'course'),
+            enrollment_count=_subquery_count(Enrollment.objects.filter(course=OuterRef('pk')), 'course'),
+            assessment_count=_subquery_count(Assessment.objects.filter(course=OuterRef('pk')), 'course'),
+            complete_lo_count=_subquery_count(complete_los, 'course'),
+            total_weight=Coalesce(
+                Subquery(
+                    Assessment.objects.filter(course=OuterRef('pk'))
+                    .order_by().values('course')
+                    .annotate(total=Sum('weight_percentage')).values('total')[:1],
+                    output_field=models.DecimalField(max_digits=7, decimal_places=2)
+                ),
+                Value(Decimal('0.00')),
+                output_field=models.DecimalField(max_digits=7, decimal_places=2)
+            ),
+        )
+
+
 class Course(models.Model):
     """
     Course model with assigned teacher.
@@ -21,8 +80,15 @@ class Course(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CourseQuerySet.as_manager()
+    
     class Meta:
         ordering = ['code']
+        indexes = [
+            # Case-insensitive prefix search on code and name (see accounts.pagination.prefix_search)
+            models.Index(Lower('code'), name='courses_course_code_lower_idx'),
+            models.Index(Lower('name'), name='courses_course_name_lower_idx'),
+        ]
     
     def __str__(self):
         return f"{self.code} - {self.name}"
@@ -41,6 +107,10 @@ class LearningOutcome(models.Model):
     class Meta:
         ordering = ['course', 'order', 'code']
         unique_together = [['course', 'code']]
+        indexes = [
+            # LO picker searches by code prefix across all courses (see accounts.pagination.prefix_condition)
+            models.Index(Lower('code'), name='courses_lo_code_lower_idx'),
+        ]
     
     def __str__(self):
         return f"{self.course.code} - {self.code}"
@@ -185,3 +255,53 @@ class DepartmentLOPOContribution(models.Model):
     
     def __str__(self):
         return f"{self.learning_outcome.code} → {self.department_program_outcome.code} ({self.contribution_percentage}%)"
+
+
+class ResultsWeek(models.Model):
+    """
+    A results release period. While a period has no end, student pages are
+    served from StudentSnapshot rows instead of live queries (see courses.results_week).
+    """
+    started_at = models.DateTimeField(auto_now_add=True)
+    ended_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-started_at']
+    
+    def __str__(self):
+        return f"Results week from {self.started_at:%Y-%m-%d %H:%M}"
+
+
+class StudentSnapshot(models.Model):
+    """
+    Precomputed data of one student's pages: course list, grade tables,
+    PO charts and class averages of every enrolled course, as JSON, with the
+    data versions it was built from.
+    """
+    student = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='results_snapshot',
+        limit_choices_to={'role': 'student'}
+    )
+    data = models.JSONField()
+    versions = models.JSONField(default=dict)
+    built_at = models.DateTimeField(db_index=True)
+    
+    def __str__(self):
+        return f"Snapshot of {self.student.get_full_name()} at {self.built_at:%Y-%m-%d %H:%M}"
+
+
+class CacheVersion(models.Model):
+    """
+    Version number of one cache namespace (see courses.caching). Each server
+    process reads the rows changed since its last check at the start of every
+    request, so a write in one process invalidates what the others cached.
+    """
+    namespace = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField(default=0)
+    # Milliseconds since the epoch of the last change, for incremental reads
+    changed = models.BigIntegerField(db_index=True)
+    
+    def __str__(self):
+        return f"{self.namespace} = {self.version}"
@@ -0,0 +1,328 @@
+"""
+Pre-rendered student course reports.
+
+The body of a student's course page (grade table, LO/PO tables and the chart
+scripts) is rendered to STUDENT_REPORTS_DIR/<course id>/<student id>.html,
+next to a .json file with the chart data and the data versions (see
+courses.caching) the report was built from. student_course_detail serves the
+file while those versions are current and renders live when it is stale.
+
+Reports are published across a process pool: for everything or selected
+courses with manage.py publish_student_reports, and for whole courses after
+their grades change, in a small background pool (see ReportPublisher). With
+STUDENT_REPORTS_PUBLISH_ON_WRITE turned off, publish_student_reports has to
+run on a schedule instead, or every changed report is rendered live. The versions are read by the publishing
+process before the workers read any data, so a change made while a report
+is being rendered always leaves that report stale rather than wrong.
+Deleting an enrollment or a course removes its report files.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from university_sis.workers import django_process_pool
+
+from .caching import (
+    get_versions, course_version, course_scores_version, scores_version, student_version, publication_version,
+    DEPARTMENT_VERSION
+)
+from .models import Enrollment
+from .student_cache import (
+    get_enrolled_course_ids, get_student_grade_tables, get_student_po_charts, get_course_cohort
+)
+
+REPORT_TEMPLATE = 'student/course_report.html'
+
+
+def _reports_dir():
+    return Path(getattr(settings, 'STUDENT_REPORTS_DIR', Path(settings.BASE_DIR) / 'student_reports'))
+
+
+def report_paths(student_id, course_id):
+    """(html path, json path) of a student's report for a course."""
+    base = _reports_dir() / str(course_id) / str(student_id)
+    return base.with_suffix('.html'), base.with_suffix('.json')
+
+
+def report_versions(student_id, course_id, enrolled_course_ids):
+    """Names of the data versions a report depends on."""
+    versions = [student_version(student_id), DEPARTMENT_VERSION, course_scores_version(course_id)]
+    # The PO charts combine the student's LOs across every enrolled course
+    for enrolled_course_id in enrolled_course_ids:
+        versions += [
+            course_version(enrolled_course_id),
+            scores_version(enrolled_course_id, student_id),
+            publication_version(enrolled_course_id),
+        ]
+    return sorted(set(versions))
+
+
+def build_report_context(course, grade_tables, po_charts, cohort):
+    """Template context of a course report from the cached page fragments."""
+    course_data = grade_tables['course_data']
+    avg_lo = cohort['avg_lo']
+    comparison_data = {
+        'student_grade': float(course_data['total_grade']) if course_data.get('total_grade') is not None else None,
+        'avg_grade': float(cohort['avg_grade']) if cohort['avg_grade'] is not None else None,
+        'lo_comparison_list': [
+            {
+                'lo_code': lo_code,
+                'student_value': float(student_value),
+                'avg_value': float(avg_lo.get(lo_code)) if avg_lo.get(lo_code) is not None else None
+            }
+            for lo_code, student_value in course_data.get('lo_achievements', {}).items()
+            if student_value is not None
+        ],
+        'total_students': cohort['total_students']
+    }
+    return {
+        'course': course,
+        'course_data': course_data,
+        'assessments_list': grade_tables['assessments_list'],
+        'department_po_values': po_charts['department_po_values'],
+        'po_lo_data': po_charts['po_lo_data'],
+        'comparison_data': comparison_data,
+    }
+
+
+def live_report_context(student, course):
+    return build_report_context(
+        course,
+        get_student_grade_tables(student, course),
+        get_student_po_charts(student, course),
+        get_course_cohort(course),
+    )
+
+
+def _write_atomic(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    temporary.write_text(content, encoding='utf-8')
+    os.replace(temporary, path)
+
+
+def _stored_versions(json_path):
+    try:
+        return json.loads(json_path.read_text(encoding='utf-8')).get('versions')
+    except (OSError, ValueError):
+        return None
+
+
+def write_report(enrollment, versions):
+    """
+    Render one report and store it with the given versions.
+    Returns False without rendering if the stored report already has them.
+    """
+    html_path, json_path = report_paths(enrollment.student_id, enrollment.course_id)
+    if _stored_versions(json_path) == versions and html_path.exists():
+        return False
+
+    context = live_report_context(enrollment.student, enrollment.course)
+    # The .html is written first, so a .json with new versions never describes an old page
+    _write_atomic(html_path, render_to_string(REPORT_TEMPLATE, context))
+    _write_atomic(json_path, json.dumps({
+        'student': enrollment.student_id,
+        'course': enrollment.course_id,
+        'versions': versions,
+        'published_at': timezone.now(),
+        'course_data': {
+            'total_grade': context['course_data'].get('total_grade'),
+            'letter_grade': context['course_data'].get('letter_grade'),
+            'lo_achievements': context['course_data'].get('lo_achievements'),
+        },
+        'comparison_data': context['comparison_data'],
+        'department_po_values': context['department_po_values'],
+        'po_lo_data': context['po_lo_data'],
+    }, cls=DjangoJSONEncoder))
+    return True
+
+
+def get_fresh_report(student, course):
+    """The pre-rendered report HTML if it is still current, otherwise None."""
+    html_path, json_path = report_paths(student.id, course.id)
+    stored = _stored_versions(json_path)
+    if stored is None:
+        return None
+    names = report_versions(student.id, course.id, get_enrolled_course_ids(student))
+    current = get_versions(names)
+    if stored != {name: current[name] for name in names}:
+        return None
+    try:
+        return mark_safe(html_path.read_text(encoding='utf-8'))
+    except OSError:
+        return None
+
+
+def _publish_items(items):
+    """Pool task: render the reports of [(enrollment id, versions), ...]. Returns the number written."""
+    versions_by_id = dict(items)
+    enrollments = Enrollment.objects.filter(id__in=versions_by_id).select_related('student', 'course', 'course__teacher')
+    return sum(write_report(enrollment, versions_by_id[enrollment.id]) for enrollment in enrollments)
+
+
+def _plan(enrollments):
+    """[(enrollment id, versions), ...] with the versions read now, before any report data."""
+    # Enrollments of one course stay together, so each worker computes a course's class averages once
+    rows = list(enrollments.order_by('course_id', 'id').values_list('id', 'student_id', 'course_id'))
+    enrolled = {}
+    for student_id, course_id in Enrollment.objects.filter(
+        student_id__in={student_id for _, student_id, _ in rows}
+    ).values_list('student_id', 'course_id'):
+        enrolled.setdefault(student_id, []).append(course_id)
+
+    names = {
+        enrollment_id: report_versions(student_id, course_id, enrolled.get(student_id, []))
+        for enrollment_id, student_id, course_id in rows
+    }
+    current = get_versions({name for versions in names.values() for name in versions})
+    return [
+        (enrollment_id, {name: current[name] for name in names[enrollment_id]})
+        for enrollment_id, _, _ in rows
+    ]
+
+
+def _chunks(items, size):
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def publish_reports(enrollments=None, workers=None, chunk_size=50, progress=None):
+    """
+    Render the reports of the given Enrollment queryset (default: all) across a
+    process pool and wait for them. workers=1 renders in the current process.
+    Returns the number of reports written; up-to-date reports are skipped.
+    """
+    items = _plan(enrollments if enrollments is not None else Enrollment.objects.all())
+    workers = workers or getattr(settings, 'STUDENT_REPORTS_WORKERS', None) or os.cpu_count() or 1
+    chunks = _chunks(items, chunk_size)
+
+    written = done = 0
+    if workers == 1 or len(chunks) < 2:
+        results = map(_publish_items, chunks)
+        executor = None
+    else:
+        executor = django_process_pool(min(workers, len(chunks)))
+        results = executor.map(_publish_items, chunks)
+    try:
+        for chunk, count in zip(chunks, results):
+            written += count
+            done += len(chunk)
+            if progress:
+                progress(done, len(items))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return written
+
+
+def delete_reports(pairs):
+    """Remove the stored reports of [(student id, course id), ...], e.g. after unenrolling."""
+    for student_id, course_id in pairs:
+        for path in report_paths(student_id, course_id):
+            path.unlink(missing_ok=True)
+
+
+def delete_course_reports(course_ids):
+    """Remove every stored report of the given courses."""
+    for course_id in course_ids:
+        shutil.rmtree(_reports_dir() / str(course_id), ignore_errors=True)
+
+
+class ReportPublisher:
+    """
+    Dispatcher thread that republishes whole courses in a small background pool.
+
+    Course ids submitted while the dispatcher waits or works are merged into
+    one pending set. Each round starts STUDENT_REPORTS_PUBLISH_DELAY seconds
+    after it is woken up and ends when the pool has rendered every report of
+    the round, so a burst of grade writes to one course renders its reports
+    once or twice rather than once per write, and publishing never takes more
+    than STUDENT_REPORTS_BACKGROUND_WORKERS processes from the web server.
+    """
+
+    def __init__(self, delay=2, workers=1, chunk_size=50):
+        self.delay = delay
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._pending = set()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pool = None
+
+    def submit(self, course_ids):
+        """Queue the courses for the next round."""
+        with self._lock:
+            self._pending.update(course_ids)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='report-publisher', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.delay)
+            with self._lock:
+                self._wakeup.clear()
+                course_ids, self._pending = self._pending, set()
+            if not course_ids:
+                continue
+
+            close_old_connections()
+            try:
+                self._publish(course_ids)
+            finally:
+                close_old_connections()
+
+    def _publish(self, course_ids):
+        items = _plan(Enrollment.objects.filter(course_id__in=course_ids))
+        if self._pool is None:
+            self._pool = django_process_pool(self.workers)
+        try:
+            futures = [self._pool.submit(_publish_items, chunk) for chunk in _chunks(items, self.chunk_size)]
+            # The next round waits for this one, so one course is never rendered twice at the same time
+            wait(futures)
+            for future in futures:
+                if isinstance(future.exception(), BrokenProcessPool):
+                    raise future.exception()
+        except BrokenProcessPool:
+            # A worker died; start a new pool next round, the reports are rendered live meanwhile
+            self._pool = None
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_report_publisher():
+    """Return the process-wide ReportPublisher, creating it on first use."""
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = ReportPublisher(
+                delay=getattr(settings, 'STUDENT_REPORTS_PUBLISH_DELAY', 2),
+                workers=getattr(settings, 'STUDENT_REPORTS_BACKGROUND_WORKERS', 1)
+            )
+        return _publisher
+
+
+def publish_course_reports_later(course_ids):
+    """
+    Queue the reports of every student in the given courses for publishing in
+    the background (see ReportPublisher); the caller does not wait. Used after
+    grades change, unless STUDENT_REPORTS_PUBLISH_ON_WRITE is turned off.
+    """
+    if course_ids and getattr(settings, 'STUDENT_REPORTS_PUBLISH_ON_WRITE', True):
+        get_report_publisher().submit(course_ids)
@@ -0,0 +1,269 @@
+"""
+Read-mostly serving mode for results release ("results week").
+
+Entering the mode (manage.py results_week enter) builds one StudentSnapshot
+per student with everything the student pages show: the course list, the
+grade tables and PO charts of each course and the class averages they are
+compared with. While the mode is on:
+
+- the student dashboard, My Courses and course detail pages read the
+  student's snapshot (one primary key lookup) instead of computing anything;
+- class averages come from the cohort data cached while building, so no
+  live comparison runs on a student request;
+- teacher score writes go through the single writer queue (see
+  assessments.score_writer), and the writer rebuilds the snapshots of the
+  students it wrote for after acknowledging the teacher.
+
+Snapshots are plain JSON (ids, codes, names and numbers) stored with the
+data versions (see courses.caching) they were built from. A snapshot whose
+versions are no longer current, e.g. after a weight, contribution or LO/PO
+edit or an enrollment change, is stale: it is not served, the student gets the
+regular cached pages instead until "manage.py results_week refresh" rebuilds it.
+Students without a snapshot fall back to the regular cached pages too.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from accounts.models import User
+from assessments.models import Assessment
+from .caching import get_versions, bump_versions, RESULTS_WEEK_VERSION, DEPARTMENT_VERSION
+from .models import Course, ResultsWeek, StudentSnapshot
+from .student_cache import (
+    get_student_courses, get_student_grade_tables, get_student_po_charts, get_course_cohort, student_courses_versions
+)
+
+
+def _state_timeout():
+    return getattr(settings, 'RESULTS_WEEK_STATE_TIMEOUT', 10)
+
+
+def is_results_week():
+    """
+    Whether results week mode is on. The answer is cached for a few seconds
+    and until the mode is switched, in any process.
+    """
+    key = f'results_week:active:{get_versions([RESULTS_WEEK_VERSION])[RESULTS_WEEK_VERSION]}'
+    active = cache.get(key)
+    if active is None:
+        active = int(ResultsWeek.objects.filter(ended_at__isnull=True).exists())
+        cache.set(key, active, _state_timeout())
+    return bool(active)
+
+
+def snapshot_versions(student):
+    """
+    Names of the data versions a student's snapshot depends on: enrollments,
+    and the structure, own scores and publication of every enrolled course,
+    plus the department outcomes. Other students' scores are left out, so a
+    grade entered for a classmate does not take every snapshot of the course
+    out of service; the class averages may lag as documented above.
+    """
+    return student_courses_versions(student) + [DEPARTMENT_VERSION]
+
+
+def _course_json(course):
+    teacher = course.teacher
+    return {
+        'id': course.id,
+        'code': course.code,
+        'name': course.name,
+        'teacher': {'name': teacher.name, 'surname': teacher.surname} if teacher else None,
+    }
+
+
+def _course_from_json(data):
+    teacher = data['teacher']
+    return Course(
+        id=data['id'], code=data['code'], name=data['name'],
+        teacher=User(name=teacher['name'], surname=teacher['surname']) if teacher else None
+    )
+
+
+def _grade_tables_json(grade_tables):
+    course_data = grade_tables['course_data']
+    return {
+        # The student pages use the totals and achievements only, not the assessments with scores
+        'course_data': {
+            key: course_data[key] for key in ('total_grade', 'letter_grade', 'lo_achievements', 'po_achievements')
+        },
+        'assessments_list': [
+            {
+                'assessment': {
+                    'id': item['assessment'].id,
+                    'name': item['assessment'].name,
+                    'assessment_type': item['assessment'].assessment_type,
+                },
+                'score': str(item['score']) if item['score'] is not None else None,
+                'letter_grade': item['letter_grade'],
+                'weight': str(item['weight']),
+            }
+            for item in grade_tables['assessments_list']
+        ],
+    }
+
+
+def _grade_tables_from_json(data, course):
+    return {
+        'course_data': data['course_data'],
+        'assessments_list': [
+            {
+                'assessment': Assessment(course=course, **item['assessment']),
+                'score': Decimal(item['score']) if item['score'] is not None else None,
+                'letter_grade': item['letter_grade'],
+                'weight': Decimal(item['weight']),
+            }
+            for item in data['assessments_list']
+        ],
+    }
+
+
+def build_student_snapshot(student):
+    """Everything the student pages need, built from the cached page fragments, as JSON data."""
+    courses = get_student_courses(student)
+    return {
+        'courses': [
+            {'course': _course_json(item['course']), 'has_grades': item['has_grades']}
+            for item in courses
+        ],
+        # JSON object keys are strings
+        'course_pages': {
+            str(item['course'].id): {
+                'course': _course_json(item['course']),
+                'grade_tables': _grade_tables_json(get_student_grade_tables(student, item['course'])),
+                'po_charts': get_student_po_charts(student, item['course']),
+                'cohort': get_course_cohort(item['course']),
+            }
+            for item in courses
+        },
+    }
+
+
+def _snapshot_from_json(data):
+    """The snapshot data with display objects (unsaved Course, User and Assessment instances) for the templates."""
+    return {
+        'courses': [
+            {'course': _course_from_json(item['course']), 'has_grades': item['has_grades']}
+            for item in data['courses']
+        ],
+        'course_pages': {
+            int(course_id): _course_page_from_json(page) for course_id, page in data['course_pages'].items()
+        },
+    }
+
+
+def _course_page_from_json(page):
+    course = _course_from_json(page['course'])
+    return {
+        'course': course,
+        'grade_tables': _grade_tables_from_json(page['grade_tables'], course),
+        'po_charts': page['po_charts'],
+        'cohort': page['cohort'],
+    }
+
+
+def rebuild_snapshots(students, progress=None, chunk_size=200):
+    """
+    Build and store the snapshots of the given students, replacing old ones.
+    Rows are written chunk by chunk so readers never wait on one long transaction.
+    Returns the number of snapshots written.
+    """
+    students = list(students)
+    written = 0
+    for start in range(0, len(students), chunk_size):
+        chunk = students[start:start + chunk_size]
+        snapshots = []
+        for student in chunk:
+            # Versions first: a change made while building leaves the snapshot stale, not wrong
+            versions = get_versions(snapshot_versions(student))
+            snapshots.append(StudentSnapshot(
+                student=student,
+                data=build_student_snapshot(student),
+                versions=versions,
+                built_at=timezone.now()
+            ))
+        with transaction.atomic():
+            StudentSnapshot.objects.filter(student__in=chunk).delete()
+            StudentSnapshot.objects.bulk_create(snapshots)
+        written += len(snapshots)
+        if progress:
+            progress(written, len(students))
+    return written
+
+
+def rebuild_student_snapshots(student_ids):
+    """Rebuild the snapshots of the given students if results week mode is on."""
+    if student_ids and is_results_week():
+        rebuild_snapshots(User.objects.filter(id__in=student_ids, role='student'))
+
+
+def _is_current(versions):
+    return get_versions(versions) == versions
+
+
+def get_student_snapshot(student):
+    """The student's snapshot data while results week mode is on and it is current, otherwise None."""
+    if not is_results_week():
+        return None
+    row = StudentSnapshot.objects.filter(student=student).values_list('data', 'versions').first()
+    if row is None or not _is_current(row[1]):
+        return None
+    return _snapshot_from_json(row[0])
+
+
+def snapshot_built_at(student):
+    """When the student's snapshot was built, while results week mode is on; otherwise None."""
+    if not is_results_week():
+        return None
+    return StudentSnapshot.objects.filter(student=student).values_list('built_at', flat=True).first()
+
+
+def stale_snapshot_student_ids():
+    """Ids of the students whose snapshot was built from data versions that have changed since."""
+    rows = list(StudentSnapshot.objects.values_list('student_id', 'versions'))
+    current = get_versions({name for _, versions in rows for name in versions})
+    return [
+        student_id for student_id, versions in rows
+        if any(current[name] != version for name, version in versions.items())
+    ]
+
+
+def enter_results_week(progress=None):
+    """Build every student's snapshot, then switch the mode on."""
+    written = rebuild_snapshots(User.objects.filter(role='student').order_by('id'), progress=progress)
+    if not ResultsWeek.objects.filter(ended_at__isnull=True).exists():
+        ResultsWeek.objects.create()
+    bump_versions(RESULTS_WEEK_VERSION)
+    return written
+
+
+def leave_results_week():
+    """Switch the mode off and drop the snapshots. Returns the number of periods closed."""
+    closed = ResultsWeek.objects.filter(ended_at__isnull=True).update(ended_at=timezone.now())
+    bump_versions(RESULTS_WEEK_VERSION)
+    StudentSnapshot.objects.all().delete()
+    return closed
+
+
+def snapshot_freshness():
+    """Figures for the freshness dashboard."""
+    snapshots = StudentSnapshot.objects.aggregate(
+        oldest=Min('built_at'),
+        newest=Max('built_at'),
+    )
+    student_count = User.objects.filter(role='student').count()
+    snapshot_count = StudentSnapshot.objects.count()
+    return {
+        'results_week': ResultsWeek.objects.filter(ended_at__isnull=True).first(),
+        'last_results_week': ResultsWeek.objects.exclude(ended_at__isnull=True).first(),
+        'student_count': student_count,
+        'snapshot_count': snapshot_count,
+        'missing_count': User.objects.filter(role='student', results_snapshot__isnull=True).count(),
+        'stale_count': len(stale_snapshot_student_ids()),
+        'oldest_built_at': snapshots['oldest'],
+        'newest_built_at': snapshots['newest'],
+    }
@@ -0,0 +1,137 @@
+"""
+Course rollover: clone the structure of existing courses into new courses for a new term.
+
+The learning outcomes, program outcomes, LO-PO mappings, assessments and
+assessment LO contributions of every selected course are copied with one
+bulk insert per table, remapping ids from the old rows to the new ones.
+Everything runs in a single transaction, so a rollover either completes for
+all courses or leaves the database untouched. Enrollments and scores are
+never copied.
+
+Department PO contributions are moved, not copied: every department PO's
+LO percentages must add up to 100, so the new term's LOs take over the
+old ones' shares.
+"""
+from django.db import connection, transaction
+
+from assessments.models import Assessment, AssessmentLOContribution
+from .caching import bump_versions, DEPARTMENT_VERSION
+from .models import Course, LearningOutcome, ProgramOutcome, LOPOMapping, DepartmentLOPOContribution
+
+
+def _bulk_clone(model, objects):
+    """Insert objects in bulk and make sure each one gets its primary key back."""
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objects)
+    # Databases that cannot return ids from a bulk insert fall back to one insert per row
+    for obj in objects:
+        obj.save(force_insert=True)
+    return objects
+
+
+def rollover_courses(course_ids, code_suffix, name_suffix='', copy_teachers=True, move_department_contributions=False):
+    """
+    Clone the given courses into new courses named after the old ones.
+
+    The new course code is the old code followed by code_suffix, and the new
+    name is the old name followed by name_suffix. Raises ValueError if any of
+    the new codes is too long or already taken. With move_department_contributions
+    the department PO contributions of the old LOs are moved to their copies.
+
+    Returns: dict mapping old course id -> new Course
+    """
+    if not code_suffix:
+        raise ValueError('A code suffix is required to keep course codes unique.')
+
+    source_courses = list(Course.objects.filter(id__in=course_ids).order_by('code'))
+    if not source_courses:
+        raise ValueError('No courses selected.')
+
+    max_length = Course._meta.get_field('code').max_length
+    new_codes = {course.id: f'{course.code}{code_suffix}' for course in source_courses}
+    too_long = [code for code in new_codes.values() if len(code) > max_length]
+    if too_long:
+        raise ValueError(f'Course codes longer than {max_length} characters: {", ".join(too_long)}')
+    taken = list(Course.objects.filter(code__in=new_codes.values()).values_list('code', flat=True))
+    if taken:
+        raise ValueError(f'Course codes already exist: {", ".join(sorted(taken))}')
+
+    with transaction.atomic():
+        new_courses = _bulk_clone(Course, [
+            Course(
+                code=new_codes[course.id],
+                name=f'{course.name}{name_suffix}',
+                teacher_id=course.teacher_id if copy_teachers else None
+            )
+            for course in source_courses
+        ])
+        course_map = {old.id: new for old, new in zip(source_courses, new_courses)}
+
+        old_los = list(LearningOutcome.objects.filter(course_id__in=list(course_map)))
+        new_los = _bulk_clone(LearningOutcome, [
+            LearningOutcome(
+                course=course_map[lo.course_id],
+                code=lo.code,
+                description=lo.description,
+                order=lo.order
+            )
+            for lo in old_los
+        ])
+        lo_map = {old.id: new.id for old, new in zip(old_los, new_los)}
+
+        old_pos = list(ProgramOutcome.objects.filter(course_id__in=list(course_map)))
+        new_pos = _bulk_clone(ProgramOutcome, [
+            ProgramOutcome(
+                course=course_map[po.course_id],
+                code=po.code,
+                description=po.description,
+                order=po.order
+            )
+            for po in old_pos
+        ])
+        po_map = {old.id: new.id for old, new in zip(old_pos, new_pos)}
+
+        LOPOMapping.objects.bulk_create([
+            LOPOMapping(
+                learning_outcome_id=lo_map[mapping.learning_outcome_id],
+                program_outcome_id=po_map[mapping.program_outcome_id],
+                contribution_weight=mapping.contribution_weight
+            )
+            for mapping in LOPOMapping.objects.filter(learning_outcome__course_id__in=list(course_map))
+            if mapping.learning_outcome_id in lo_map and mapping.program_outcome_id in po_map
+        ])
+
+        old_assessments = list(Assessment.objects.filter(course_id__in=list(course_map)).order_by('created_at', 'id'))
+        new_assessments = _bulk_clone(Assessment, [
+            Assessment(
+                course=course_map[assessment.course_id],
+                name=assessment.name,
+                assessment_type=assessment.assessment_type,
+                weight_percentage=assessment.weight_percentage
+            )
+            for assessment in old_assessments
+        ])
+        assessment_map = {old.id: new.id for old, new in zip(old_assessments, new_assessments)}
+
+        AssessmentLOContribution.objects.bulk_create([
+            AssessmentLOContribution(
+                assessment_id=assessment_map[contrib.assessment_id],
+                learning_outcome_id=lo_map[contrib.learning_outcome_id],
+                contribution_percentage=contrib.contribution_percentage
+            )
+            for contrib in AssessmentLOContribution.objects.filter(assessment__course_id__in=list(course_map))
+            if contrib.learning_outcome_id in lo_map
+        ])
+
+        if move_department_contributions:
+            contributions = list(
+                DepartmentLOPOContribution.objects.filter(learning_outcome__course_id__in=list(course_map))
+            )
+            for contrib in contributions:
+                contrib.learning_outcome_id = lo_map[contrib.learning_outcome_id]
+            DepartmentLOPOContribution.objects.bulk_update(contributions, ['learning_outcome'])
+            # bulk_update sends no signals
+            if contributions:
+                bump_versions(DEPARTMENT_VERSION)
+
+    return course_map
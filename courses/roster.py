@@ -0,0 +1,212 @@
+"""
+Roster operations for course enrollments.
+
+All writes use bulk_create(ignore_conflicts=True) for new enrollments and a
+single set-based delete for removed ones, inside one transaction.
+
+get_teacher_rosters() reads the rosters of all courses of a teacher, with
+grade summaries, in a fixed number of queries and caches them per course
+and student versions (see courses.caching).
+"""
+import csv
+import io
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Q
+
+from accounts.models import User
+from assessments.models import Assessment, AssessmentScore
+from assessments.utils import calculate_letter_grade
+from .caching import cached, bump_versions, course_version, course_scores_version, student_version
+from .models import Course, Enrollment
+
+
+def enroll_students(course, student_ids):
+    """
+    Enroll the given students in a course, skipping ones already enrolled.
+
+    Returns: number of new enrollments
+    """
+    student_ids = set(
+        User.objects.filter(id__in=student_ids, role='student').values_list('id', flat=True)
+    )
+    already_enrolled = set(
+        Enrollment.objects.filter(course=course, student_id__in=student_ids).values_list('student_id', flat=True)
+    )
+    new_ids = student_ids - already_enrolled
+    Enrollment.objects.bulk_create(
+        [Enrollment(course=course, student_id=student_id) for student_id in new_ids],
+        ignore_conflicts=True
+    )
+    # bulk_create sends no signals; invalidate the cached pages of the affected students
+    if new_ids:
+        bump_versions(course_version(course.id), *[student_version(student_id) for student_id in new_ids])
+    return len(new_ids)
+
+
+def unenroll_students(course, student_ids):
+    """Remove the given students from a course. Returns: number of removed enrollments."""
+    deleted, _ = Enrollment.objects.filter(course=course, student_id__in=student_ids).delete()
+    return deleted
+
+
+def copy_roster(source_course, target_course):
+    """Enroll every student of source_course in target_course. Returns: number of new enrollments."""
+    student_ids = Enrollment.objects.filter(course=source_course).values_list('student_id', flat=True)
+    with transaction.atomic():
+        return enroll_students(target_course, list(student_ids))
+
+
+def parse_roster_csv(uploaded_file):
+    """
+    Read student identifiers from an uploaded CSV file.
+
+    The file may have a header row with an 'email' or 'username' column;
+    otherwise the first column is used. Each identifier is matched against
+    student emails and usernames with one query.
+
+    Returns: (set of matched student ids, list of unmatched identifiers)
+    """
+    text = io.StringIO(uploaded_file.read().decode('utf-8-sig'))
+    rows = [row for row in csv.reader(text) if row and any(cell.strip() for cell in row)]
+    if not rows:
+        return set(), []
+
+    header = [cell.strip().lower() for cell in rows[0]]
+    column = 0
+    for name in ('email', 'username'):
+        if name in header:
+            column = header.index(name)
+            rows = rows[1:]
+            break
+
+    identifiers = []
+    for row in rows:
+        if column < len(row) and row[column].strip():
+            identifiers.append(row[column].strip())
+
+    matched_ids = set()
+    found = set()
+    for student_id, email, username in User.objects.filter(role='student').filter(
+        Q(email__in=identifiers) | Q(username__in=identifiers)
+    ).values_list('id', 'email', 'username'):
+        matched_ids.add(student_id)
+        found.update((email, username))
+
+    unmatched = [identifier for identifier in identifiers if identifier not in found]
+    return matched_ids, unmatched
+
+
+def roster_diff(course, student_ids):
+    """
+    Compare a course roster with the desired set of students.
+
+    Returns: (ids to add, ids to remove)
+    """
+    current = set(Enrollment.objects.filter(course=course).values_list('student_id', flat=True))
+    desired = set(student_ids)
+    return desired - current, current - desired
+
+
+def apply_roster_diff(course, add_ids, remove_ids):
+    """Apply a roster diff in one transaction. Returns: (number added, number removed)."""
+    with transaction.atomic():
+        added = enroll_students(course, add_ids)
+        removed = unenroll_students(course, remove_ids)
+    return added, removed
+
+
+def _weighted_total(scored):
+    """
+    Course total from [(score, weight), ...], as in calculate_course_total_grade():
+    weighted sum of the scored assessments, normalized when their weights do not add up to 100.
+    """
+    total_weight = sum((weight for _, weight in scored), Decimal('0'))
+    if total_weight == 0:
+        return None
+    total = sum((score * weight / Decimal('100') for score, weight in scored), Decimal('0'))
+    if total_weight != Decimal('100'):
+        total = total * (Decimal('100') / total_weight)
+    total = max(Decimal('0.00'), min(Decimal('100.00'), total))
+    return total.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def _build_rosters(course_ids):
+    courses = list(Course.objects.filter(id__in=course_ids).order_by('code'))
+    enrollments = Enrollment.objects.filter(course_id__in=course_ids).select_related('student').order_by(
+        'student__surname', 'student__name'
+    )
+    weights = {}
+    assessment_courses = {}
+    for assessment_id, course_id, weight in Assessment.objects.filter(
+        course_id__in=course_ids
+    ).order_by().values_list('id', 'course_id', 'weight_percentage'):
+        weights[assessment_id] = weight
+        assessment_courses[assessment_id] = course_id
+
+    scored = defaultdict(list)
+    for assessment_id, student_id, score in AssessmentScore.objects.filter(
+        assessment_id__in=list(weights)
+    ).order_by().values_list('assessment_id', 'student_id', 'score'):
+        scored[(assessment_courses[assessment_id], student_id)].append((score, weights[assessment_id]))
+
+    assessment_counts = defaultdict(int)
+    for course_id in assessment_courses.values():
+        assessment_counts[course_id] += 1
+
+    rows_by_course = defaultdict(list)
+    for enrollment in enrollments:
+        total_grade = _weighted_total(scored.get((enrollment.course_id, enrollment.student_id), []))
+        rows_by_course[enrollment.course_id].append({
+            'enrollment': enrollment,
+            'student': enrollment.student,
+            'total_grade': float(total_grade) if total_grade is not None else None,
+            'letter_grade': calculate_letter_grade(total_grade),
+        })
+
+    rosters = []
+    for course in courses:
+        rows = rows_by_course[course.id]
+        grades = [row['total_grade'] for row in rows if row['total_grade'] is not None]
+        rosters.append({
+            'course': course,
+            'rows': rows,
+            'student_count': len(rows),
+            'assessment_count': assessment_counts[course.id],
+            'graded_count': len(grades),
+            'average_grade': sum(grades) / len(grades) if grades else None,
+            'min_grade': min(grades) if grades else None,
+            'max_grade': max(grades) if grades else None,
+        })
+    return rosters
+
+
+def get_teacher_rosters(teacher):
+    """
+    Rosters of every course taught by a teacher, ordered by course code.
+
+    Each item: {'course', 'rows', 'student_count', 'assessment_count', 'graded_count',
+    'average_grade', 'min_grade', 'max_grade'}; each row: {'enrollment', 'student',
+    'total_grade', 'letter_grade'}.
+
+    A cold build runs five queries whatever the number of courses and students.
+    The result is cached per course roster, score and student versions (the
+    rows hold the students' names), so a warm read only runs the query in
+    teacher_roster_versions.
+    """
+    course_ids, versions = teacher_roster_versions(teacher)
+    return cached('teacher_rosters', [teacher.id], versions, lambda: _build_rosters(course_ids))
+
+
+def teacher_roster_versions(teacher):
+    """(ids of the teacher's courses, namespaces their rosters are built from); one query."""
+    pairs = list(Course.objects.filter(teacher=teacher).order_by().values_list('id', 'enrollments__student_id'))
+    course_ids = sorted({course_id for course_id, _ in pairs})
+    student_ids = sorted({student_id for _, student_id in pairs if student_id is not None})
+    versions = []
+    for course_id in course_ids:
+        versions += [course_version(course_id), course_scores_version(course_id)]
+    versions += [student_version(student_id) for student_id in student_ids]
+    return course_ids, versions
@@ -1,9 +1,10 @@
 from rest_framework import serializers
 from .models import Course, LearningOutcome, ProgramOutcome, LOPOMapping, Enrollment
 from accounts.serializers import UserSerializer
+from university_sis.api import DynamicFieldsMixin
 
 
-class LearningOutcomeSerializer(serializers.ModelSerializer):
+class LearningOutcomeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for Learning Outcome."""
     class Meta:
         model = LearningOutcome
@@ -11,7 +12,7 @@ class LearningOutcomeSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class ProgramOutcomeSerializer(serializers.ModelSerializer):
+class ProgramOutcomeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for Program Outcome."""
     class Meta:
         model = ProgramOutcome
@@ -19,7 +20,7 @@ class ProgramOutcomeSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class LOPOMappingSerializer(serializers.ModelSerializer):
+class LOPOMappingSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for LO-PO Mapping."""
     learning_outcome_code = serializers.CharField(source='learning_outcome.code', read_only=True)
     program_outcome_code = serializers.CharField(source='program_outcome.code', read_only=True)
@@ -31,20 +32,22 @@ class LOPOMappingSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
 
 
-class CourseSerializer(serializers.ModelSerializer):
-    """Serializer for Course."""
+class CourseSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """Serializer for Course. The teacher's user record is sent with ?expand=teacher_detail."""
     teacher_name = serializers.CharField(source='teacher.get_full_name', read_only=True)
+    teacher_detail = UserSerializer(source='teacher', read_only=True)
     learning_outcomes = LearningOutcomeSerializer(many=True, read_only=True)
     program_outcomes = ProgramOutcomeSerializer(many=True, read_only=True)
     
     class Meta:
         model = Course
-        fields = ['id', 'code', 'name', 'teacher', 'teacher_name', 
+        fields = ['id', 'code', 'name', 'teacher', 'teacher_name', 'teacher_detail',
                   'learning_outcomes', 'program_outcomes', 'created_at', 'updated_at']
         read_only_fields = ['id', 'created_at', 'updated_at']
+        expandable_fields = ['teacher_detail']
 
 
-class EnrollmentSerializer(serializers.ModelSerializer):
+class EnrollmentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """Serializer for Enrollment."""
     student_name = serializers.CharField(source='student.get_full_name', read_only=True)
     course_name = serializers.CharField(source='course.name', read_only=True)
@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from accounts.models import User
+from announcements.models import Announcement
+from assessments.models import Assessment, AssessmentScore, AssessmentLOContribution
+from .caching import (
+    bump_versions, course_version, course_scores_version, scores_version, student_version, DEPARTMENT_VERSION
+)
+from .dashboard import invalidate_dashboard_context
+from .reports import delete_reports, delete_course_reports
+from .models import (
+    AcademicCalendar, Course, LearningOutcome, ProgramOutcome, LOPOMapping, Enrollment,
+    DepartmentProgramOutcome, DepartmentLOPOContribution
+)
+
+
+@receiver([post_save, post_delete], sender=AcademicCalendar)
+@receiver([post_save, post_delete], sender=Announcement)
+def dashboard_content_changed(sender, **kwargs):
+    """Calendar events and announcements are cached for the dashboards."""
+    invalidate_dashboard_context()
+
+
+# Cached student pages (see courses.caching). Bulk write paths bump the same
+# versions themselves, since bulk_create/bulk_update/_raw_delete send no signals.
+
+@receiver([post_save, post_delete], sender=Course)
+def course_changed(sender, instance, **kwargs):
+    bump_versions(course_version(instance.id))
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    """Names and emails are shown on cached pages (e.g. teacher rosters); logins change neither."""
+    if not created and (update_fields is None or set(update_fields) != {'last_login'}):
+        bump_versions(student_version(instance.id))
+
+
+@receiver([post_save, post_delete], sender=LearningOutcome)
+@receiver([post_save, post_delete], sender=ProgramOutcome)
+@receiver([post_save, post_delete], sender=Assessment)
+def course_structure_changed(sender, instance, **kwargs):
+    bump_versions(course_version(instance.course_id))
+
+
+@receiver([post_save, post_delete], sender=LOPOMapping)
+def lo_po_mapping_changed(sender, instance, **kwargs):
+    course_id = LearningOutcome.objects.filter(id=instance.learning_outcome_id).values_list('course_id', flat=True).first()
+    if course_id is not None:
+        bump_versions(course_version(course_id))
+
+
+@receiver([post_save, post_delete], sender=AssessmentLOContribution)
+def assessment_contribution_changed(sender, instance, **kwargs):
+    course_id = Assessment.objects.filter(id=instance.assessment_id).values_list('course_id', flat=True).first()
+    if course_id is not None:
+        bump_versions(course_version(course_id))
+
+
+@receiver([post_save, post_delete], sender=Enrollment)
+def enrollment_changed(sender, instance, **kwargs):
+    bump_versions(student_version(instance.student_id), course_version(instance.course_id))
+
+
+@receiver([post_save, post_delete], sender=AssessmentScore)
+def score_changed(sender, instance, **kwargs):
+    course_id = Assessment.objects.filter(id=instance.assessment_id).values_list('course_id', flat=True).first()
+    if course_id is not None:
+        bump_versions(scores_version(course_id, instance.student_id), course_scores_version(course_id))
+
+
+# Pre-rendered reports (see courses.reports) of removed enrollments and courses.
+# The set-based deletes in courses.deletion remove them themselves.
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_deleted(sender, instance, **kwargs):
+    pair = (instance.student_id, instance.course_id)
+    transaction.on_commit(lambda: delete_reports([pair]))
+
+
+@receiver(post_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    course_id = instance.id
+    transaction.on_commit(lambda: delete_course_reports([course_id]))
+
+
+@receiver([post_save, post_delete], sender=DepartmentProgramOutcome)
+@receiver([post_save, post_delete], sender=DepartmentLOPOContribution)
+def department_outcomes_changed(sender, instance, **kwargs):
+    bump_versions(DEPARTMENT_VERSION)
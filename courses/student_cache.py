@@ -0,0 +1,194 @@
+"""
+Cached fragments of the student pages (dashboard, my courses, course detail).
+
+Each fragment is keyed on the data versions it depends on (see courses.caching),
+so a new score for a student in a course only rebuilds that student's
+fragments for that course, the course cohort averages and the student's
+department PO values. Other students and other courses keep their entries.
+
+Students only see scores of published assessments. The getters also take a
+pending publication (see assessments.publishing): the fragments are then
+computed as if it had happened and stored under the versions it will switch
+to, so the pages are warm the moment the scores become visible.
+"""
+from decimal import Decimal
+
+from assessments.models import Assessment, AssessmentScore
+from django.db.models import Q
+
+from assessments.utils import (
+    get_student_course_data, get_student_department_pos, calculate_final_lo, calculate_course_total_grade,
+    score_counts
+)
+from .caching import (
+    cached, student_version, course_version, course_scores_version, scores_version, publication_version,
+    DEPARTMENT_VERSION
+)
+from .models import Enrollment, DepartmentProgramOutcome, DepartmentLOPOContribution
+
+
+def get_enrolled_course_ids(student):
+    """Ids of the courses the student is enrolled in."""
+    return cached(
+        'student_course_ids', [student.id], [student_version(student.id)],
+        lambda: list(Enrollment.objects.filter(student=student).order_by('id').values_list('course_id', flat=True))
+    )
+
+
+def _course_versions(student, course_ids):
+    versions = [student_version(student.id)]
+    for course_id in course_ids:
+        versions += [course_version(course_id), scores_version(course_id, student.id), publication_version(course_id)]
+    return versions
+
+
+def student_courses_versions(student):
+    """Namespaces of the student's course list: enrollments, and courses, own scores and publication of each."""
+    return _course_versions(student, get_enrolled_course_ids(student))
+
+
+def _cached(name, parts, versions, compute, publication, stale_ok=False):
+    if publication is None:
+        return cached(name, parts, versions, compute, stale_ok=stale_ok)
+    # Warm-up for a pending publication: store under the versions it will switch to
+    return cached(name, parts, versions, compute, overrides=publication.versions, refresh=True)
+
+
+def _published_only(publication):
+    """The published_only argument of the grade calculations (see assessments.utils.score_counts)."""
+    return publication.assessment_ids if publication is not None else True
+
+
+def get_student_courses(student, publication=None):
+    """
+    Course cards of a student: [{'course', 'enrollment', 'has_grades'}, ...].
+    Used by the dashboard and the My Courses page.
+    """
+    course_ids = get_enrolled_course_ids(student)
+
+    def compute():
+        enrollments = Enrollment.objects.filter(student=student).select_related('course', 'course__teacher')
+        visible = Q(assessment__published_at__isnull=False)
+        if publication is not None:
+            visible |= Q(assessment_id__in=publication.assessment_ids)
+        graded_course_ids = set(
+            AssessmentScore.objects.filter(visible, student=student).values_list('assessment__course_id', flat=True)
+        )
+        return [
+            {
+                'course': enrollment.course,
+                'enrollment': enrollment,
+                'has_grades': enrollment.course_id in graded_course_ids,
+            }
+            for enrollment in enrollments
+        ]
+
+    return _cached('student_courses', [student.id], _course_versions(student, course_ids), compute, publication)
+
+
+def get_student_grade_tables(student, course, publication=None):
+    """The student's own data for one course: course_data and assessments_list."""
+    published_only = _published_only(publication)
+
+    def compute():
+        course_data = get_student_course_data(student, course, published_only)
+        # The assessments carry prefetched scores of the whole course; they are not needed here
+        for item in course_data['assessments']:
+            item['assessment'].__dict__.pop('_prefetched_objects_cache', None)
+
+        scores = {
+            score.assessment_id: score
+            for score in AssessmentScore.objects.filter(student=student, assessment__course=course)
+        }
+        assessments_list = []
+        for assessment in Assessment.objects.filter(course=course).order_by('created_at'):
+            score_obj = scores.get(assessment.id) if score_counts(assessment, published_only) else None
+            assessments_list.append({
+                'assessment': assessment,
+                'score': score_obj.score if score_obj else None,
+                'letter_grade': score_obj.letter_grade if score_obj else None,
+                'weight': assessment.weight_percentage,
+            })
+        return {'course_data': course_data, 'assessments_list': assessments_list}
+
+    return _cached(
+        'student_grade_tables', [student.id, course.id],
+        [course_version(course.id), scores_version(course.id, student.id), publication_version(course.id)],
+        compute, publication
+    )
+
+
+def get_student_po_charts(student, course, publication=None):
+    """Department PO values of the student and the LO contributions of this course to each PO."""
+    course_ids = get_enrolled_course_ids(student)
+    published_only = _published_only(publication)
+
+    def compute():
+        department_po_values = get_student_department_pos(student, published_only)
+        po_lo_data = {}
+        for po_code, po_value in department_po_values.items():
+            try:
+                po = DepartmentProgramOutcome.objects.get(code=po_code)
+            except DepartmentProgramOutcome.DoesNotExist:
+                continue
+            contributions = DepartmentLOPOContribution.objects.filter(
+                department_program_outcome=po,
+                learning_outcome__course=course
+            ).select_related('learning_outcome')
+
+            lo_contributions = []
+            for contrib in contributions:
+                lo = contrib.learning_outcome
+                lo_score = calculate_final_lo(student, course, lo, published_only)
+                if lo_score is not None:
+                    lo_contributions.append({
+                        'lo_code': lo.code,
+                        'lo_value': float(lo_score),
+                        'contribution_pct': float(contrib.contribution_percentage),
+                        'contributed_value': float(lo_score * (Decimal(str(contrib.contribution_percentage)) / Decimal('100')))
+                    })
+            if lo_contributions:
+                po_lo_data[po_code] = {
+                    'po_value': po_value,
+                    'lo_contributions': lo_contributions
+                }
+        return {'department_po_values': department_po_values, 'po_lo_data': po_lo_data}
+
+    return _cached(
+        'student_po_charts', [student.id, course.id],
+        _course_versions(student, course_ids) + [DEPARTMENT_VERSION], compute, publication
+    )
+
+
+def get_course_cohort(course, publication=None):
+    """
+    Class averages of a course, shared by every student: avg_grade, avg_lo, total_students.
+    After a grade change, students keep seeing the previous averages while one request recomputes them.
+    """
+    published_only = _published_only(publication)
+
+    def compute():
+        student_grades = []
+        student_lo_data = {}
+        for enrollment in Enrollment.objects.filter(course=course).select_related('student'):
+            grade = calculate_course_total_grade(enrollment.student, course, published_only)
+            if grade is not None:
+                student_grades.append(float(grade))
+            lo_achievements = get_student_course_data(enrollment.student, course, published_only).get('lo_achievements') or {}
+            for lo_code, lo_value in lo_achievements.items():
+                student_lo_data.setdefault(lo_code, []).append(float(lo_value))
+
+        return {
+            'avg_grade': sum(student_grades) / len(student_grades) if student_grades else None,
+            'avg_lo': {
+                lo_code: sum(values) / len(values) if values else None
+                for lo_code, values in student_lo_data.items()
+            },
+            'total_students': len(student_grades),
+        }
+
+    return _cached(
+        'course_cohort', [course.id],
+        [course_version(course.id), course_scores_version(course.id), publication_version(course.id)],
+        compute, publication, stale_ok=True
+    )
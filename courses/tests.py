@@ -1,3 +1,821 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import User
+from announcements.models import Announcement
+from assessments.models import Assessment, AssessmentScore, AssessmentLOContribution
+from assessments.score_writer import upsert_scores
+from university_sis import middleware
+from . import caching
+from .caching import (
+    get_versions, bump_versions, sync_versions, cached, single_flight, course_version, course_scores_version, student_version,
+    DEPARTMENT_VERSION
+)
+from .dashboard import get_dashboard_context
+from .kpi import compute_department_kpis, get_department_kpis
+from .reports import ReportPublisher, publish_reports, get_fresh_report, report_paths
+from .deletion import preview_course_delete, delete_courses, delete_students, delete_assessments
+from .results_week import enter_results_week, get_student_snapshot, stale_snapshot_student_ids
+from .serializers import CourseSerializer
+from .rollover import rollover_courses
+from .roster import roster_diff, parse_roster_csv, unenroll_students, get_teacher_rosters
+from .student_cache import get_enrolled_course_ids, get_student_grade_tables, get_student_po_charts, get_course_cohort
+from .models import (
+    Course, LearningOutcome, ProgramOutcome, LOPOMapping, Enrollment,
+    DepartmentProgramOutcome, DepartmentLOPOContribution, StudentSnapshot, CacheVersion
+)
+
+
+class _OtherProcess:
+    """Runs the block with an empty copy of the versions, like a server process that has not synced yet."""
+
+    def __enter__(self):
+        self.patchers = [mock.patch.object(caching, '_versions', {}), mock.patch.object(caching, '_synced_at', None)]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def __exit__(self, *exc_info):
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+
+
+class CacheVersionTests(TestCase):
+    name = 'test:versions'
+
+    def version(self):
+        return get_versions([self.name])[self.name]
+
+    def test_bump_waits_for_the_commit(self):
+        before = self.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_versions(self.name)
+            self.assertEqual(self.version(), before)
+        self.assertGreater(self.version(), before)
+        self.assertEqual(CacheVersion.objects.get(namespace=self.name).version, self.version())
+
+    def test_rollback_keeps_the_version(self):
+        before = self.version()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(ZeroDivisionError):
+                with transaction.atomic():
+                    bump_versions(self.name)
+                    1 / 0
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.version(), before)
+        self.assertFalse(CacheVersion.objects.filter(namespace=self.name).exists())
+
+    def test_another_process_sees_the_bump_after_syncing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_versions(self.name)
+        bumped = self.version()
+        with _OtherProcess():
+            sync_versions()
+            self.assertEqual(caching._versions[self.name], bumped)
+
+            # A bump committed by the first process after this one synced
+            CacheVersion.objects.filter(namespace=self.name).update(
+                version=bumped + 1, changed=int(time.time() * 1000)
+            )
+            sync_versions(max_age=60)
+            self.assertEqual(caching._versions[self.name], bumped, 'synced again too soon')
+            sync_versions()
+            self.assertEqual(caching._versions[self.name], bumped + 1)
+
+    def test_middleware_syncs_before_the_view(self):
+        CacheVersion.objects.create(namespace=self.name, version=5, changed=int(time.time() * 1000))
+        with _OtherProcess():
+            self.client.get('/login/')
+            self.assertEqual(caching._versions[self.name], 5)
+
+    def test_cached_value_is_rebuilt_after_a_bump(self):
+        cache.clear()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(cached('test', [1], [self.name], compute), 1)
+        self.assertEqual(cached('test', [1], [self.name], compute), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_versions(self.name)
+        self.assertEqual(cached('test', [1], [self.name], compute), 2)
+
+
+class SingleFlightTests(TestCase):
+    key = 'test:flight'
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return f'value {self.calls}'
+
+    def store(self, value, cost=1.0, expires_in=100.0, key=None):
+        cache.set(key or self.key, caching._Entry(value, cost, time.time() + expires_in), 60)
+
+    def test_miss_computes_and_hit_reuses(self):
+        self.assertEqual(single_flight(self.key, self.compute, 60), ('value 1', False))
+        with mock.patch.object(caching.random, 'random', return_value=0.0):
+            self.assertEqual(single_flight(self.key, self.compute, 60), ('value 1', True))
+        self.assertFalse(cache.get(f'lock:{self.key}'))
+
+    def test_stale_value_is_served_while_another_request_recomputes(self):
+        cache.add(f'lock:{self.key}', 1)
+        self.store('old', key=f'{self.key}:stale')
+        self.assertEqual(single_flight(self.key, self.compute, 60, stale_key=f'{self.key}:stale'), ('old', True))
+        self.assertEqual(self.calls, 0)
+
+    @override_settings(SINGLE_FLIGHT_WAIT=0.2)
+    def test_waiter_gets_the_value_the_holder_stores(self):
+        cache.add(f'lock:{self.key}', 1)
+
+        def holder_finishes(seconds):
+            self.store('from holder')
+
+        with mock.patch.object(caching.time, 'sleep', side_effect=holder_finishes):
+            self.assertEqual(single_flight(self.key, self.compute, 60), ('from holder', True))
+        self.assertEqual(self.calls, 0)
+
+    @override_settings(SINGLE_FLIGHT_WAIT=0.2)
+    def test_waiter_computes_itself_when_the_holder_never_finishes(self):
+        cache.add(f'lock:{self.key}', 1)
+        started = time.time()
+        self.assertEqual(single_flight(self.key, self.compute, 60), ('value 1', False))
+        self.assertGreaterEqual(time.time() - started, 0.2)
+        self.assertEqual(cache.get(self.key).value, 'value 1')
+
+    def test_early_refresh_near_expiry(self):
+        # cost 1s, 2s left: -log(1 - 0.9) = 2.3 seconds ahead reaches the expiry, -log(1 - 0.5) = 0.69 does not
+        self.store('old', expires_in=2.0)
+        with mock.patch.object(caching.random, 'random', return_value=0.5):
+            self.assertEqual(single_flight(self.key, self.compute, 60), ('old', True))
+        with mock.patch.object(caching.random, 'random', return_value=0.9):
+            self.assertEqual(single_flight(self.key, self.compute, 60), ('value 1', True))
+        self.assertEqual(cache.get(self.key).value, 'value 1')
+
+    def test_only_one_request_refreshes_early(self):
+        self.store('old', expires_in=2.0)
+        cache.add(f'lock:{self.key}', 1)
+        with mock.patch.object(caching.random, 'random', return_value=0.9):
+            self.assertEqual(single_flight(self.key, self.compute, 60), ('old', True))
+        self.assertEqual(self.calls, 0)
+
+    def test_refresh_ignores_the_cache_and_the_lock(self):
+        self.store('old')
+        cache.add(f'lock:{self.key}', 1)
+        self.assertEqual(single_flight(self.key, self.compute, 60, refresh=True), ('value 1', False))
+        self.assertEqual(cache.get(self.key).value, 'value 1')
+
+
+class CourseTestData:
+    """A teacher and a department head, a course with LOs, POs, one assessment and three graded students."""
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(
+            'teacher', 'teacher@example.com', 'pw', name='Tina', surname='Teacher', role='teacher'
+        )
+        self.head = User.objects.create_user(
+            'head', 'head@example.com', 'pw', name='Hale', surname='Head', role='department_head'
+        )
+        self.course = Course.objects.create(code='CS101', name='Programming', teacher=self.teacher)
+        self.lo = LearningOutcome.objects.create(course=self.course, code='LO1', description='Write programs')
+        self.po = ProgramOutcome.objects.create(course=self.course, code='PO1', description='Engineering')
+        LOPOMapping.objects.create(learning_outcome=self.lo, program_outcome=self.po)
+        self.assessment = Assessment.objects.create(
+            course=self.course, name='Midterm', assessment_type='midterm', weight_percentage=100
+        )
+        AssessmentLOContribution.objects.create(
+            assessment=self.assessment, learning_outcome=self.lo, contribution_percentage=100
+        )
+        self.students = []
+        for i in range(3):
+            student = User.objects.create_user(
+                f'student{i}', f'student{i}@example.com', 'pw', name='Sam', surname=f'Student{i}', role='student'
+            )
+            Enrollment.objects.create(student=student, course=self.course)
+            self.students.append(student)
+        upsert_scores([
+            {'assessment_id': self.assessment.id, 'student_id': student.id, 'score': 75}
+            for student in self.students
+        ])
+
+
+class DeletionTests(CourseTestData, TestCase):
+
+    def test_course_delete_counts_every_dependent_row(self):
+        dpo = DepartmentProgramOutcome.objects.create(code='DPO1', description='Department')
+        DepartmentLOPOContribution.objects.create(
+            learning_outcome=self.lo, department_program_outcome=dpo, contribution_percentage=100
+        )
+        expected = [
+            ('Assessment scores', 3),
+            ('Assessment LO contributions', 1),
+            ('Department PO contributions', 1),
+            ('LO-PO mappings', 1),
+            ('Assessments', 1),
+            ('Enrollments', 3),
+            ('Learning outcomes', 1),
+            ('Program outcomes', 1),
+            ('Courses', 1),
+        ]
+        self.assertEqual(preview_course_delete([self.course.id]), expected)
+        self.assertEqual(delete_courses([self.course.id]), expected)
+        for model in (Course, LearningOutcome, ProgramOutcome, LOPOMapping, Enrollment,
+                      DepartmentLOPOContribution, Assessment, AssessmentScore, AssessmentLOContribution):
+            self.assertFalse(model.objects.exists(), model.__name__)
+        self.assertTrue(User.objects.filter(pk=self.teacher.pk).exists())
+        self.assertTrue(DepartmentProgramOutcome.objects.filter(pk=dpo.pk).exists())
+
+    def test_course_delete_bumps_course_student_and_department_versions(self):
+        names = [course_version(self.course.id), student_version(self.students[0].id), DEPARTMENT_VERSION]
+        before = get_versions(names)
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_courses([self.course.id])
+        after = get_versions(names)
+        for name in names:
+            self.assertGreater(after[name], before[name], name)
+
+    def test_student_delete(self):
+        names = [course_version(self.course.id), course_scores_version(self.course.id)]
+        before = get_versions(names)
+        with self.captureOnCommitCallbacks(execute=True):
+            counts = delete_students([self.students[0].id])
+        self.assertEqual(counts, [('Assessment scores', 1), ('Enrollments', 1), ('Students', 1)])
+        self.assertEqual(AssessmentScore.objects.count(), 2)
+        after = get_versions(names)
+        self.assertTrue(all(after[name] > before[name] for name in names))
+
+    def test_student_delete_skips_other_roles(self):
+        self.assertEqual(delete_students([self.teacher.id])[-1], ('Students', 0))
+        self.assertTrue(User.objects.filter(pk=self.teacher.pk).exists())
+
+    def test_assessment_delete(self):
+        counts = delete_assessments([self.assessment.id])
+        self.assertEqual(counts, [('Assessment scores', 3), ('Assessment LO contributions', 1), ('Assessments', 1)])
+        self.assertEqual(Enrollment.objects.count(), 3)
+
+    def test_delete_pages(self):
+        self.client.force_login(self.head)
+        response = self.client.get(f'/department-head/courses/{self.course.id}/delete/')
+        self.assertContains(response, '<td>3</td>')
+        response = self.client.post(f'/department-head/courses/{self.course.id}/delete/')
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Course.objects.exists())
+
+
+class RolloverTests(CourseTestData, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.dpo = DepartmentProgramOutcome.objects.create(code='DPO1', description='Department')
+        DepartmentLOPOContribution.objects.create(
+            learning_outcome=self.lo, department_program_outcome=self.dpo, contribution_percentage=100
+        )
+
+    def department_version(self):
+        return get_versions([DEPARTMENT_VERSION])[DEPARTMENT_VERSION]
+
+    def test_copies_the_structure_without_enrollments_or_scores(self):
+        new = rollover_courses([self.course.id], '-F26', ' (Fall 2026)', copy_teachers=False)[self.course.id]
+        self.assertEqual((new.code, new.name, new.teacher_id), ('CS101-F26', 'Programming (Fall 2026)', None))
+        self.assertEqual(list(new.learning_outcomes.values_list('code', flat=True)), ['LO1'])
+        self.assertEqual(list(new.program_outcomes.values_list('code', flat=True)), ['PO1'])
+        mapping = LOPOMapping.objects.get(learning_outcome__course=new)
+        self.assertEqual(mapping.program_outcome.course_id, new.id)
+        contribution = AssessmentLOContribution.objects.get(assessment__course=new)
+        self.assertEqual(contribution.learning_outcome.course_id, new.id)
+        self.assertEqual(contribution.assessment.name, 'Midterm')
+        self.assertFalse(Enrollment.objects.filter(course=new).exists())
+        self.assertFalse(AssessmentScore.objects.filter(assessment__course=new).exists())
+        self.assertEqual(DepartmentLOPOContribution.objects.get().learning_outcome_id, self.lo.id)
+
+    def test_view_keeps_teachers_on_request(self):
+        self.client.force_login(self.head)
+        self.client.post('/department-head/courses/rollover/', {
+            'course_ids': [self.course.id], 'code_suffix': '-F26', 'copy_teachers': '1'
+        })
+        self.assertEqual(Course.objects.get(code='CS101-F26').teacher_id, self.teacher.id)
+
+    def test_moving_department_contributions_keeps_the_totals(self):
+        before = self.department_version()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                new = rollover_courses([self.course.id], '-F26', move_department_contributions=True)[self.course.id]
+                self.assertEqual(self.department_version(), before)
+        self.assertTrue(callbacks)
+        self.assertGreater(self.department_version(), before)
+        contribution = DepartmentLOPOContribution.objects.get()
+        self.assertEqual(contribution.learning_outcome.course_id, new.id)
+        self.assertEqual(contribution.contribution_percentage, 100)
+
+    def test_taken_codes_leave_the_database_untouched(self):
+        Course.objects.create(code='CS101-F26', name='Taken')
+        with self.assertRaisesMessage(ValueError, 'Course codes already exist: CS101-F26'):
+            rollover_courses([self.course.id], '-F26')
+        self.assertEqual(Course.objects.count(), 2)
+
+
+class ResultsWeekTests(CourseTestData, TestCase):
+
+    def setUp(self):
+        # Versions live in process memory while the database is rolled back; drop entries of earlier tests
+        cache.clear()
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            enter_results_week()
+        self.student = self.students[0]
+
+    def test_snapshot_is_json_and_served(self):
+        data = StudentSnapshot.objects.get(student=self.student).data
+        self.assertEqual(json.loads(json.dumps(data)), data)
+        snapshot = get_student_snapshot(self.student)
+        page = snapshot['course_pages'][self.course.id]
+        self.assertEqual(page['course'].code, 'CS101')
+        self.assertEqual(page['grade_tables']['assessments_list'][0]['assessment'].name, 'Midterm')
+
+        self.client.force_login(self.student)
+        response = self.client.get(f'/student/courses/{self.course.id}/')
+        self.assertContains(response, 'Midterm')
+
+    def test_weight_edit_makes_snapshots_stale_until_refresh(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Assessment.objects.filter(pk=self.assessment.pk).first().save()
+        self.assertIsNone(get_student_snapshot(self.student))
+        self.assertEqual(sorted(stale_snapshot_student_ids()), [student.id for student in self.students])
+
+        call_command('results_week', 'refresh', stdout=StringIO())
+        self.assertEqual(stale_snapshot_student_ids(), [])
+        self.assertIsNotNone(get_student_snapshot(self.student))
+
+    def test_enrollment_delete_makes_the_snapshot_stale(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.filter(student=self.student).delete()
+        self.assertIsNone(get_student_snapshot(self.student))
+        self.assertIn(self.student.id, stale_snapshot_student_ids())
+
+        self.client.force_login(self.student)
+        response = self.client.get(f'/student/courses/{self.course.id}/')
+        self.assertRedirects(response, '/student/courses/', fetch_redirect_response=False)
+
+
+class ReportTests(CourseTestData, TestCase):
+
+    def setUp(self):
+        # Versions live in process memory while the database is rolled back; drop entries of earlier tests
+        cache.clear()
+        super().setUp()
+        Assessment.objects.filter(pk=self.assessment.pk).update(published_at=timezone.now())
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(STUDENT_REPORTS_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.student = self.students[0]
+
+    def test_report_is_rendered_and_served(self):
+        self.assertEqual(publish_reports(workers=1), 3)
+        html = get_fresh_report(self.student, self.course)
+        self.assertIn('<h1>CS101 - Programming</h1>', html)
+        self.assertIn('<td>Midterm</td>', html)
+        self.assertIn('Tina Teacher', html)
+        stored = json.loads(report_paths(self.student.id, self.course.id)[1].read_text())
+        self.assertEqual(stored['course_data']['total_grade'], 75.0)
+
+        self.client.force_login(self.student)
+        response = self.client.get(f'/student/courses/{self.course.id}/')
+        self.assertEqual(response.context['report_html'], html)
+        self.assertEqual(publish_reports(workers=1), 0)
+
+    def test_unenroll_removes_the_report(self):
+        publish_reports(workers=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            unenroll_students(self.course, [self.student.id])
+        self.assertFalse(any(path.exists() for path in report_paths(self.student.id, self.course.id)))
+        self.assertTrue(report_paths(self.students[1].id, self.course.id)[0].exists())
+
+    def test_set_based_deletes_remove_reports(self):
+        publish_reports(workers=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_students([self.student.id])
+        self.assertFalse(report_paths(self.student.id, self.course.id)[0].exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            delete_courses([self.course.id])
+        self.assertFalse(report_paths(self.students[1].id, self.course.id)[0].parent.exists())
+
+    def test_publisher_merges_pending_courses(self):
+        rounds = []
+        done = threading.Event()
+
+        def publish(course_ids):
+            rounds.append(course_ids)
+            done.set()
+
+        publisher = ReportPublisher(delay=0.2)
+        with mock.patch.object(publisher, '_publish', side_effect=publish):
+            publisher.submit({1})
+            publisher.submit({2, 1})
+            self.assertTrue(done.wait(5))
+        self.assertEqual(rounds, [{1, 2}])
+
+
+class CourseApiFieldsTests(CourseTestData, TestCase):
+    url = '/api/courses/'
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.head)
+
+    def test_default_output_keeps_nested_outcomes(self):
+        [course] = self.client.get(self.url).json()['results']
+        self.assertEqual([lo['code'] for lo in course['learning_outcomes']], ['LO1'])
+        self.assertEqual([po['code'] for po in course['program_outcomes']], ['PO1'])
+        self.assertEqual(course['teacher_name'], 'Tina Teacher')
+
+        [assessment] = self.client.get('/api/assessments/').json()['results']
+        self.assertEqual([lo['code'] for lo in assessment['covered_LOs_data']], ['LO1'])
+
+    def test_fields_limit_the_output_and_the_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'fields': 'id,code'})
+        # Nothing joined or prefetched for the teacher and the outcomes
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('outcome', sql)
+        self.assertEqual(response.json()['results'], [{'id': self.course.id, 'code': 'CS101'}])
+        [course] = self.client.get(self.url, {'fields': 'code,learning_outcomes'}).json()['results']
+        self.assertEqual(set(course), {'code', 'learning_outcomes'})
+
+    def test_teacher_rename_changes_the_etag(self):
+        for url in (self.url, f'{self.url}{self.course.id}/'):
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.teacher.surname = f'{self.teacher.surname}s'
+            self.teacher.save()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(self.teacher.get_full_name(), response.content.decode())
+
+    def test_expand_adds_declared_fields_only(self):
+        [course] = self.client.get(self.url).json()['results']
+        self.assertNotIn('teacher_detail', course)
+        [course] = self.client.get(self.url, {'expand': 'teacher_detail,bogus'}).json()['results']
+        self.assertEqual(course['teacher_detail']['email'], 'teacher@example.com')
+        self.assertNotIn('bogus', course)
+        [course] = self.client.get(self.url, {'fields': 'code', 'expand': 'teacher_detail'}).json()['results']
+        self.assertEqual(set(course), {'code', 'teacher_detail'})
+
+    def test_expanded_teacher_is_in_the_etag(self):
+        etag = self.client.get(self.url, {'expand': 'teacher_detail'})['ETag']
+        self.teacher.email = 'tina@example.com'
+        self.teacher.save()
+        self.assertEqual(self.client.get(self.url, {'expand': 'teacher_detail'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_expanded_course_of_assessments_runs_a_fixed_number_of_queries(self):
+        def queries():
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get('/api/assessments/', {'expand': 'course_detail'})
+            # Version syncs depend on timing
+            return response, [query for query in captured.captured_queries if 'cacheversion' not in query['sql']]
+
+        response, first = queries()
+        detail = response.json()['results'][0]['course_detail']
+        self.assertEqual((detail['code'], detail['teacher_name']), ('CS101', 'Tina Teacher'))
+        self.assertEqual([lo['code'] for lo in detail['learning_outcomes']], ['LO1'])
+        self.assertNotIn('teacher_detail', detail)
+        for i in range(3):
+            course = Course.objects.create(code=f'CS2{i}', name='Other', teacher=self.teacher)
+            LearningOutcome.objects.create(course=course, code='LO1', description='Other')
+            Assessment.objects.create(course=course, name='Quiz', assessment_type='quiz', weight_percentage=100)
+        response, second = queries()
+        self.assertEqual(len(response.json()['results']), 4)
+        self.assertEqual(len(second), len(first))
+
+
+def _page_queries(client, url):
+    """(response, queries of a GET) without the version syncs, whose timing varies."""
+    with CaptureQueriesContext(connection) as captured:
+        response = client.get(url)
+    return response, [query for query in captured.captured_queries if 'cacheversion' not in query['sql']]
+
+
+@override_settings(CACHE_VERSION_MAX_AGE=3600, STUDENT_REPORTS_PUBLISH_ON_WRITE=False)
+class CachedReadTests(CourseTestData, TestCase):
+    """Query counts of the cached and bulk-read services, and their invalidation on writes."""
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        # Read the versions now, so the counted blocks below do not sync
+        sync_versions()
+
+    def add_courses(self, count):
+        for i in range(count):
+            course = Course.objects.create(code=f'CS2{i}', name='Other', teacher=self.teacher)
+            lo = LearningOutcome.objects.create(course=course, code='LO1', description='Other')
+            assessment = Assessment.objects.create(
+                course=course, name='Quiz', assessment_type='quiz', weight_percentage=100
+            )
+            AssessmentLOContribution.objects.create(assessment=assessment, learning_outcome=lo, contribution_percentage=100)
+            for student in self.students:
+                Enrollment.objects.create(student=student, course=course)
+
+    def test_warm_dashboard_content_runs_no_queries(self):
+        get_dashboard_context()
+        with self.assertNumQueries(0):
+            get_dashboard_context()
+
+    def test_new_announcement_reaches_the_dashboard(self):
+        self.assertEqual(get_dashboard_context()['announcements'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Announcement.objects.create(title='Exam week', content='Rooms are posted.', created_by=self.head)
+        self.assertEqual([a.title for a in get_dashboard_context()['announcements']], ['Exam week'])
+
+    def test_warm_student_pages_run_no_queries(self):
+        student = self.students[0]
+
+        def read():
+            get_enrolled_course_ids(student)
+            get_student_grade_tables(student, self.course)
+            get_student_po_charts(student, self.course)
+            get_course_cohort(self.course)
+
+        read()
+        with self.assertNumQueries(0):
+            read()
+
+    def test_new_score_only_rebuilds_that_students_grades(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Assessment.objects.filter(pk=self.assessment.pk).update(published_at=timezone.now())
+            bump_versions(course_version(self.course.id))
+        for student in self.students:
+            [row] = get_student_grade_tables(student, self.course)['assessments_list']
+            self.assertEqual(row['score'], 75)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            upsert_scores([{'assessment_id': self.assessment.id, 'student_id': self.students[0].id, 'score': 90}])
+        [row] = get_student_grade_tables(self.students[0], self.course)['assessments_list']
+        self.assertEqual(row['score'], 90)
+        with self.assertNumQueries(0):
+            get_student_grade_tables(self.students[1], self.course)
+
+    def test_outcome_summary_is_one_query(self):
+        self.add_courses(3)
+        with self.assertNumQueries(1):
+            courses = list(Course.objects.with_outcome_summary().order_by('code'))
+        summary = [(c.code, c.lo_count, c.po_count, c.enrollment_count, c.complete_lo_count) for c in courses]
+        self.assertEqual(summary[0], ('CS101', 1, 1, 3, 1))
+        self.assertEqual(len(summary), 4)
+
+    def test_catalog_page_queries_do_not_grow_with_courses(self):
+        self.client.force_login(self.head)
+        _, first = _page_queries(self.client, '/department-head/lo-po/')
+        self.add_courses(3)
+        response, second = _page_queries(self.client, '/department-head/lo-po/')
+        self.assertContains(response, 'CS22')
+        self.assertEqual(len(second), len(first))
+
+    def test_teacher_rosters_run_a_fixed_number_of_queries(self):
+        # The course and student ids, then four queries for the build
+        with self.assertNumQueries(5):
+            get_teacher_rosters(self.teacher)
+        self.add_courses(3)
+        cache.clear()
+        with self.assertNumQueries(5):
+            rosters = get_teacher_rosters(self.teacher)
+        self.assertEqual([roster['student_count'] for roster in rosters], [3, 3, 3, 3])
+        with self.assertNumQueries(1):
+            get_teacher_rosters(self.teacher)
+
+    def test_student_rename_reaches_the_rosters(self):
+        self.client.force_login(self.teacher)
+        etag = self.client.get('/api/courses/roster/')['ETag']
+        get_teacher_rosters(self.teacher)
+        student = self.students[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            student.surname = 'Renamed'
+            student.save()
+        [roster] = get_teacher_rosters(self.teacher)
+        self.assertIn('Sam Renamed', [row['student'].get_full_name() for row in roster['rows']])
+        response = self.client.get('/api/courses/roster/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Sam Renamed', [row['name'] for row in response.json()[0]['students']])
+
+    def test_logins_keep_the_rosters(self):
+        get_teacher_rosters(self.teacher)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.client.force_login(self.students[0])
+        self.assertEqual(callbacks, [])
+
+    def test_department_kpis_are_three_queries_and_cached(self):
+        self.add_courses(3)
+        with self.assertNumQueries(3):
+            kpis = compute_department_kpis()
+        self.assertEqual((kpis['course_count'], kpis['expected_grades'], kpis['missing_grades']), (4, 12, 9))
+        get_department_kpis()
+        with self.assertNumQueries(0):
+            get_department_kpis()
+
+    def test_refreshing_the_kpis_picks_up_new_grades(self):
+        self.assertEqual(get_department_kpis()['student_count'], 3)
+        User.objects.create_user('new', 'new@example.com', 'pw', name='New', surname='Student', role='student')
+        self.assertEqual(get_department_kpis()['student_count'], 3)
+        self.assertEqual(get_department_kpis(refresh=True)['student_count'], 4)
+
+
+@override_settings(
+    ADMISSION_CONTROL_LIMITS={
+        'student_course_detail': {'slots': 1, 'timeout': 0.01, 'retry_after': 7},
+        'assessmentscore-list': {'slots': 1, 'timeout': 0.01},
+    },
+    STUDENT_REPORTS_PUBLISH_ON_WRITE=False
+)
+class AdmissionControlTests(CourseTestData, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        middleware.reset_admission_control()
+        self.addCleanup(middleware.reset_admission_control)
+
+    def hold(self, url_name, role):
+        pool = middleware._pool(url_name, role)
+        self.assertTrue(pool.acquire())
+        self.addCleanup(pool.release)
+        return pool
+
+    def test_full_page_pool_answers_503_with_retry_after(self):
+        self.client.force_login(self.students[0])
+        url = f'/student/courses/{self.course.id}/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.hold('student_course_detail', 'student')
+        response = self.client.get(url)
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '7'))
+        self.assertEqual(self.client.get('/student/').status_code, 200)
+        stats = middleware.admission_stats()['student_course_detail']
+        self.assertEqual((stats['admitted'], stats['rejected'], stats['in_flight']), (2, 1, 1))
+
+    def test_full_api_pool_answers_json(self):
+        self.client.force_login(self.teacher)
+        self.hold('assessmentscore-list', 'teacher')
+        response = self.client.get('/api/assessment-scores/')
+        self.assertEqual((response.status_code, response['Retry-After']), (503, str(middleware.DEFAULT_RETRY_AFTER)))
+        self.assertIn('busy', response.json()['detail'])
+
+    def test_only_reads_are_limited(self):
+        self.client.force_login(self.teacher)
+        self.hold('assessmentscore-list', 'teacher')
+        quiz = Assessment.objects.create(course=self.course, name='Quiz', assessment_type='quiz', weight_percentage=0)
+        response = self.client.post(
+            '/api/assessment-scores/', {'assessment': quiz.id, 'student': self.students[0].id, 'score': 80},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(middleware._pool('assessmentscore-list', 'teacher', 'POST'))
+        self.assertEqual(middleware.admission_stats()['assessmentscore-list']['rejected'], 0)
+
+
+class AssignStudentsTests(CourseTestData, TestCase):
+    url = '/department-head/assign-students/'
+
+    def setUp(self):
+        super().setUp()
+        self.other_course = Course.objects.create(code='CS102', name='Data Structures')
+        self.client.force_login(self.head)
+
+    def roster(self, course):
+        return set(Enrollment.objects.filter(course=course).values_list('student_id', flat=True))
+
+    def test_roster_diff(self):
+        newcomer = User.objects.create_user(
+            'newcomer', 'newcomer@example.com', 'pw', name='Nia', surname='New', role='student'
+        )
+        add_ids, remove_ids = roster_diff(self.course, {self.students[0].id, newcomer.id})
+        self.assertEqual(add_ids, {newcomer.id})
+        self.assertEqual(remove_ids, {self.students[1].id, self.students[2].id})
+
+    def test_parse_roster_csv_matches_emails_and_usernames(self):
+        upload = SimpleUploadedFile('roster.csv', b'\xef\xbb\xbfname,email\nA,student0@example.com\nB,nobody@example.com\n')
+        self.assertEqual(parse_roster_csv(upload), ({self.students[0].id}, ['nobody@example.com']))
+        upload = SimpleUploadedFile('roster.csv', b'student1\nstudent2\n\n')
+        self.assertEqual(parse_roster_csv(upload), ({self.students[1].id, self.students[2].id}, []))
+
+    def test_assign_and_copy_roster(self):
+        self.client.post(self.url, {
+            'action': 'assign', 'course_id': self.other_course.id,
+            'student_ids': [self.students[0].id, self.teacher.id],
+        })
+        self.assertEqual(self.roster(self.other_course), {self.students[0].id})
+        self.client.post(self.url, {
+            'action': 'copy_roster', 'course_id': self.other_course.id, 'source_course_code': 'cs101',
+        })
+        self.assertEqual(self.roster(self.other_course), self.roster(self.course))
+
+    def test_csv_preview_then_apply(self):
+        upload = SimpleUploadedFile('roster.csv', b'email\nstudent0@example.com\nnobody@example.com\n')
+        response = self.client.post(self.url, {
+            'action': 'preview_csv', 'course_id': self.course.id, 'roster_file': upload,
+        })
+        preview = response.context['csv_preview']
+        self.assertEqual(list(preview['to_add']), [])
+        self.assertEqual(set(preview['to_remove']), set(self.students[1:]))
+        self.assertEqual(preview['unmatched'], ['nobody@example.com'])
+        self.assertEqual(self.roster(self.course), {student.id for student in self.students})
+
+        self.client.post(self.url, {
+            'action': 'apply_csv', 'course_id': self.course.id,
+            'remove_ids': [student.id for student in preview['to_remove']],
+        })
+        self.assertEqual(self.roster(self.course), {self.students[0].id})
+
+    def test_malformed_ids_are_ignored(self):
+        self.assertEqual(self.client.get(self.url, {'course': 'abc'}).status_code, 200)
+        response = self.client.post(self.url, {'action': 'assign', 'course_id': 'abc', 'student_ids': ['1']})
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.client.post(self.url, {
+            'action': 'assign', 'course_id': self.other_course.id,
+            'student_ids': ['x', '', self.students[0].id],
+        })
+        self.assertEqual(self.roster(self.other_course), {self.students[0].id})
+        self.client.post(self.url, {
+            'action': 'apply_csv', 'course_id': self.course.id,
+            'add_ids': ['1; DROP'], 'remove_ids': ['abc', self.students[1].id],
+        })
+        self.assertEqual(self.roster(self.course), {self.students[0].id, self.students[2].id})
+        response = self.client.post(self.url, {'action': 'remove', 'enrollment_id': 'abc'}, follow=True)
+        self.assertEqual([str(message) for message in response.context['messages']][-1], 'Enrollment not found.')
+
+
+class LOPickerSearchTests(TestCase):
+
+    def setUp(self):
+        self.head = User.objects.create_user(
+            'head', 'head@example.com', 'pw', name='Hale', surname='Head', role='department_head'
+        )
+        self.po = DepartmentProgramOutcome.objects.create(code='PO1', description='Problem solving')
+        self.url = f'/department-head/po-management/{self.po.id}/los/'
+        self.los = {}
+        for code, lo_code, description in [
+            ('CS101', 'LO1', 'Write programs'),
+            ('CS102', 'LO1', 'Design algorithms'),
+            ('MATH201', 'LO1', 'Prove theorems'),
+            ('MATH202', 'ALG1', 'Analyse algorithms'),
+        ]:
+            course = Course.objects.create(code=code, name=code)
+            self.los[code] = LearningOutcome.objects.create(course=course, code=lo_code, description=description)
+        self.client.force_login(self.head)
+
+    def found(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return {lo.course.code for lo in response.context['lo_page']}
+
+    def test_matches_course_and_lo_code_prefixes_ignoring_case(self):
+        self.assertEqual(self.found({'q': 'cs1'}), {'CS101', 'CS102'})
+        self.assertEqual(self.found({'q': 'Math'}), {'MATH201', 'MATH202'})
+        self.assertEqual(self.found({'q': 'alg'}), {'MATH202'})
+        self.assertEqual(self.found({'q': 'S10'}), set())
+
+    def test_wildcards_in_the_search_are_literal(self):
+        self.assertEqual(self.found({'q': 'CS_0'}), set())
+        self.assertEqual(self.found({'q': '%'}), set())
+
+    def test_descriptions_are_only_searched_on_request(self):
+        self.assertEqual(self.found({'q': 'algorithms'}), set())
+        self.assertEqual(self.found({'q': 'algorithms', 'descriptions': '1'}), {'CS102', 'MATH202'})
+
+    def test_save_keeps_the_search(self):
+        lo = self.los['CS101']
+        response = self.client.post(self.url, {
+            'action': 'save_contributions',
+            'lo_id': [lo.id],
+            f'percentage_{lo.id}': '100',
+            'q': 'cs',
+            'descriptions': '1',
+            'page': '1',
+        })
+        self.assertRedirects(response, f'{self.url}?q=cs&descriptions=1&page=1', fetch_redirect_response=False)
+        self.assertTrue(DepartmentLOPOContribution.objects.filter(learning_outcome=lo).exists())
+
+    def test_save_rejects_non_finite_percentages(self):
+        lo = self.los['CS101']
+        for value in ('NaN', 'sNaN', '-Infinity'):
+            response = self.client.post(self.url, {
+                'action': 'save_contributions', 'lo_id': [lo.id], f'percentage_{lo.id}': value,
+            }, follow=True)
+            self.assertEqual([str(message) for message in response.context['messages']], ['Invalid contribution percentage.'])
+        self.assertFalse(DepartmentLOPOContribution.objects.exists())
@@ -16,10 +16,17 @@ urlpatterns = [
     
     # Department Head views
     path('department-head/', views.department_head_dashboard, name='department_head_dashboard'),
+    path('department-head/cache-stats/', views.page_cache_stats, name='page_cache_stats'),
+    path('department-head/admission-stats/', views.admission_control_stats, name='admission_control_stats'),
+    path('department-head/missing-grades/', views.missing_grades_report, name='missing_grades_report'),
+    path('department-head/results-week/', views.results_week_status, name='results_week_status'),
     path('department-head/teachers/', views.manage_teachers, name='manage_teachers'),
     path('department-head/students/', views.manage_students, name='manage_students'),
+    path('department-head/students/<int:student_id>/delete/', views.delete_student, name='delete_student'),
     path('department-head/courses/', views.manage_courses, name='manage_courses'),
+    path('department-head/courses/rollover/', views.course_rollover, name='course_rollover'),
     path('department-head/courses/<int:course_id>/', views.course_detail, name='course_detail'),
+    path('department-head/courses/<int:course_id>/delete/', views.delete_course, name='delete_course'),
     path('department-head/assign-students/', views.assign_students, name='assign_students'),
     path('department-head/lo-po/', views.department_head_lo_po, name='department_head_lo_po'),
     path('department-head/lo-po/los/', views.department_head_manage_los, name='department_head_manage_los'),
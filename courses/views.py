@@ -1,218 +1,142 @@
+import csv
+from django.http import JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.db.models import Q, Count, Sum, F
+from django.urls import reverse
+from django.utils.http import urlencode
 from decimal import Decimal
-from .models import Course, LearningOutcome, ProgramOutcome, LOPOMapping, Enrollment, AcademicCalendar, DepartmentProgramOutcome, DepartmentLOPOContribution
+from .models import Course, LearningOutcome, ProgramOutcome, LOPOMapping, Enrollment, DepartmentProgramOutcome, DepartmentLOPOContribution
 from accounts.decorators import role_required, department_head_required, student_required, teacher_required
+from accounts.importer import read_rows, import_users
+from accounts.pagination import search_users, prefix_search, prefix_condition, keyset_paginate, page_url, USER_ORDERING
 from accounts.models import User
-from announcements.models import Announcement
+from assessments.structure import CourseStructure
 from assessments.utils import get_student_course_data
+from university_sis.middleware import admission_stats
+from .bulk import sync_percentage_rows
+from .caching import cache_stats, bump_versions, DEPARTMENT_VERSION, DASHBOARD_VERSION, RESULTS_WEEK_VERSION
+from .conditional import conditional_page, versions_etag
+from .dashboard import get_dashboard_context
+from .kpi import get_department_kpis, missing_grades
+from .reports import build_report_context, live_report_context, get_fresh_report, report_versions
+from .results_week import get_student_snapshot, snapshot_built_at, snapshot_freshness
+from .deletion import preview_course_delete, delete_courses, preview_student_delete, delete_students
+from .rollover import rollover_courses
+from .roster import (
+    enroll_students, copy_roster, parse_roster_csv, roster_diff, apply_roster_diff, get_teacher_rosters,
+    teacher_roster_versions
+)
+from .student_cache import get_enrolled_course_ids, get_student_courses, student_courses_versions
+
+# Number of Learning Outcomes shown per page in the department PO contribution picker
+LO_PICKER_PAGE_SIZE = 25
+
+# Keyset ordering of the missing grades report
+MISSING_GRADES_ORDERING = ['course_id', 'student_id', 'assessment_id']
+
+
+def _student_etag(request, names):
+    # During results week the pages come from the snapshot, which is rebuilt after the versions change
+    return versions_etag(request, names + [RESULTS_WEEK_VERSION], snapshot_built_at(request.user))
+
+
+def _student_dashboard_etag(request):
+    return _student_etag(request, student_courses_versions(request.user) + [DASHBOARD_VERSION])
+
+
+def _student_my_courses_etag(request):
+    return _student_etag(request, student_courses_versions(request.user))
+
+
+def _student_course_detail_etag(request, course_id):
+    course_ids = get_enrolled_course_ids(request.user)
+    if course_id not in course_ids:
+        return None
+    return _student_etag(request, report_versions(request.user.id, course_id, course_ids))
+
+
+def _teacher_rosters_etag(request, *extra_versions):
+    course_ids, versions = teacher_roster_versions(request.user)
+    return versions_etag(request, versions + list(extra_versions), course_ids)
 
 
 @student_required
+@conditional_page(_student_dashboard_etag)
 def student_dashboard(request):
     """Student dashboard with welcome message, calendar, announcements, and assigned courses."""
-    calendar_events = AcademicCalendar.objects.all()[:10]
-    announcements = Announcement.objects.filter(is_active=True)[:10]
     
     # Get courses assigned to this student
-    enrollments = Enrollment.objects.filter(student=request.user).select_related('course', 'course__teacher')
-    assigned_courses = [enrollment.course for enrollment in enrollments]
+    snapshot = get_student_snapshot(request.user)
+    courses_list = snapshot['courses'] if snapshot else get_student_courses(request.user)
+    assigned_courses = [item['course'] for item in courses_list]
     
     return render(request, 'student/dashboard.html', {
         'user': request.user,
-        'calendar_events': calendar_events,
-        'announcements': announcements,
         'assigned_courses': assigned_courses,
+        **get_dashboard_context(),
     })
 
 
 @student_required
+@conditional_page(_student_my_courses_etag)
 def student_my_courses(request):
     """Student's enrolled courses - list view."""
-    enrollments = Enrollment.objects.filter(student=request.user).select_related('course', 'course__teacher')
-    
-    # Get basic info for each course
-    courses_list = []
-    for enrollment in enrollments:
-        course = enrollment.course
-        # Check if there are any grades
-        from assessments.models import AssessmentScore, Assessment
-        has_grades = AssessmentScore.objects.filter(
-            student=request.user,
-            assessment__course=course
-        ).exists()
-        
-        courses_list.append({
-            'course': course,
-            'enrollment': enrollment,
-            'has_grades': has_grades,
-        })
-    
+    snapshot = get_student_snapshot(request.user)
     return render(request, 'student/my_courses.html', {
-        'courses_list': courses_list,
+        'courses_list': snapshot['courses'] if snapshot else get_student_courses(request.user),
     })
 
 
 @student_required
+@conditional_page(_student_course_detail_etag)
 def student_course_detail(request, course_id):
     """Student's detailed view of a specific course."""
-    course = get_object_or_404(Course, id=course_id)
-    
-    # Verify student is enrolled
-    enrollment = Enrollment.objects.filter(student=request.user, course=course).first()
-    if not enrollment:
-        messages.error(request, 'You are not enrolled in this course.')
-        return redirect('student_my_courses')
-    
-    # Get comprehensive course data
-    course_data = get_student_course_data(request.user, course)
-    
-    # Get all assessments (even without scores) to show structure
-    from assessments.models import Assessment
-    all_assessments = Assessment.objects.filter(course=course).order_by('created_at')
-    
-    # Create assessment list with scores and weights
-    assessments_list = []
-    for assessment in all_assessments:
-        assessment_info = {
-            'assessment': assessment,
-            'score': None,
-            'letter_grade': None,
-            'weight': assessment.weight_percentage,
-        }
-        # Try to get student's score
-        try:
-            from assessments.models import AssessmentScore
-            score_obj = AssessmentScore.objects.get(assessment=assessment, student=request.user)
-            assessment_info['score'] = score_obj.score
-            assessment_info['letter_grade'] = score_obj.letter_grade
-        except AssessmentScore.DoesNotExist:
-            pass
-        assessments_list.append(assessment_info)
-    
-    # Get department PO values for this student
-    from assessments.utils import get_student_department_pos
-    department_po_values = get_student_department_pos(request.user)
-    
-    # Get LO contribution data for PO visualization
-    from courses.models import DepartmentProgramOutcome, DepartmentLOPOContribution
-    from assessments.utils import calculate_final_lo
-    
-    po_lo_data = {}  # Store LO contributions per PO
-    for po_code, po_value in department_po_values.items():
-        try:
-            po = DepartmentProgramOutcome.objects.get(code=po_code)
-            contributions = DepartmentLOPOContribution.objects.filter(
-                department_program_outcome=po
-            ).select_related('learning_outcome', 'learning_outcome__course')
-            
-            lo_contributions = []
-            for contrib in contributions:
-                lo = contrib.learning_outcome
-                # Only include LOs from this course
-                if lo.course.id == course.id:
-                    lo_score = calculate_final_lo(request.user, course, lo)
-                    if lo_score is not None:
-                        lo_contributions.append({
-                            'lo_code': lo.code,
-                            'lo_value': float(lo_score),
-                            'contribution_pct': float(contrib.contribution_percentage),
-                            'contributed_value': float(lo_score * (Decimal(str(contrib.contribution_percentage)) / Decimal('100')))
-                        })
-            
-            if lo_contributions:
-                po_lo_data[po_code] = {
-                    'po_value': po_value,
-                    'lo_contributions': lo_contributions
-                }
-        except DepartmentProgramOutcome.DoesNotExist:
-            continue
-    
-    # Get comparison data for student view
-    from assessments.utils import calculate_course_total_grade
-    course_students = Enrollment.objects.filter(course=course).select_related('student')
-    student_grades = []
-    student_lo_data = {}
-    
-    for course_enrollment in course_students:
-        other_student = course_enrollment.student
-        other_grade = calculate_course_total_grade(other_student, course)
-        if other_grade is not None:
-            student_grades.append(float(other_grade))
-        
-        # Get LO achievements for comparison
-        other_course_data = get_student_course_data(other_student, course)
-        if other_course_data.get('lo_achievements'):
-            for lo_code, lo_value in other_course_data['lo_achievements'].items():
-                if lo_code not in student_lo_data:
-                    student_lo_data[lo_code] = []
-                student_lo_data[lo_code].append(float(lo_value))
-    
-    # Calculate averages - ensure we have valid data
-    avg_grade = None
-    if student_grades:
-        valid_grades = [g for g in student_grades if g is not None]
-        if valid_grades:
-            avg_grade = sum(valid_grades) / len(valid_grades)
-    
-    avg_lo = {}
-    for lo_code, values in student_lo_data.items():
-        if values:
-            valid_values = [v for v in values if v is not None]
-            if valid_values:
-                avg_lo[lo_code] = sum(valid_values) / len(valid_values)
-            else:
-                avg_lo[lo_code] = None
-        else:
-            avg_lo[lo_code] = None
-    
-    comparison_data = {
-        'student_grade': float(course_data['total_grade']) if course_data.get('total_grade') is not None else None,
-        'avg_grade': float(avg_grade) if avg_grade is not None else None,
-        'lo_comparison_list': [
-            {
-                'lo_code': lo_code,
-                'student_value': float(student_value),
-                'avg_value': float(avg_lo.get(lo_code)) if avg_lo.get(lo_code) is not None else None
-            }
-            for lo_code, student_value in course_data.get('lo_achievements', {}).items()
-            if student_value is not None
-        ],
-        'total_students': len([g for g in student_grades if g is not None])
-    }
+    snapshot = get_student_snapshot(request.user)
+    if snapshot:
+        # Results week: everything comes from the student's precomputed snapshot
+        page = snapshot['course_pages'].get(course_id)
+        if page is None:
+            messages.error(request, 'You are not enrolled in this course.')
+            return redirect('student_my_courses')
+        context = build_report_context(page['course'], page['grade_tables'], page['po_charts'], page['cohort'])
+    else:
+        course = get_object_or_404(Course, id=course_id)
+        
+        # Verify student is enrolled
+        if course.id not in get_enrolled_course_ids(request.user):
+            messages.error(request, 'You are not enrolled in this course.')
+            return redirect('student_my_courses')
+        
+        # Serve the pre-rendered report while none of its data has changed
+        report_html = get_fresh_report(request.user, course)
+        if report_html is not None:
+            return render(request, 'student/course_detail.html', {
+                'course': course,
+                'report_html': report_html,
+            })
+        
+        # Student's own grade tables, PO charts and the class averages are cached separately
+        context = live_report_context(request.user, course)
     
-    return render(request, 'student/course_detail.html', {
-        'course': course,
-        'course_data': course_data,
-        'assessments_list': assessments_list,
-        'department_po_values': department_po_values,
-        'po_lo_data': po_lo_data,
-        'comparison_data': comparison_data,
-    })
+    return render(request, 'student/course_detail.html', context)
 
 
 @teacher_required
+@conditional_page(lambda request: _teacher_rosters_etag(request, DASHBOARD_VERSION))
 def teacher_dashboard(request):
     """Teacher dashboard with welcome message, calendar, announcements, and assigned students."""
-    calendar_events = AcademicCalendar.objects.all()[:10]
-    announcements = Announcement.objects.filter(is_active=True)[:10]
     
     # Get courses taught by this teacher with enrolled students
-    courses = Course.objects.filter(teacher=request.user).prefetch_related('enrollments__student')
-    courses_with_students = []
-    for course in courses:
-        enrollments = Enrollment.objects.filter(course=course).select_related('student')
-        courses_with_students.append({
-            'course': course,
-            'students': [enrollment.student for enrollment in enrollments]
-        })
+    courses_with_students = get_teacher_rosters(request.user)
     
     return render(request, 'teacher/dashboard.html', {
         'user': request.user,
-        'calendar_events': calendar_events,
-        'announcements': announcements,
         'courses_with_students': courses_with_students,
+        'total_students': sum(item['student_count'] for item in courses_with_students),
+        **get_dashboard_context(),
     })
 
 
@@ -235,37 +159,21 @@ def teacher_course_los(request, course_id):
         messages.error(request, 'You do not have permission to manage this course.')
         return redirect('teacher_courses')
     
-    learning_outcomes = course.learning_outcomes.all()
-    
-    # Get contribution counts for each LO
-    from assessments.models import AssessmentLOContribution
-    lo_contributions = {}
-    for lo in learning_outcomes:
-        contributions = AssessmentLOContribution.objects.filter(learning_outcome=lo)
-        lo_contributions[lo.id] = {
-            'count': contributions.count(),
-            'total_percentage': sum(float(c.contribution_percentage) for c in contributions)
-        }
+    # Contribution counts and totals for each LO, from one bulk load of the course
+    structure = CourseStructure.load(course)
     
     return render(request, 'teacher/course_los.html', {
         'course': course,
-        'learning_outcomes': learning_outcomes,
-        'lo_contributions': lo_contributions,
+        'learning_outcomes': structure.learning_outcomes,
+        'lo_contributions': structure.lo_totals,
     })
 
 
 @teacher_required
+@conditional_page(_teacher_rosters_etag)
 def teacher_students(request):
     """Students enrolled in teacher's courses."""
-    courses = Course.objects.filter(teacher=request.user).prefetch_related('enrollments__student')
-    courses_with_students = []
-    
-    for course in courses:
-        enrollments = Enrollment.objects.filter(course=course).select_related('student')
-        courses_with_students.append({
-            'course': course,
-            'enrollments': enrollments,
-        })
+    courses_with_students = get_teacher_rosters(request.user)
     
     return render(request, 'teacher/students.html', {
         'courses_with_students': courses_with_students,
@@ -401,21 +309,107 @@ def teacher_student_profile(request, student_id):
 
 @department_head_required
 def department_head_dashboard(request):
-    """Department Head dashboard with welcome message, calendar, and announcements."""
-    calendar_events = AcademicCalendar.objects.all()[:10]
-    announcements = Announcement.objects.filter(is_active=True)[:10]
+    """Department Head dashboard with welcome message, KPI panel, calendar, and announcements."""
+    
+    if request.method == 'POST' and request.POST.get('action') == 'refresh_kpis':
+        get_department_kpis(refresh=True)
+        messages.success(request, 'Department figures refreshed.')
+        return redirect('department_head_dashboard')
     
     return render(request, 'department_head/dashboard.html', {
         'user': request.user,
-        'calendar_events': calendar_events,
-        'announcements': announcements,
+        'kpis': get_department_kpis(),
+        **get_dashboard_context(fragments=False),
+    })
+
+
+@department_head_required
+def admission_control_stats(request):
+    """Admissions, rejections and queue waits of the limited endpoints in this server process (JSON)."""
+    return JsonResponse({'pools': admission_stats()})
+
+
+@department_head_required
+def results_week_status(request):
+    """Results week mode and the freshness of the student snapshots."""
+    return render(request, 'department_head/results_week.html', snapshot_freshness())
+
+
+@department_head_required
+def missing_grades_report(request):
+    """Enrolled students without a score for an assessment of their course, optionally for one course."""
+    rows = missing_grades().select_related('student', 'course').annotate(
+        assessment_name=F('course__assessments__name')
+    )
+    
+    selected_course = None
+    course_id = request.GET.get('course')
+    if course_id and course_id.isdigit():
+        selected_course = Course.objects.filter(id=course_id).first()
+        if selected_course:
+            rows = rows.filter(course=selected_course)
+    
+    page = keyset_paginate(rows, MISSING_GRADES_ORDERING, request.GET.get('cursor'))
+    return render(request, 'department_head/missing_grades.html', {
+        'rows': page,
+        'selected_course': selected_course,
+        'pager': _pager(request, page),
     })
 
 
+@department_head_required
+def page_cache_stats(request):
+    """Hit and miss counts of the cached page fragments in this server process (JSON)."""
+    return JsonResponse({'fragments': cache_stats()})
+
+
+def _import_users_from_upload(request, role):
+    """
+    Bulk import users of the given role from an uploaded CSV or JSONL file.
+    Returns the import report, or None if no usable file was uploaded.
+    """
+    users_file = request.FILES.get('users_file')
+    if not users_file:
+        messages.error(request, 'Please choose a CSV or JSONL file.')
+        return None
+    
+    file_format = 'jsonl' if users_file.name.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+    try:
+        rows = read_rows(users_file.read(), file_format)
+    except (UnicodeDecodeError, csv.Error) as e:
+        messages.error(request, f'Could not read file: {str(e)}')
+        return None
+    
+    report = import_users(rows, role=role, created_by=request.user)
+    messages.success(request, f'Imported {report["created"]} {role}{"s" if report["created"] != 1 else ""}.')
+    if report['errors']:
+        messages.error(request, f'{len(report["errors"])} row{"s" if len(report["errors"]) != 1 else ""} could not be imported.')
+    return report
+
+
+def _pager(request, page, cursor_param='cursor'):
+    """Previous/next links of a keyset page, keeping the other query parameters."""
+    return {
+        'previous_url': page_url(request, **{cursor_param: page.previous_cursor}) if page.previous_cursor else None,
+        'next_url': page_url(request, **{cursor_param: page.next_cursor}) if page.next_cursor else None,
+    }
+
+
+def _user_list_context(request, role, name):
+    """One searched, keyset-paginated page of the users with a role."""
+    query = request.GET.get('q', '').strip()
+    users = search_users(User.objects.filter(role=role), query)
+    page = keyset_paginate(users, USER_ORDERING, request.GET.get('cursor'))
+    return {
+        name: page,
+        'query': query,
+        'pager': _pager(request, page),
+    }
+
+
 @department_head_required
 def manage_teachers(request):
     """Manage teachers - list, add, delete."""
-    teachers = User.objects.filter(role='teacher')
     
     if request.method == 'POST':
         action = request.POST.get('action')
@@ -441,6 +435,14 @@ def manage_teachers(request):
             except Exception as e:
                 messages.error(request, f'Error creating teacher: {str(e)}')
         
+        elif action == 'import':
+            import_report = _import_users_from_upload(request, 'teacher')
+            if import_report is not None:
+                return render(request, 'department_head/teachers.html', {
+                    **_user_list_context(request, 'teacher', 'teachers'),
+                    'import_report': import_report,
+                })
+        
         elif action == 'delete':
             teacher_id = request.POST.get('teacher_id')
             try:
@@ -452,15 +454,12 @@ def manage_teachers(request):
         
         return redirect('manage_teachers')
     
-    return render(request, 'department_head/teachers.html', {
-        'teachers': teachers,
-    })
+    return render(request, 'department_head/teachers.html', _user_list_context(request, 'teacher', 'teachers'))
 
 
 @department_head_required
 def manage_students(request):
     """Manage students - list, add, delete."""
-    students = User.objects.filter(role='student')
     
     if request.method == 'POST':
         action = request.POST.get('action')
@@ -486,19 +485,42 @@ def manage_students(request):
             except Exception as e:
                 messages.error(request, f'Error creating student: {str(e)}')
         
+        elif action == 'import':
+            import_report = _import_users_from_upload(request, 'student')
+            if import_report is not None:
+                return render(request, 'department_head/students.html', {
+                    **_user_list_context(request, 'student', 'students'),
+                    'import_report': import_report,
+                })
+        
         elif action == 'delete':
             student_id = request.POST.get('student_id')
             try:
                 student = User.objects.get(id=student_id, role='student')
-                student.delete()
+                delete_students([student.id])
                 messages.success(request, f'Student {student.get_full_name()} deleted successfully.')
             except User.DoesNotExist:
                 messages.error(request, 'Student not found.')
         
         return redirect('manage_students')
     
-    return render(request, 'department_head/students.html', {
-        'students': students,
+    return render(request, 'department_head/students.html', _user_list_context(request, 'student', 'students'))
+
+
+@department_head_required
+def delete_student(request, student_id):
+    """Show what deleting a student removes, then delete with set-based statements."""
+    student = get_object_or_404(User, id=student_id, role='student')
+    
+    if request.method == 'POST':
+        delete_students([student.id])
+        messages.success(request, f'Student {student.get_full_name()} deleted successfully.')
+        return redirect('manage_students')
+    
+    return render(request, 'department_head/confirm_delete.html', {
+        'object_label': f'student {student.get_full_name()} ({student.email})',
+        'affected_rows': preview_student_delete([student.id]),
+        'cancel_url': reverse('manage_students'),
     })
 
 
@@ -534,45 +556,126 @@ def manage_courses(request):
     })
 
 
+@department_head_required
+def delete_course(request, course_id):
+    """Show what deleting a course removes, then delete with set-based statements."""
+    course = get_object_or_404(Course, id=course_id)
+    
+    if request.method == 'POST':
+        delete_courses([course.id])
+        messages.success(request, f'Course {course.code} deleted successfully.')
+        return redirect('manage_courses')
+    
+    return render(request, 'department_head/confirm_delete.html', {
+        'object_label': f'course {course.code} - {course.name}',
+        'affected_rows': preview_course_delete([course.id]),
+        'cancel_url': reverse('manage_courses'),
+    })
+
+
+@department_head_required
+def course_rollover(request):
+    """Department Head clones the structure of selected courses into new courses for a new term."""
+    courses = Course.objects.all().select_related('teacher')
+    
+    if request.method == 'POST':
+        course_ids = request.POST.getlist('course_ids')
+        code_suffix = request.POST.get('code_suffix', '').strip()
+        name_suffix = request.POST.get('name_suffix', '')
+        
+        try:
+            course_map = rollover_courses(
+                course_ids,
+                code_suffix=code_suffix,
+                name_suffix=name_suffix,
+                copy_teachers=bool(request.POST.get('copy_teachers')),
+                move_department_contributions=bool(request.POST.get('move_department_contributions'))
+            )
+            messages.success(request, f'{len(course_map)} course{"s" if len(course_map) != 1 else ""} rolled over successfully.')
+            return redirect('manage_courses')
+        except ValueError as e:
+            messages.error(request, str(e))
+        except Exception as e:
+            messages.error(request, f'Error rolling over courses: {str(e)}')
+        
+        return redirect('course_rollover')
+    
+    return render(request, 'department_head/course_rollover.html', {
+        'courses': courses,
+    })
+
+
 @department_head_required
 def assign_students(request):
-    """Department Head assigns students to courses."""
-    students = User.objects.filter(role='student')
-    courses = Course.objects.all()
-    enrollments = Enrollment.objects.all().select_related('student', 'course')
+    """
+    Department Head assigns students to courses.
+    Courses are listed with their enrollment counts; the roster of one course
+    is loaded only when that course is selected. Course list, student picker
+    and roster are searched and keyset-paginated, so the page size does not
+    grow with the institution.
+    """
+    selected_course = None
+    course_id = request.POST.get('course_id') or request.GET.get('course')
+    if course_id and course_id.isdigit():
+        selected_course = Course.objects.filter(id=course_id).first()
     
     if request.method == 'POST':
         action = request.POST.get('action')
         
+        if action in ('assign', 'copy_roster', 'preview_csv', 'apply_csv') and selected_course is None:
+            messages.error(request, 'Course not found.')
+            return redirect('assign_students')
+        
         if action == 'assign':
-            student_id = request.POST.get('student_id')
-            course_id = request.POST.get('course_id')
-            
-            try:
-                student = User.objects.get(id=student_id, role='student')
-                course = Course.objects.get(id=course_id)
-                
-                # Check if enrollment already exists
-                enrollment, created = Enrollment.objects.get_or_create(
-                    student=student,
-                    course=course
-                )
-                
-                if created:
-                    messages.success(request, f'Student {student.get_full_name()} assigned to {course.code} successfully.')
+            added = enroll_students(selected_course, _posted_ids(request, 'student_ids'))
+            if added:
+                messages.success(request, f'{added} student{"s" if added != 1 else ""} assigned to {selected_course.code} successfully.')
+            else:
+                messages.info(request, f'The selected students are already assigned to {selected_course.code}.')
+        
+        elif action == 'copy_roster':
+            source_course = Course.objects.filter(code__iexact=request.POST.get('source_course_code', '').strip()).first()
+            if source_course is None:
+                messages.error(request, 'Source course not found.')
+            else:
+                added = copy_roster(source_course, selected_course)
+                messages.success(request, f'{added} student{"s" if added != 1 else ""} copied from {source_course.code} to {selected_course.code}.')
+        
+        elif action == 'preview_csv':
+            roster_file = request.FILES.get('roster_file')
+            if not roster_file:
+                messages.error(request, 'Please choose a CSV file.')
+            else:
+                try:
+                    student_ids, unmatched = parse_roster_csv(roster_file)
+                except (UnicodeDecodeError, csv.Error) as e:
+                    messages.error(request, f'Could not read CSV file: {str(e)}')
                 else:
-                    messages.info(request, f'Student {student.get_full_name()} is already assigned to {course.code}.')
-            except User.DoesNotExist:
-                messages.error(request, 'Student not found.')
-            except Course.DoesNotExist:
-                messages.error(request, 'Course not found.')
-            except Exception as e:
-                messages.error(request, f'Error assigning student: {str(e)}')
+                    add_ids, remove_ids = roster_diff(selected_course, student_ids)
+                    # Render the preview directly; the confirm form posts the diff back
+                    return render(request, 'department_head/assign_students.html', {
+                        **_assign_students_context(request, selected_course),
+                        'csv_preview': {
+                            'to_add': User.objects.filter(id__in=add_ids).order_by('surname', 'name'),
+                            'to_remove': User.objects.filter(id__in=remove_ids).order_by('surname', 'name'),
+                            'unmatched': unmatched,
+                        },
+                    })
+        
+        elif action == 'apply_csv':
+            added, removed = apply_roster_diff(
+                selected_course,
+                _posted_ids(request, 'add_ids'),
+                _posted_ids(request, 'remove_ids')
+            )
+            messages.success(request, f'Roster of {selected_course.code} synced: {added} added, {removed} removed.')
         
         elif action == 'remove':
-            enrollment_id = request.POST.get('enrollment_id')
+            enrollment_id = request.POST.get('enrollment_id', '')
             try:
-                enrollment = Enrollment.objects.get(id=enrollment_id)
+                if not enrollment_id.isdigit():
+                    raise Enrollment.DoesNotExist
+                enrollment = Enrollment.objects.select_related('student', 'course').get(id=enrollment_id)
                 student_name = enrollment.student.get_full_name()
                 course_code = enrollment.course.code
                 enrollment.delete()
@@ -580,30 +683,58 @@ def assign_students(request):
             except Enrollment.DoesNotExist:
                 messages.error(request, 'Enrollment not found.')
         
+        if selected_course is not None:
+            return redirect(f"{reverse('assign_students')}?{urlencode({'course': selected_course.id})}")
         return redirect('assign_students')
     
-    # Group enrollments by course for better organization
-    enrollments_by_course = []
-    course_dict = {}
-    
-    for enrollment in enrollments.order_by('course__code', 'student__name', 'student__surname'):
-        course = enrollment.course
-        if course.id not in course_dict:
-            course_dict[course.id] = {
-                'course': course,
-                'enrollments': []
-            }
-        course_dict[course.id]['enrollments'].append(enrollment)
-    
-    # Convert to list and sort by course code
-    enrollments_by_course = sorted(course_dict.values(), key=lambda x: x['course'].code)
+    return render(request, 'department_head/assign_students.html', _assign_students_context(request, selected_course))
+
+
+def _posted_ids(request, name):
+    """The numeric values of a posted list of ids; anything else is ignored."""
+    return {int(value) for value in request.POST.getlist(name) if value.isdigit()}
+
+
+# Keyset ordering of the course list and of a course roster on the assign students page
+COURSE_ORDERING = ['code', 'id']
+ROSTER_ORDERING = ['student__surname', 'student__name', 'id']
+
+
+def _assign_students_context(request, selected_course):
+    """Course list page, student picker matches and roster page for assign_students."""
+    query = request.GET.get('q', '').strip()
+    courses = prefix_search(Course.objects.select_related('teacher'), query, ['code', 'name'])
+    course_page = keyset_paginate(
+        courses.annotate(enrollment_count=Count('enrollments')), COURSE_ORDERING, request.GET.get('cursor')
+    )
+    for course in course_page:
+        course.select_url = page_url(request, course=course.id, roster_cursor=None, student_q=None)
+    context = {
+        'courses': course_page,
+        'course_pager': _pager(request, course_page),
+        'query': query,
+        'selected_course': selected_course,
+    }
     
-    return render(request, 'department_head/assign_students.html', {
-        'students': students,
-        'courses': courses,
-        'enrollments': enrollments,
-        'enrollments_by_course': enrollments_by_course,
-    })
+    if selected_course is not None:
+        student_query = request.GET.get('student_q', '').strip()
+        # Only students who are not on the roster yet are offered
+        candidates = search_users(User.objects.filter(role='student'), student_query).exclude(
+            id__in=Enrollment.objects.filter(course=selected_course).values('student_id')
+        )
+        roster_page = keyset_paginate(
+            Enrollment.objects.filter(course=selected_course).select_related('student'),
+            ROSTER_ORDERING,
+            request.GET.get('roster_cursor')
+        )
+        context.update({
+            'student_query': student_query,
+            'students': keyset_paginate(candidates, USER_ORDERING).object_list,
+            'roster': roster_page,
+            'roster_pager': _pager(request, roster_page, 'roster_cursor'),
+            'roster_count': Enrollment.objects.filter(course=selected_course).count(),
+        })
+    return context
 
 
 @department_head_required
@@ -649,21 +780,10 @@ def course_detail(request, course_id):
 @department_head_required
 def department_head_lo_po(request):
     """Department Head LO/PO management hub - shows tabs for LO and PO management."""
-    courses = Course.objects.all().select_related('teacher').order_by('code')
-    
-    # Get LO and PO counts per course
-    course_data = []
-    for course in courses:
-        lo_count = LearningOutcome.objects.filter(course=course).count()
-        po_count = ProgramOutcome.objects.filter(course=course).count()
-        course_data.append({
-            'course': course,
-            'lo_count': lo_count,
-            'po_count': po_count,
-        })
+    courses = Course.objects.with_outcome_summary().select_related('teacher').order_by('code')
     
     return render(request, 'department_head/lo_po_management.html', {
-        'course_data': course_data,
+        'courses': courses,
     })
 
 
@@ -715,36 +835,22 @@ def department_head_manage_los(request, course_id=None):
             
             return redirect('department_head_manage_los', course_id=course_id)
         
-        learning_outcomes = LearningOutcome.objects.filter(course=course).order_by('code')
-        
-        # Get contribution info for each LO
-        from assessments.models import AssessmentLOContribution
-        lo_contributions = {}
-        for lo in learning_outcomes:
-            contributions = AssessmentLOContribution.objects.filter(learning_outcome=lo)
-            lo_contributions[lo.id] = {
-                'count': contributions.count(),
-                'total_percentage': sum(float(c.contribution_percentage) for c in contributions)
-            }
+        # Contribution count and total per LO, in the same query
+        learning_outcomes = LearningOutcome.objects.filter(course=course).annotate(
+            contribution_count=Count('assessment_contributions'),
+            contribution_total=Sum('assessment_contributions__contribution_percentage')
+        ).order_by('code')
         
         return render(request, 'department_head/manage_los.html', {
             'course': course,
             'learning_outcomes': learning_outcomes,
-            'lo_contributions': lo_contributions,
         })
     
     # List all courses
-    courses = Course.objects.all().select_related('teacher').order_by('code')
-    course_data = []
-    for course in courses:
-        lo_count = LearningOutcome.objects.filter(course=course).count()
-        course_data.append({
-            'course': course,
-            'lo_count': lo_count,
-        })
+    courses = Course.objects.with_outcome_summary().select_related('teacher').order_by('code')
     
     return render(request, 'department_head/manage_los_list.html', {
-        'course_data': course_data,
+        'courses': courses,
     })
 
 
@@ -796,32 +902,21 @@ def department_head_manage_pos(request, course_id=None):
             
             return redirect('department_head_manage_pos', course_id=course_id)
         
-        program_outcomes = ProgramOutcome.objects.filter(course=course).order_by('code')
-        
-        # Get mapping info for each PO
-        po_mappings = {}
-        for po in program_outcomes:
-            mappings = LOPOMapping.objects.filter(program_outcome=po)
-            po_mappings[po.id] = mappings.count()
+        # Mapping count per PO, in the same query
+        program_outcomes = ProgramOutcome.objects.filter(course=course).annotate(
+            mapping_count=Count('lo_mappings')
+        ).order_by('code')
         
         return render(request, 'department_head/manage_pos.html', {
             'course': course,
             'program_outcomes': program_outcomes,
-            'po_mappings': po_mappings,
         })
     
     # List all courses
-    courses = Course.objects.all().select_related('teacher').order_by('code')
-    course_data = []
-    for course in courses:
-        po_count = ProgramOutcome.objects.filter(course=course).count()
-        course_data.append({
-            'course': course,
-            'po_count': po_count,
-        })
+    courses = Course.objects.with_outcome_summary().select_related('teacher').order_by('code')
     
     return render(request, 'department_head/manage_pos_list.html', {
-        'course_data': course_data,
+        'courses': courses,
     })
 
 
@@ -871,19 +966,14 @@ def department_po_management(request):
         
         return redirect('department_po_management')
     
-    # Get contribution info for each PO
-    po_data = []
-    for po in department_pos:
-        contributions = DepartmentLOPOContribution.objects.filter(department_program_outcome=po)
-        total_percentage = sum(float(c.contribution_percentage) for c in contributions)
-        po_data.append({
-            'po': po,
-            'lo_count': contributions.count(),
-            'total_percentage': total_percentage,
-        })
+    # Contribution count and total per PO, in the same query
+    department_pos = department_pos.annotate(
+        lo_count=Count('lo_contributions'),
+        total_percentage=Sum('lo_contributions__contribution_percentage')
+    )
     
     return render(request, 'department_head/department_po_management.html', {
-        'po_data': po_data,
+        'department_pos': department_pos,
     })
 
 
@@ -892,52 +982,70 @@ def manage_po_lo_contributions(request, po_id):
     """Department Head manages LO contributions for a department PO."""
     po = get_object_or_404(DepartmentProgramOutcome, id=po_id)
     
-    # Get all LOs from all courses
-    all_los = LearningOutcome.objects.all().select_related('course').order_by('course__code', 'code')
-    
     # Get existing contributions for this PO
     existing_contributions = DepartmentLOPOContribution.objects.filter(
         department_program_outcome=po
-    ).select_related('learning_outcome', 'learning_outcome__course')
+    ).select_related('learning_outcome', 'learning_outcome__course').order_by('learning_outcome__course__code', 'learning_outcome__code')
     
     # Create a dict for quick lookup
     contribution_dict = {contrib.learning_outcome.id: contrib for contrib in existing_contributions}
     
+    query = request.GET.get('q', '').strip()
+    # Matching inside descriptions cannot use an index, so it is only done when asked for
+    in_descriptions = request.GET.get('descriptions') == '1'
+    page_number = request.GET.get('page')
+    
     if request.method == 'POST':
         action = request.POST.get('action')
+        query = request.POST.get('q', '').strip()
+        in_descriptions = request.POST.get('descriptions') == '1'
+        page_number = request.POST.get('page')
         
         if action == 'save_contributions':
-            # Delete all existing contributions
-            existing_contributions.delete()
+            # Every listed LO posts its id; percentages are keyed by LO id so
+            # unchecked (disabled) inputs cannot shift the other values
+            desired = {}
+            try:
+                for lo_id in request.POST.getlist('lo_id'):
+                    percentage = request.POST.get(f'percentage_{lo_id}')
+                    if percentage:
+                        desired[int(lo_id)] = Decimal(percentage)
+                        # NaN cannot be compared with the bounds below
+                        if not desired[int(lo_id)].is_finite():
+                            raise ValueError(percentage)
+            except (ValueError, ArithmeticError):
+                messages.error(request, 'Invalid contribution percentage.')
+                return _redirect_po_lo_contributions(po_id, query, in_descriptions, page_number)
             
-            # Get all LO IDs and percentages from form
-            lo_ids = request.POST.getlist('lo_id')
-            percentages = request.POST.getlist('percentage')
+            if any(p < 0 or p > 100 for p in desired.values()):
+                messages.error(request, 'Contribution percentages must be between 0 and 100.')
+                return _redirect_po_lo_contributions(po_id, query, in_descriptions, page_number)
             
             # Validate total percentage
-            total_percentage = sum(float(p) for p in percentages if p)
+            total_percentage = sum(desired.values(), Decimal('0'))
             
-            if abs(total_percentage - 100.0) > 0.01:
+            if abs(total_percentage - Decimal('100')) > Decimal('0.01'):
                 messages.error(request, f'Total contribution percentage must equal 100%. Current total: {total_percentage:.2f}%')
-                return redirect('manage_po_lo_contributions', po_id=po_id)
+                return _redirect_po_lo_contributions(po_id, query, in_descriptions, page_number)
             
-            # Create new contributions
-            for lo_id, percentage in zip(lo_ids, percentages):
-                if lo_id and percentage and float(percentage) > 0:
-                    try:
-                        lo = LearningOutcome.objects.get(id=lo_id)
-                        DepartmentLOPOContribution.objects.create(
-                            learning_outcome=lo,
-                            department_program_outcome=po,
-                            contribution_percentage=float(percentage)
-                        )
-                    except LearningOutcome.DoesNotExist:
-                        continue
-                    except Exception as e:
-                        messages.error(request, f'Error creating contribution: {str(e)}')
+            # Drop LOs that no longer exist, checked with one query
+            valid_ids = set(LearningOutcome.objects.filter(id__in=desired).values_list('id', flat=True))
+            desired = {lo_id: p for lo_id, p in desired.items() if lo_id in valid_ids}
+            
+            sync_percentage_rows(
+                existing_contributions,
+                desired,
+                key=lambda contrib: contrib.learning_outcome_id,
+                build=lambda lo_id, percentage: DepartmentLOPOContribution(
+                    learning_outcome_id=lo_id,
+                    department_program_outcome=po,
+                    contribution_percentage=percentage
+                )
+            )
+            bump_versions(DEPARTMENT_VERSION)
             
             messages.success(request, f'LO contributions for {po.code} saved successfully.')
-            return redirect('manage_po_lo_contributions', po_id=po_id)
+            return _redirect_po_lo_contributions(po_id, query, in_descriptions, page_number)
         
         elif action == 'remove_contribution':
             contrib_id = request.POST.get('contrib_id')
@@ -948,15 +1056,45 @@ def manage_po_lo_contributions(request, po_id):
             except DepartmentLOPOContribution.DoesNotExist:
                 messages.error(request, 'Contribution not found.')
             
-            return redirect('manage_po_lo_contributions', po_id=po_id)
+            return _redirect_po_lo_contributions(po_id, query, in_descriptions, page_number)
+    
+    # Searchable, paginated LO picker; LOs that already contribute are listed above it
+    candidate_los = LearningOutcome.objects.exclude(
+        id__in=list(contribution_dict)
+    ).select_related('course').order_by('course__code', 'code')
+    if query:
+        # Both prefix matches seek an index on the lowered code
+        condition = prefix_condition('code', query) | Q(
+            course__in=Course.objects.filter(prefix_condition('code', query))
+        )
+        if in_descriptions:
+            condition |= Q(description__icontains=query)
+        candidate_los = candidate_los.filter(condition)
+    lo_page = Paginator(candidate_los, LO_PICKER_PAGE_SIZE).get_page(page_number)
     
     # Calculate total percentage
     total_percentage = sum(float(c.contribution_percentage) for c in existing_contributions)
     
     return render(request, 'department_head/manage_po_lo_contributions.html', {
         'po': po,
-        'all_los': all_los,
+        'lo_page': lo_page,
+        'query': query,
+        'in_descriptions': in_descriptions,
+        'search_params': _po_lo_search_params(query, in_descriptions),
         'existing_contributions': existing_contributions,
         'contribution_dict': contribution_dict,
         'total_percentage': total_percentage,
     })
+
+
+def _po_lo_search_params(query, in_descriptions, page_number=None):
+    """Query string of the LO picker search (and page)."""
+    params = {'q': query, 'descriptions': '1' if in_descriptions else '', 'page': page_number or ''}
+    return urlencode({key: value for key, value in params.items() if value})
+
+
+def _redirect_po_lo_contributions(po_id, query, in_descriptions, page_number):
+    """Redirect back to the PO contribution page, keeping the picker search and page."""
+    params = _po_lo_search_params(query, in_descriptions, page_number)
+    url = reverse('manage_po_lo_contributions', kwargs={'po_id': po_id})
+    return redirect(f'{url}?{params}' if params else url)
@@ -0,0 +1,106 @@
+"""
+Admin helpers for large tables.
+
+EstimatedCountPaginator: counts exactly up to ADMIN_EXACT_COUNT_LIMIT rows and
+estimates beyond that, instead of running a full COUNT(*) on every changelist.
+
+KeysetPaginationMixin: changelists paginated with a keyset cursor (see
+accounts.pagination) in the usual "p" parameter, newest rows first. No count
+query is run at all, and every page costs the same.
+"""
+from django.contrib.admin.views.main import ChangeList, PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from accounts.pagination import keyset_paginate
+
+# Changelists count exactly up to this many rows
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
+
+def _estimated_table_rows(queryset):
+    """
+    Row count of the queryset's table according to the database statistics, or
+    None without statistics. The figure is as of the last ANALYZE (or autovacuum
+    on PostgreSQL), so it can be off in either direction by the rows changed since.
+    """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            # reltuples is -1 for a table that was never analyzed
+            return int(row[0]) if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            # The first number of each stat row is the number of rows in that index
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+            counts = [int(stat.split()[0]) for stat, in cursor.fetchall() if stat.split()[0].isdigit()]
+            return max(counts) if counts else None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that avoids full COUNT(*) scans.
+
+    The count is exact up to ADMIN_EXACT_COUNT_LIMIT. Above it, an unfiltered
+    list uses the table statistics if the database has any; otherwise, and for
+    a filtered list, it reports the limit, so only the first
+    ADMIN_EXACT_COUNT_LIMIT rows are reachable through the page links.
+    """
+
+    @cached_property
+    def count(self):
+        bounded = self.object_list.order_by()[:ADMIN_EXACT_COUNT_LIMIT + 1].count()
+        if bounded <= ADMIN_EXACT_COUNT_LIMIT:
+            return bounded
+        if not self.object_list.query.where:
+            estimate = _estimated_table_rows(self.object_list)
+            if estimate:
+                return max(estimate, bounded)
+        return ADMIN_EXACT_COUNT_LIMIT
+
+
+class KeysetChangeList(ChangeList):
+    """ChangeList that fetches one keyset page instead of counting and slicing."""
+
+    def get_results(self, request):
+        page = keyset_paginate(
+            self.queryset,
+            self.model_admin.keyset_ordering,
+            request.GET.get(PAGE_VAR),
+            self.list_per_page
+        )
+        self.keyset_page = page
+        self.previous_url = self.get_query_string({PAGE_VAR: page.previous_cursor}) if page.previous_cursor else None
+        self.next_url = self.get_query_string({PAGE_VAR: page.next_cursor}) if page.next_cursor else None
+
+        self.result_count = len(page)
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.result_list = page.object_list
+        self.can_show_all = False
+        self.multi_page = page.has_other_pages
+        self.paginator = None
+
+
+class KeysetPaginationMixin:
+    """
+    ModelAdmin mixin for cursor-paginated changelists.
+
+    Column sorting is disabled because a keyset needs one fixed ordering, and
+    list_editable is not supported since the page is a list, not a queryset.
+    """
+    keyset_ordering = ['-id']
+    change_list_template = 'admin/keyset_change_list.html'
+    show_full_result_count = False
+    sortable_by = ()
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
@@ -0,0 +1,199 @@
+"""
+Pagination, filtering and sparse fieldsets shared by the REST viewsets.
+
+KeysetCursorPagination: every list is paginated with a keyset cursor (see
+accounts.pagination) in the "cursor" parameter. A page is one seek query on
+the view's keyset ordering, so the millionth row costs the same as the first
+and neither side ever holds more than a page.
+
+IdFilterBackend: ?<name>=<id>[,<id>...] filters declared by the view, plus
+?updated_since=<ISO datetime> for incremental sync on views that declare an
+updated_since_field. Each filter should be backed by an index that starts
+with the filtered column.
+
+DynamicFieldsMixin (serializers): ?fields=a,b returns only those fields and
+?expand=x adds fields the serializer leaves out unless asked for: the
+course's teacher_detail, the assessment's course_detail and the score's
+student_detail, which nest whole related records.
+
+QueryPlanMixin (viewsets): select_related and prefetch_related applied only
+for the fields the response includes, so a list runs a fixed number of
+queries and never joins or prefetches what nobody asked for.
+"""
+import re
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from accounts.pagination import keyset_paginate, InvalidCursor, DEFAULT_PAGE_SIZE, MAX_INTEGER
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    ?cursor=<opaque>&page_size=<n> pagination.
+
+    The ordering comes from the view's get_keyset_ordering() if it has one,
+    else its keyset_ordering attribute, else ['id']; it must end with a
+    unique field. Responses are {"next", "previous", "results"}; a malformed
+    cursor is a 404, as with DRF's CursorPagination.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, view):
+        if hasattr(view, 'get_keyset_ordering'):
+            return view.get_keyset_ordering()
+        return getattr(view, 'keyset_ordering', ['id'])
+
+    def get_page_size(self, request):
+        page_size = api_settings.PAGE_SIZE or DEFAULT_PAGE_SIZE
+        value = request.query_params.get(self.page_size_query_param, '')
+        if value.isdigit() and int(value) > 0:
+            page_size = min(int(value), self.max_page_size)
+        return page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            self.page = keyset_paginate(
+                queryset,
+                self.get_ordering(view),
+                request.query_params.get(self.cursor_query_param),
+                self.get_page_size(request),
+                strict=True
+            )
+        except InvalidCursor:
+            raise NotFound(self.invalid_cursor_message)
+        return list(self.page)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        return self._link(self.page.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+ID_PATTERN = re.compile(r'[0-9]+')
+
+
+def _ids(name, value):
+    ids = value.split(',')
+    # ASCII digits only (str.isdigit() also accepts e.g. '²'), and small enough for an id column
+    if not all(ID_PATTERN.fullmatch(part) and len(part) <= 19 and int(part) <= MAX_INTEGER for part in ids):
+        raise ValidationError({name: ['Expected an id or a comma-separated list of ids.']})
+    return [int(part) for part in ids]
+
+
+class IdFilterBackend(BaseFilterBackend):
+    """
+    Filters declared on the view:
+
+    filter_fields: {query parameter: lookup}, e.g. {'course': 'assessment__course_id'}
+    updated_since_field: field compared with ?updated_since (rows changed at or
+        after the given time, so rows sharing the timestamp of the last one
+        synced are sent again rather than missed)
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        for name, lookup in getattr(view, 'filter_fields', {}).items():
+            value = request.query_params.get(name)
+            if value:
+                ids = _ids(name, value)
+                queryset = queryset.filter(**{lookup: ids[0]} if len(ids) == 1 else {f'{lookup}__in': ids})
+
+        field = getattr(view, 'updated_since_field', None)
+        value = request.query_params.get('updated_since')
+        if field and value:
+            since = parse_datetime(value.replace(' ', '+'))
+            if since is None:
+                raise ValidationError({'updated_since': ['Expected an ISO 8601 date and time.']})
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            queryset = queryset.filter(**{f'{field}__gte': since})
+        return queryset
+
+
+def _names(request, param):
+    if request is None:
+        return []
+    params = getattr(request, 'query_params', request.GET)
+    return [name.strip() for name in params.get(param, '').split(',') if name.strip()]
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin for ?fields= and ?expand=.
+
+    Meta.expandable_fields: fields left out unless named in ?expand. Only for
+        fields added later or expensive to compute; existing fields stay in the
+        default output so current clients keep working.
+    ?fields only applies to reads, so a write never skips validating a field.
+    Only the serializer the view creates is affected, not nested ones.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        expandable = set(getattr(self.Meta, 'expandable_fields', ()))
+        expand = set(_names(request, 'expand')) & expandable
+        for name in expandable - expand:
+            self.fields.pop(name, None)
+
+        fields = _names(request, 'fields') if request is not None and request.method in ('GET', 'HEAD') else []
+        if fields:
+            keep = set(fields) | expand
+            for name in list(self.fields):
+                if name not in keep:
+                    self.fields.pop(name)
+
+
+class QueryPlanMixin:
+    """
+    Viewset mixin loading related rows for the serializer fields in the response.
+
+    select_related_plan: {serializer field: [select_related paths]}
+    prefetch_plan: {serializer field: [prefetch_related lookups]}
+    """
+    select_related_plan = {}
+    prefetch_plan = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = set(self.get_serializer().fields)
+        select = {path for name, paths in self.select_related_plan.items() if name in fields for path in paths}
+        prefetch = {path for name, paths in self.prefetch_plan.items() if name in fields for path in paths}
+        if select:
+            queryset = queryset.select_related(*sorted(select))
+        if prefetch:
+            queryset = queryset.prefetch_related(*sorted(prefetch))
+        return queryset
@@ -0,0 +1,169 @@
+"""
+Admission control for expensive endpoints.
+
+ADMISSION_CONTROL_LIMITS maps URL names to a number of concurrent slots. A
+request for a limited view waits up to the rule's timeout for a free slot and
+is then rejected with a 503 and a Retry-After header, so a burst on a slow page
+cannot occupy every worker and starve logins and dashboards. Only the rule's
+methods are limited (GET and HEAD by default), so writes to an endpoint with a
+limited list, such as bulk score uploads, are never turned away.
+
+    ADMISSION_CONTROL_LIMITS = {
+        'student_course_detail': {'slots': 8, 'timeout': 2},
+        'assessmentscore-list': {
+            'slots': 2, 'timeout': 1, 'retry_after': 10, 'methods': ['GET', 'HEAD'],
+            # Roles listed here get a pool of their own, others share the default one
+            'roles': {'department_head': {'slots': 1}},
+        },
+    }
+
+Slots are counted per server process. Admissions, rejections and queue waits
+are counted per pool; see admission_stats().
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+DEFAULT_TIMEOUT = 1.0
+DEFAULT_RETRY_AFTER = 5
+DEFAULT_METHODS = ('GET', 'HEAD')
+
+
+class AdmissionPool:
+    """A fixed number of slots for one URL name (and role), with metrics."""
+
+    def __init__(self, name, slots, timeout, retry_after):
+        self.name = name
+        self.slots = slots
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._semaphore = threading.BoundedSemaphore(slots)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.queued = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def acquire(self):
+        """Wait for a slot; return False if none frees up within the timeout."""
+        start = time.monotonic()
+        # Try without waiting first so uncontended requests are not counted as queued
+        acquired = self._semaphore.acquire(blocking=False)
+        queued = not acquired
+        if queued:
+            acquired = self._semaphore.acquire(timeout=self.timeout)
+        waited = time.monotonic() - start
+
+        with self._lock:
+            if queued:
+                self.queued += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+            if acquired:
+                self.admitted += 1
+                self.in_flight += 1
+            else:
+                self.rejected += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'slots': self.slots,
+                'in_flight': self.in_flight,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'queued': self.queued,
+                'average_wait': round(self.total_wait / self.queued, 4) if self.queued else None,
+                'max_wait': round(self.max_wait, 4),
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(url_name, role, method='GET'):
+    """The pool a method request for url_name by a user with role is admitted through, or None."""
+    rule = getattr(settings, 'ADMISSION_CONTROL_LIMITS', {}).get(url_name)
+    if not rule or method not in rule.get('methods', DEFAULT_METHODS):
+        return None
+    role_rule = rule.get('roles', {}).get(role)
+    key = f'{url_name}:{role}' if role_rule is not None else url_name
+
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            options = {**rule, **(role_rule or {})}
+            pool = _pools[key] = AdmissionPool(
+                key,
+                slots=options['slots'],
+                timeout=options.get('timeout', DEFAULT_TIMEOUT),
+                retry_after=options.get('retry_after', DEFAULT_RETRY_AFTER)
+            )
+        return pool
+
+
+def admission_stats():
+    """Return {pool name: metrics} for the pools used so far in this process."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.name: pool.stats() for pool in pools}
+
+
+def reset_admission_control():
+    """Forget every pool and its metrics (e.g. after changing the limits)."""
+    with _pools_lock:
+        _pools.clear()
+
+
+class AdmissionControlMiddleware:
+    """
+    Limits concurrent requests per URL name; see ADMISSION_CONTROL_LIMITS.
+    Must come after AuthenticationMiddleware, since pools may depend on the role.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            pool = getattr(request, '_admission_pool', None)
+            if pool is not None:
+                request._admission_pool = None
+                pool.release()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        if not url_name:
+            return None
+        user = getattr(request, 'user', None)
+        role = getattr(user, 'role', None) if user is not None and user.is_authenticated else 'anonymous'
+        pool = _pool(url_name, role, request.method)
+        if pool is None:
+            return None
+
+        if not pool.acquire():
+            return self._reject(request, pool)
+        request._admission_pool = pool
+        return None
+
+    def _reject(self, request, pool):
+        message = 'This page is busy right now. Please try again in a few seconds.'
+        if request.path.startswith('/api/'):
+            response = JsonResponse({'detail': message}, status=503)
+        else:
+            response = HttpResponse(message, status=503, content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = str(pool.retry_after)
+        return response
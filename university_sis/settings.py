@@ -47,11 +47,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Compresses responses; first after security so it sees the final body
+    'django.middleware.gzip.GZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'university_sis.middleware.AdmissionControlMiddleware',
+    'courses.middleware.CacheVersionMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -146,8 +150,93 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Keyset cursor pagination and id filters on every list (see university_sis.api)
+    'DEFAULT_PAGINATION_CLASS': 'university_sis.api.KeysetCursorPagination',
+    'DEFAULT_FILTER_BACKENDS': [
+        'university_sis.api.IdFilterBackend',
+    ],
+    'PAGE_SIZE': 50,
 }
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Local memory by default. With several worker processes each one caches on its
+# own; writes still invalidate every process through the CacheVersion table (see
+# courses.caching). A shared backend (Redis, Memcached) saves recomputing per process.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            # Per-student page fragments need far more than the default 300 entries
+            'MAX_ENTRIES': 20000,
+        },
+    }
+}
+
+# Seconds the dashboard calendar and announcements stay cached (also invalidated on change)
+DASHBOARD_CACHE_TIMEOUT = 60 * 60
+
+# Seconds cached student page fragments are kept (they are invalidated by data versions anyway)
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+# Seconds the department head KPI panel is cached before it is recomputed
+DEPARTMENT_KPI_CACHE_TIMEOUT = 5 * 60
+
+# Seconds a process trusts its cached answer to "is results week mode on?"
+RESULTS_WEEK_STATE_TIMEOUT = 10
+
+# Seconds a process may use its copy of the cache versions outside a request
+# before reading the changes again (requests always read them on arrival)
+CACHE_VERSION_MAX_AGE = 1.0
+# Seconds of overlap between two reads of the changed versions, covering clock
+# differences between servers and bumps committed late
+CACHE_VERSION_SYNC_OVERLAP = 10
+
+# Part of every page and API ETag (see courses.conditional); change it on deploys
+# that change templates or serializers, so browsers do not keep the old pages
+PAGE_ETAG_RELEASE = '1'
+
+# Cache stampede protection (see courses.caching.single_flight)
+# Seconds one request may hold the recompute lock of a cache entry before others give up on it
+SINGLE_FLIGHT_LOCK_TIMEOUT = 30
+# Seconds a request waits for another one's recompute when there is no previous value to serve
+SINGLE_FLIGHT_WAIT = 2.0
+# Seconds previous values of shared entries are kept for serving during a recompute
+STALE_CACHE_TIMEOUT = 24 * 60 * 60
+# How eagerly hot entries are recomputed before they expire (0 disables early refresh)
+CACHE_EARLY_REFRESH_BETA = 1.0
+
+# Score writes
+# When enabled, score writes from the grid and the API are funneled through a single
+# writer thread that commits everything queued within one tick in one transaction.
+# Useful on SQLite, where only one writer can hold the database lock at a time.
+SCORE_WRITE_BATCHING = False
+SCORE_WRITE_BATCH_TICK = 0.05  # seconds to collect writes before committing
+SCORE_WRITE_BATCH_MAX = 1000  # maximum number of scores per transaction
+SCORE_WRITE_BATCH_TIMEOUT = 30  # seconds a request waits for its acknowledgement
+
+# Admission control (see university_sis.middleware)
+# Concurrent requests allowed per server process for expensive views, by URL name.
+# Requests wait up to "timeout" seconds for a slot, then get a 503 with Retry-After.
+# Only GET and HEAD requests are limited unless a rule lists its own "methods".
+ADMISSION_CONTROL_LIMITS = {
+    'student_course_detail': {'slots': 8, 'timeout': 2},
+    'teacher_student_profile': {'slots': 4, 'timeout': 2},
+    'course-roster': {'slots': 2, 'timeout': 1},
+    'assessmentscore-list': {'slots': 2, 'timeout': 1},
+    'user-list': {'slots': 2, 'timeout': 1},
+}
+
+# Pre-rendered student course reports (see courses.reports)
+STUDENT_REPORTS_DIR = BASE_DIR / 'student_reports'
+STUDENT_REPORTS_WORKERS = None  # processes used by publish_student_reports, None = all cores
+STUDENT_REPORTS_PUBLISH_ON_WRITE = True  # republish a course's reports in the background after its grades change; with False, run publish_student_reports on a schedule
+STUDENT_REPORTS_BACKGROUND_WORKERS = 1  # processes used for republishing after grade changes
+STUDENT_REPORTS_PUBLISH_DELAY = 2  # seconds grade changes are collected before each republishing round
+
+# Bulk user import
+USER_IMPORT_WORKERS = None  # processes used for password hashing, None = all cores
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:8000",
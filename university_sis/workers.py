@@ -0,0 +1,29 @@
+"""
+Process pool helpers.
+
+Spawned worker processes start without Django configured and import the
+initializer before running it, so it lives here, away from any model import.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def init_django_worker(settings_module):
+    """Set up Django in a freshly spawned pool worker."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def django_process_pool(workers):
+    """
+    ProcessPoolExecutor whose workers run Django. They are spawned rather than
+    forked, so they never share the parent's database connections.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_django_worker,
+        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'university_sis.settings'),)
+    )